@@ -0,0 +1,342 @@
+"""Per-user admission control for write-heavy routes.
+
+Every protected route has a key in ADMISSION_LIMITS and is guarded per JWT
+identity by:
+
+* a token bucket: on average `rate` requests per second, bursts of `burst`;
+* a concurrency cap: at most `concurrency` requests of the key in flight;
+* for keys with `supersede` (full saves): one request per target
+  (topology) at a time. By default a request for a busy target is rejected
+  at once with 429, so no worker sits waiting. With ADMISSION_SUPERSEDE_WAIT
+  > 0 it waits up to that many seconds instead (polling with backoff), and a
+  waiting request is dropped with 409 as soon as a newer one for that target
+  arrives. Saves run as background jobs are superseded in the job queue: a
+  new one drops the queued, not yet started saves of the same topology.
+
+Requests over the limits get 429 with Retry-After. The state lives in
+process memory by default; with ADMISSION_BACKEND = 'database' it is kept
+in the admission_counters/admission_leases tables, so all worker processes
+share the limits. Leases in the database expire after ADMISSION_LEASE_SECONDS
+in case a worker dies while holding one. Idle state is pruned every
+PRUNE_INTERVAL seconds: full buckets and old marks in memory, counters idle
+for ADMISSION_IDLE_EXPIRY seconds in the database.
+
+Enabled unless ADMISSION_ENABLED is false (default: off under app.testing).
+Per-key limits in ADMISSION_LIMITS are merged over DEFAULT_LIMITS.
+"""
+import itertools
+import math
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, jsonify
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+
+from .models import db
+
+DEFAULT_LIMITS = {
+    'topology.save': {"rate": 1.0, "burst": 5, "concurrency": 2, "supersede": True},
+    'topology.delta': {"rate": 10.0, "burst": 30, "concurrency": 2},
+    'topology.live': {"rate": 30.0, "burst": 60, "concurrency": 4},
+    'topology.restore': {"rate": 0.5, "burst": 5, "concurrency": 1},
+    'topology.layout': {"rate": 0.2, "burst": 3, "concurrency": 1},
+    'topology.copy': {"rate": 0.2, "burst": 5, "concurrency": 1},
+    'topology.import': {"rate": 0.2, "burst": 3, "concurrency": 1},
+    'device_configs.import': {"rate": 0.1, "burst": 3, "concurrency": 1},
+}
+DEFAULT_SUPERSEDE_WAIT = 0.0  # Seconds a save may wait for the one in flight before giving up with 429
+DEFAULT_LEASE_SECONDS = 300.0
+DEFAULT_IDLE_EXPIRY = 3600.0
+SLOT_POLL_INTERVAL = 0.1
+SLOT_POLL_MAX_INTERVAL = 1.0
+PRUNE_INTERVAL = 60.0
+LATEST_EXPIRY = 600.0  # Longer than any supersede wait, so no waiting request loses its mark
+
+
+class AdmissionCounter(db.Model):
+    """Token bucket level or latest request sequence of one admission key (database backend)."""
+    __tablename__ = 'admission_counters'
+
+    key = db.Column(db.String(255), primary_key=True)
+    tokens = db.Column(db.Float, nullable=False, default=0)
+    sequence = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.Float, nullable=False, default=0)  # Unix time
+
+
+class AdmissionLease(db.Model):
+    """One request in flight for an admission key (database backend)."""
+    __tablename__ = 'admission_leases'
+
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(255), nullable=False, index=True)
+    expires_at = db.Column(db.Float, nullable=False)  # Unix time
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is not admitted; becomes a 429 (or 409 when superseded) response."""
+
+    def __init__(self, msg, retry_after=None, superseded=False):
+        super().__init__(msg)
+        self.retry_after = retry_after
+        self.superseded = superseded
+
+
+def _take(tokens, updated, now, rate, burst):
+    """Refills a bucket and takes one token: returns (tokens left, seconds to wait, 0 when admitted)."""
+    tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / rate
+
+
+class MemoryAdmissionState:
+    """Admission state of this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}  # key -> (tokens, monotonic time of the last update, monotonic time it is full again)
+        self._leases = {}  # key -> set of lease ids
+        self._latest = {}  # key -> (sequence of the newest request, monotonic time it arrived)
+        self._ids = itertools.count(1)
+        self._next_prune = 0.0
+
+    def take_token(self, key, rate, burst):
+        """Takes a token from the bucket `key`; returns 0 when admitted, else the seconds until one is free."""
+        now = time.monotonic()
+        with self._lock:
+            if now >= self._next_prune:
+                self._prune(now)
+            tokens, updated, _ = self._buckets.get(key, (burst, now, now))
+            tokens, wait = _take(tokens, updated, now, rate, burst)
+            self._buckets[key] = (tokens, now, now + (burst - tokens) / rate)
+        return wait
+
+    def _prune(self, now):
+        """Drops buckets that have refilled (a missing bucket is a full one) and stale marks; lock held."""
+        self._next_prune = now + PRUNE_INTERVAL
+        for key in [key for key, (_, _, full_at) in self._buckets.items() if full_at <= now]:
+            del self._buckets[key]
+        for key in [key for key, (_, claimed_at) in self._latest.items() if now - claimed_at >= LATEST_EXPIRY]:
+            del self._latest[key]
+
+    def acquire(self, key, limit):
+        """A lease id when fewer than `limit` leases of `key` are held, else None."""
+        with self._lock:
+            held = self._leases.setdefault(key, set())
+            if len(held) >= limit:
+                return None
+            lease = next(self._ids)
+            held.add(lease)
+            return lease
+
+    def release(self, key, lease):
+        with self._lock:
+            held = self._leases.get(key)
+            if held is not None:
+                held.discard(lease)
+                if not held:
+                    del self._leases[key]
+
+    def claim_latest(self, key):
+        """Marks a new request as the newest for `key` and returns its sequence."""
+        with self._lock:
+            sequence = next(self._ids)
+            self._latest[key] = (sequence, time.monotonic())
+            return sequence
+
+    def is_latest(self, key, sequence):
+        with self._lock:
+            return self._latest.get(key, (None, None))[0] == sequence
+
+
+class DatabaseAdmissionState:
+    """Admission state shared by all processes through the database.
+
+    Every operation runs in its own short transaction on `engine`, separate
+    from the request's session, and locks the key's counter row so that
+    concurrent workers see each other's updates.
+    """
+
+    def __init__(self, engine, lease_seconds=DEFAULT_LEASE_SECONDS, idle_expiry=DEFAULT_IDLE_EXPIRY):
+        self.engine = engine
+        self.lease_seconds = lease_seconds
+        self.idle_expiry = idle_expiry
+        self._next_prune = 0.0
+
+    @staticmethod
+    def _locked_counter(connection, key, tokens):
+        """The counter row of `key` (created with `tokens` if missing), locked until the transaction ends."""
+        counters = AdmissionCounter.__table__
+        query = (select(counters.c.tokens, counters.c.sequence, counters.c.updated_at)
+                 .where(counters.c.key == key).with_for_update())
+        row = connection.execute(query).first()
+        if row is None:
+            try:
+                with connection.begin_nested():
+                    connection.execute(counters.insert().values(key=key, tokens=tokens, sequence=0,
+                                                                updated_at=time.time()))
+            except IntegrityError:
+                pass  # Created by a concurrent request
+            row = connection.execute(query).first()
+        return row
+
+    def _prune(self):
+        """Deletes counters idle for `idle_expiry` seconds and expired leases."""
+        self._next_prune = time.monotonic() + PRUNE_INTERVAL
+        counters, leases = AdmissionCounter.__table__, AdmissionLease.__table__
+        now = time.time()
+        with self.engine.begin() as connection:
+            connection.execute(counters.delete().where(counters.c.updated_at < now - self.idle_expiry))
+            connection.execute(leases.delete().where(leases.c.expires_at <= now))
+
+    def take_token(self, key, rate, burst):
+        counters = AdmissionCounter.__table__
+        if time.monotonic() >= self._next_prune:
+            self._prune()
+        with self.engine.begin() as connection:
+            row = self._locked_counter(connection, key, burst)
+            now = time.time()
+            tokens, wait = _take(row.tokens, row.updated_at, now, rate, burst)
+            connection.execute(counters.update().where(counters.c.key == key).values(tokens=tokens, updated_at=now))
+        return wait
+
+    def acquire(self, key, limit):
+        leases = AdmissionLease.__table__
+        with self.engine.begin() as connection:
+            self._locked_counter(connection, key, 0)  # Serializes counting the leases of this key
+            now = time.time()
+            connection.execute(leases.delete().where(leases.c.key == key, leases.c.expires_at <= now))
+            held = connection.execute(select(func.count()).select_from(leases).where(leases.c.key == key)).scalar()
+            if held >= limit:
+                return None
+            result = connection.execute(leases.insert().values(key=key, expires_at=now + self.lease_seconds))
+            return result.inserted_primary_key[0]
+
+    def release(self, key, lease):
+        leases = AdmissionLease.__table__
+        with self.engine.begin() as connection:
+            connection.execute(leases.delete().where(leases.c.id == lease))
+
+    def claim_latest(self, key):
+        counters = AdmissionCounter.__table__
+        with self.engine.begin() as connection:
+            sequence = self._locked_counter(connection, key, 0).sequence + 1
+            connection.execute(counters.update().where(counters.c.key == key)
+                               .values(sequence=sequence, updated_at=time.time()))
+        return sequence
+
+    def is_latest(self, key, sequence):
+        counters = AdmissionCounter.__table__
+        with self.engine.connect() as connection:
+            return connection.execute(select(counters.c.sequence).where(counters.c.key == key)).scalar() == sequence
+
+
+def admission_state(app=None):
+    """Lazily creates (once per app) the state for ADMISSION_BACKEND ('memory' or 'database')."""
+    app = app or current_app._get_current_object()
+    state = app.extensions.get('admission')
+    if state is None:
+        backend = app.config.get('ADMISSION_BACKEND', 'memory')
+        if backend == 'database':
+            state = DatabaseAdmissionState(db.engine, app.config.get('ADMISSION_LEASE_SECONDS', DEFAULT_LEASE_SECONDS),
+                                           app.config.get('ADMISSION_IDLE_EXPIRY', DEFAULT_IDLE_EXPIRY))
+        elif backend == 'memory':
+            state = MemoryAdmissionState()
+        else:
+            raise ValueError(f"Unknown ADMISSION_BACKEND: {backend}")
+        state = app.extensions.setdefault('admission', state)
+    return state
+
+
+def route_limits(key, app=None):
+    app = app or current_app
+    return dict(DEFAULT_LIMITS.get(key, {}), **(app.config.get('ADMISSION_LIMITS') or {}).get(key, {}))
+
+
+def wait_for_slot(state, key, timeout, poll=SLOT_POLL_INTERVAL):
+    """Returns the lease of `key` once no other request holds it.
+
+    With `timeout` 0 a held slot is rejected at once. Otherwise this waits up
+    to `timeout` seconds, doubling the poll interval up to
+    SLOT_POLL_MAX_INTERVAL, and raises AdmissionRejected (superseded) once a
+    newer request has started waiting for the same key.
+    """
+    busy = AdmissionRejected("A previous request for the same topology is still running", retry_after=1)
+    if timeout <= 0:
+        lease = state.acquire(key, 1)
+        if lease is None:
+            raise busy
+        return lease
+
+    sequence = state.claim_latest(key)
+    deadline = time.monotonic() + timeout
+    while True:
+        if not state.is_latest(key, sequence):
+            raise AdmissionRejected("Superseded by a newer request for the same topology", superseded=True)
+        lease = state.acquire(key, 1)
+        if lease is not None:
+            return lease
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise busy
+        time.sleep(min(poll, remaining))
+        poll = min(poll * 2, SLOT_POLL_MAX_INTERVAL)
+
+
+@contextmanager
+def admitted(key, user_id, target=None):
+    """Holds the admission of one request of `key` by `user_id`; raises AdmissionRejected."""
+    limits = route_limits(key)
+    state = admission_state()
+    scope = f"{user_id}:{key}"
+    wait = state.take_token(f"bucket:{scope}", limits["rate"], limits["burst"])
+    if wait:
+        raise AdmissionRejected("Too many requests; slow down", retry_after=wait)
+
+    held = []
+    try:
+        if limits.get("supersede") and target is not None:
+            slot = f"slot:{scope}:{target}"
+            timeout = current_app.config.get('ADMISSION_SUPERSEDE_WAIT', DEFAULT_SUPERSEDE_WAIT)
+            held.append((slot, wait_for_slot(state, slot, timeout)))
+        running = f"running:{scope}"
+        lease = state.acquire(running, limits["concurrency"])
+        if lease is None:
+            raise AdmissionRejected(f"At most {limits['concurrency']} such requests may run at once", retry_after=1)
+        held.append((running, lease))
+        yield
+    finally:
+        for slot, lease in reversed(held):
+            state.release(slot, lease)
+
+
+def rejected_response(error):
+    if error.superseded:
+        return jsonify({"msg": str(error), "superseded": True}), 409
+    retry_after = max(1, math.ceil(error.retry_after or 1))
+    response = jsonify({"msg": str(error), "retry_after": retry_after})
+    response.headers['Retry-After'] = str(retry_after)
+    return response, 429
+
+
+def admission_controlled(key, target_arg=None):
+    """Route decorator (below @jwt_required()) applying the limits of `key` per user.
+
+    `target_arg` names the URL argument whose requests supersede each other.
+    """
+    def decorate(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not current_app.config.get('ADMISSION_ENABLED', not current_app.testing):
+                return view(*args, **kwargs)
+            try:
+                with admitted(key, get_jwt_identity(), kwargs.get(target_arg) if target_arg else None):
+                    return view(*args, **kwargs)
+            except AdmissionRejected as e:
+                return rejected_response(e)
+        return wrapper
+    return decorate
@@ -0,0 +1,126 @@
+import threading
+import time
+
+from flask import current_app, jsonify, request
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from .models import db, DeviceType, DeviceConfig
+
+
+class CatalogVersion(db.Model):
+    """Single-row table holding the version number of the device catalog.
+
+    Every write to DeviceType/DeviceConfig bumps it in the same transaction,
+    so all worker processes agree on when their cached catalog payloads went
+    stale.
+    """
+    __tablename__ = 'catalog_version'
+
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+_CATALOG_ROW_ID = 1
+
+_lock = threading.Lock()
+_local_version = {"value": None, "checked_at": 0.0}
+_payloads = {}  # catalog name -> (version, response body bytes)
+
+
+def catalog_version():
+    """Returns the current catalog version.
+
+    The value read from the database is trusted for CATALOG_VERSION_TTL seconds
+    (default 2), so revalidation requests within that window are answered
+    without any query. Writes made by this process are visible immediately.
+    """
+    ttl = current_app.config.get('CATALOG_VERSION_TTL', 2.0)
+    now = time.monotonic()
+    with _lock:
+        if _local_version["value"] is not None and now - _local_version["checked_at"] < ttl:
+            return _local_version["value"]
+
+    version = db.session.query(CatalogVersion.version).filter_by(id=_CATALOG_ROW_ID).scalar() or 0
+    with _lock:
+        _local_version["value"] = version
+        _local_version["checked_at"] = now
+    return version
+
+
+def bump_catalog_version(session=None):
+    """Marks every cached catalog payload as stale.
+
+    ORM writes to DeviceType/DeviceConfig bump the version automatically on
+    flush; call this directly only for bulk/Core statements that bypass the ORM.
+    """
+    table = CatalogVersion.__table__
+    connection = (session or db.session).connection()
+    result = connection.execute(
+        table.update().where(table.c.id == _CATALOG_ROW_ID).values(version=table.c.version + 1))
+    if result.rowcount == 0:
+        try:
+            with connection.begin_nested():
+                connection.execute(table.insert().values(id=_CATALOG_ROW_ID, version=1))
+        except IntegrityError:  # A concurrent first catalog write created the row
+            connection.execute(
+                table.update().where(table.c.id == _CATALOG_ROW_ID).values(version=table.c.version + 1))
+    (session or db.session).info['catalog_changed'] = True
+    _forget_local_version()
+
+
+def _forget_local_version():
+    with _lock:
+        _local_version["value"] = None
+
+
+@event.listens_for(Session, 'before_flush')
+def _bump_on_catalog_change(session, flush_context, instances):
+    for obj in list(session.new) + list(session.deleted):
+        if isinstance(obj, (DeviceType, DeviceConfig)):
+            bump_catalog_version(session)
+            return
+    for obj in session.dirty:
+        if isinstance(obj, (DeviceType, DeviceConfig)) and session.is_modified(obj):
+            bump_catalog_version(session)
+            return
+
+
+@event.listens_for(Session, 'after_commit')
+def _forget_version_after_commit(session):
+    # A concurrent request may have cached the pre-commit version in the meantime.
+    if session.info.pop('catalog_changed', False):
+        _forget_local_version()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _clear_catalog_flag(session):
+    session.info.pop('catalog_changed', None)
+
+
+def cached_catalog_response(name, build_payload):
+    """Serves a catalog listing from the in-process cache with a strong ETag.
+
+    `build_payload` is only called when the cached body is missing or belongs to
+    an older catalog version. Clients sending a matching If-None-Match get a
+    304 without the catalog tables being queried.
+    """
+    version = catalog_version()
+    etag = f"{name}-v{version}"
+
+    if request.if_none_match.contains_weak(etag):  # Compressed responses carry W/ validators
+        response = current_app.response_class(status=304)
+    else:
+        with _lock:
+            cached = _payloads.get(name)
+        if cached and cached[0] == version:
+            body = cached[1]
+        else:
+            body = jsonify(build_payload()).get_data()
+            with _lock:
+                _payloads[name] = (version, body)
+        response = current_app.response_class(body, status=200, mimetype='application/json')
+
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'  # Always revalidate; the ETag makes that cheap
+    return response
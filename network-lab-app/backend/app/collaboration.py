@@ -0,0 +1,232 @@
+"""Live collaboration channel per topology (Server-Sent Events).
+
+Structural edits (add/remove/rename) are persisted right away through
+apply_topology_delta and broadcast with their real ids. Node drags are far more
+frequent, so they are coalesced: only the latest position per node is kept,
+subscribers receive at most one `moves` event per BROADCAST_INTERVAL, and the
+positions are written to the database in one batch per PERSIST_INTERVAL.
+Those batches are move-only revisions, so they do not turn the base revision
+of a concurrent /delta client into a conflict. A batch that fails to persist
+is kept for the next flush. A subscriber that falls SUBSCRIBER_QUEUE_SIZE
+events behind is dropped; its stream ends with a `reload` event.
+
+Like every other topology route, the events and live routes are owner-only:
+a channel is shared by the owner's own tabs and devices.
+
+Channels live in process memory, so every subscriber of a topology must be
+served by the same worker (single worker or sticky routing per topology).
+"""
+import queue
+import threading
+import time
+
+from flask import current_app
+
+from .json_provider import dumps
+from .models import db
+from .topology_snapshots import GraphEdit, record_snapshot
+from .topology_writer import apply_node_moves
+
+BROADCAST_INTERVAL = 0.1
+PERSIST_INTERVAL = 1.0
+KEEPALIVE_INTERVAL = 15.0
+SUBSCRIBER_QUEUE_SIZE = 1000
+DROPPED = object()  # Last item queued for a subscriber that fell behind; its stream tells it to reload
+
+
+class TopologyChannel:
+    def __init__(self, topology_id):
+        self.topology_id = topology_id
+        self.subscribers = set()
+        self.unbroadcast_moves = {}  # instance id -> position, since the last `moves` event
+        self.unpersisted_moves = {}  # instance id -> position, since the last DB write
+        self.last_persisted = time.monotonic()
+
+
+class CollaborationHub:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._channels = {}
+        self._app = None
+        self._thread = None
+
+    def _channel(self, topology_id):
+        channel = self._channels.get(topology_id)
+        if channel is None:
+            channel = self._channels[topology_id] = TopologyChannel(topology_id)
+        return channel
+
+    def subscribe(self, topology_id):
+        subscriber = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._channel(topology_id).subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, topology_id, subscriber):
+        with self._lock:
+            channel = self._channels.get(topology_id)
+            if channel is None:
+                return
+            channel.subscribers.discard(subscriber)
+            if not channel.subscribers and not channel.unpersisted_moves:
+                del self._channels[topology_id]
+
+    def publish(self, topology_id, event_type, data):
+        with self._lock:
+            channel = self._channels.get(topology_id)
+            subscribers = list(channel.subscribers) if channel else []
+        message = format_sse(event_type, data)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                # A client that cannot keep up is dropped; it reconnects and reloads.
+                self.unsubscribe(topology_id, subscriber)
+                _replace_backlog(subscriber, DROPPED)
+
+    def queue_moves(self, app, topology_id, moves):
+        """Buffers node positions; later positions of the same node replace earlier ones."""
+        with self._lock:
+            channel = self._channel(topology_id)
+            for instance_id, position in moves.items():
+                channel.unbroadcast_moves[instance_id] = position
+                channel.unpersisted_moves[instance_id] = position
+        self._ensure_worker(app)
+
+    def requeue_moves(self, topology_id, moves):
+        """Puts back positions whose write failed; positions queued since then win."""
+        if not moves:
+            return
+        with self._lock:
+            channel = self._channel(topology_id)
+            channel.unpersisted_moves = dict(moves, **channel.unpersisted_moves)
+
+    def take_unpersisted_moves(self, topology_id):
+        """Hands pending positions to a request that writes the topology itself."""
+        with self._lock:
+            channel = self._channels.get(topology_id)
+            if channel is None:
+                return {}
+            moves, channel.unpersisted_moves = channel.unpersisted_moves, {}
+            channel.last_persisted = time.monotonic()
+            return moves
+
+    def discard_moves(self, topology_id, instance_ids):
+        with self._lock:
+            channel = self._channels.get(topology_id)
+            if channel is None:
+                return
+            for instance_id in instance_ids:
+                channel.unbroadcast_moves.pop(instance_id, None)
+                channel.unpersisted_moves.pop(instance_id, None)
+
+    def tick(self, force_persist=False):
+        """Broadcasts buffered moves and persists the batches that are due."""
+        now = time.monotonic()
+        to_broadcast, to_persist = [], []
+        with self._lock:
+            for channel in self._channels.values():
+                if channel.unbroadcast_moves:
+                    to_broadcast.append((channel.topology_id, channel.unbroadcast_moves))
+                    channel.unbroadcast_moves = {}
+                if channel.unpersisted_moves and (force_persist or now - channel.last_persisted >= PERSIST_INTERVAL):
+                    to_persist.append((channel.topology_id, channel.unpersisted_moves))
+                    channel.unpersisted_moves = {}
+                    channel.last_persisted = now
+            # Channels created by moves nobody listens to are dropped once flushed
+            idle = [topology_id for topology_id, channel in self._channels.items()
+                    if not channel.subscribers and not channel.unpersisted_moves and not channel.unbroadcast_moves]
+            for topology_id in idle:
+                del self._channels[topology_id]
+
+        for topology_id, moves in to_broadcast:
+            self.publish(topology_id, 'moves', {
+                "nodes": [{"id": str(i), "position": position} for i, position in moves.items()]
+            })
+        for topology_id, moves in to_persist:
+            try:
+                revision = persist_moves(topology_id, moves)
+            except Exception:
+                # Keep the batch for the next flush; the other topologies still get theirs
+                current_app.logger.exception("Persisting moves of topology %s failed", topology_id)
+                self.requeue_moves(topology_id, moves)
+                continue
+            if revision is not None:
+                self.publish(topology_id, 'revision', {"revision": revision})
+
+    def _ensure_worker(self, app):
+        if self._thread is not None:
+            return
+        if not app.config.get('COLLABORATION_BACKGROUND_FLUSH', not app.testing):
+            return  # Tests drive tick() themselves
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._app = app
+            self._thread = threading.Thread(target=self._run, name='collaboration-flusher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(BROADCAST_INTERVAL)
+            with self._app.app_context():
+                try:
+                    self.tick()
+                except Exception:
+                    self._app.logger.exception("Collaboration flush failed")
+                finally:
+                    db.session.remove()
+
+
+def persist_moves(topology_id, moves):
+    """Writes one batch of coalesced positions as a single revision."""
+    try:
+        edit = GraphEdit()
+        revision = apply_node_moves(topology_id, moves, edit)
+        if revision is not None:
+            record_snapshot(topology_id, revision, edit)
+        db.session.commit()
+        return revision
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def _replace_backlog(subscriber, item):
+    """Empties a subscriber queue and leaves only `item` in it."""
+    while True:
+        try:
+            while True:
+                subscriber.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            subscriber.put_nowait(item)
+            return
+        except queue.Full:  # Another publisher got in between
+            continue
+
+
+def format_sse(event_type, data):
+    return f"event: {event_type}\ndata: {dumps(data)}\n\n"
+
+
+def event_stream(topology_id, subscriber):
+    """Yields SSE messages for one subscriber until the client disconnects or is dropped."""
+    try:
+        yield format_sse('hello', {"topologyId": topology_id})
+        while True:
+            try:
+                message = subscriber.get(timeout=KEEPALIVE_INTERVAL)
+            except queue.Empty:
+                yield ": keepalive\n\n"
+                continue
+            if message is DROPPED:
+                yield format_sse('reload', {"reason": "Too many events were missed"})
+                return
+            yield message
+    finally:
+        hub.unsubscribe(topology_id, subscriber)
+
+
+hub = CollaborationHub()
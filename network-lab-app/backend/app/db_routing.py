@@ -0,0 +1,152 @@
+"""Read-replica routing for GET requests.
+
+Configure replicas with SQLALCHEMY_REPLICA_URIS (a list of database URLs).
+ORM reads issued while handling a GET/HEAD request of one of the
+REPLICA_BLUEPRINTS are sent to a replica engine; everything else (writes,
+flushes, non-GET requests, background threads) uses the primary bind.
+
+After a request that wrote to the database, the user's GETs stay on the
+primary for REPLICA_STICKY_SECONDS (default 5) so they read their own writes
+while replicas catch up. The window is remembered per user id in-process and
+in a cookie, so it also holds when the next request lands on another worker.
+"""
+import itertools
+import threading
+import time
+
+from flask import current_app, g, has_request_context, request
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+
+DEFAULT_STICKY_SECONDS = 5.0
+DEFAULT_REPLICA_BLUEPRINTS = ('lab_bp', 'admin_bp')
+STICKY_COOKIE = 'db_primary_until'
+READ_METHODS = ('GET', 'HEAD')
+
+_lock = threading.Lock()
+_sticky_until = {}  # user id -> monotonic deadline
+_round_robin = itertools.count()
+
+
+def replica_engines(app=None):
+    """Lazily creates (once per app) the engines for SQLALCHEMY_REPLICA_URIS."""
+    app = app or current_app._get_current_object()
+    engines = app.extensions.get('db_replicas')
+    if engines is None:
+        with _lock:
+            engines = app.extensions.get('db_replicas')
+            if engines is None:
+                options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+                engines = app.extensions['db_replicas'] = [
+                    create_engine(uri, **options) for uri in app.config.get('SQLALCHEMY_REPLICA_URIS') or ()]
+    return engines
+
+
+def reset_replicas(app):
+    """Disposes the replica engines so changed SQLALCHEMY_REPLICA_URIS take effect."""
+    for engine in app.extensions.pop('db_replicas', None) or ():
+        engine.dispose()
+
+
+def _current_user_id():
+    try:
+        return get_jwt_identity()
+    except RuntimeError:  # No JWT was verified for this request
+        return None
+
+
+def mark_sticky(user_id, seconds):
+    with _lock:
+        _sticky_until[str(user_id)] = time.monotonic() + seconds
+
+
+def is_sticky(user_id):
+    with _lock:
+        deadline = _sticky_until.get(str(user_id))
+        if deadline is not None and deadline <= time.monotonic():
+            del _sticky_until[str(user_id)]
+            deadline = None
+    return deadline is not None
+
+
+def clear_stickiness():
+    with _lock:
+        _sticky_until.clear()
+
+
+def _cookie_sticky():
+    try:
+        return float(request.cookies.get(STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def _choose_replica():
+    """The replica engine for this request, or None to use the primary. Decided once per request."""
+    if 'db_replica' in g:
+        return g.db_replica
+    replica = None
+    config = current_app.config
+    if (request.method in READ_METHODS
+            and request.blueprint in config.get('REPLICA_BLUEPRINTS', DEFAULT_REPLICA_BLUEPRINTS)
+            and not g.get('db_wrote')):
+        engines = replica_engines()
+        user_id = _current_user_id()
+        if engines and not _cookie_sticky() and not (user_id is not None and is_sticky(user_id)):
+            replica = engines[next(_round_robin) % len(engines)]
+    g.db_replica = replica
+    return replica
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _route_reads(orm_execute_state):
+    if not has_request_context():
+        return None
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        g.db_wrote = True  # ORM-enabled bulk statements bypass the flush hooks
+        return None
+    if not orm_execute_state.is_select:
+        return None
+    session = orm_execute_state.session
+    if session.new or session.dirty or session.deleted:
+        return None  # Pending writes must be read back from the primary
+    replica = _choose_replica()
+    if replica is None:
+        return None
+    return orm_execute_state.invoke_statement(bind_arguments={"bind": replica})
+
+
+@event.listens_for(Session, 'after_flush')
+def _remember_flush(session, flush_context):
+    if has_request_context():
+        g.db_wrote = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _remember_commit(session):
+    # Also catches Core/bulk writes (bulk_insert_mappings, session.connection().execute)
+    if has_request_context():
+        g.db_wrote = True
+
+
+def _stick_writers_to_primary(response):
+    if not g.get('db_wrote') or response.status_code >= 400:
+        return response
+    if not current_app.config.get('SQLALCHEMY_REPLICA_URIS'):
+        return response
+    seconds = current_app.config.get('REPLICA_STICKY_SECONDS', DEFAULT_STICKY_SECONDS)
+    user_id = _current_user_id()
+    if user_id is not None:
+        mark_sticky(user_id, seconds)
+    response.set_cookie(STICKY_COOKIE, str(time.time() + seconds), max_age=int(seconds) + 1,
+                        httponly=True, samesite='Lax')
+    return response
+
+
+def init_app(app):
+    """Registers the stickiness hook once per app; it does nothing until replicas are configured."""
+    if 'db_routing' in app.extensions:
+        return
+    app.extensions['db_routing'] = True
+    app.after_request(_stick_writers_to_primary)
@@ -0,0 +1,200 @@
+"""Bulk import of DeviceConfigs from a CSV or JSON Lines stream.
+
+Rows are read lazily from the request body and processed in chunks: one query
+checks the names of a whole chunk for duplicates, device types are resolved
+from a map loaded once, and valid rows are inserted with one bulk INSERT per
+chunk. Names repeated across chunks are caught by the next chunk's query,
+so memory stays bounded by the chunk size.
+"""
+import codecs
+import csv
+import json
+
+from sqlalchemy.exc import IntegrityError
+
+from .catalog_cache import bump_catalog_version
+from .models import db, DeviceType, DeviceConfig
+
+IMPORT_CHUNK_SIZE = 500
+MAX_REPORTED_ERRORS = 1000
+
+
+class ImportFormatError(Exception):
+    """Raised when the body is not in a supported format or cannot be decoded."""
+
+
+def iter_csv_rows(stream):
+    """Yields (line_number, row_dict) from a UTF-8 CSV byte stream with a header row."""
+    reader = csv.DictReader(codecs.getreader('utf-8')(stream))
+    try:
+        if reader.fieldnames is None:
+            return
+        for row in reader:
+            yield reader.line_num, row
+    except UnicodeDecodeError:
+        raise ImportFormatError(f"Invalid UTF-8 after line {reader.line_num}")
+    except csv.Error as e:
+        raise ImportFormatError(f"Malformed CSV at line {reader.line_num}: {e}")
+
+
+def iter_json_lines_rows(stream):
+    """Yields (line_number, row_dict) from a JSON Lines byte stream; blank lines are skipped."""
+    for line_number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield line_number, None
+            continue
+        yield line_number, row if isinstance(row, dict) else None
+
+
+def rows_for_content_type(content_type, stream):
+    mimetype = (content_type or '').split(';')[0].strip().lower()
+    if mimetype in ('text/csv', 'application/csv'):
+        return iter_csv_rows(stream)
+    if mimetype in ('application/x-ndjson', 'application/jsonl', 'application/json-lines'):
+        return iter_json_lines_rows(stream)
+    raise ImportFormatError("Content-Type must be text/csv or application/x-ndjson")
+
+
+class ImportReport:
+    def __init__(self):
+        self.total_rows = 0
+        self.created = 0
+        self.error_count = 0
+        self.errors = []
+
+    def error(self, line_number, msg):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line_number, "msg": msg})
+
+    def as_dict(self):
+        return {
+            "total_rows": self.total_rows,
+            "created": self.created,
+            "error_count": self.error_count,
+            "errors": self.errors,
+        }
+
+
+def _device_type_lookup():
+    types = db.session.query(DeviceType.id, DeviceType.name).all()
+    return {type_id for type_id, _ in types}, {name: type_id for type_id, name in types}
+
+
+def _clean(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _validate_row(row, type_ids, type_ids_by_name):
+    """Returns (mapping, error message) for one input row."""
+    if row is None:
+        return None, "Row is not a JSON object"
+    name = _clean(row.get('name'))
+    hostname_ip = _clean(row.get('hostname_ip'))
+    if not name or not hostname_ip:
+        return None, "Missing required fields (name, hostname_ip)"
+
+    raw_type_id = _clean(row.get('device_type_id'))
+    if raw_type_id is not None:
+        try:
+            device_type_id = int(raw_type_id)
+        except ValueError:
+            return None, f"Invalid device_type_id: {raw_type_id}"
+        if device_type_id not in type_ids:
+            return None, f"Invalid device_type_id: {device_type_id}"
+    else:
+        type_name = _clean(row.get('device_type'))
+        if type_name is None:
+            return None, "Missing device_type_id or device_type"
+        device_type_id = type_ids_by_name.get(type_name)
+        if device_type_id is None:
+            return None, f"Unknown device type: {type_name}"
+
+    return {
+        "name": name,
+        "device_type_id": device_type_id,
+        "hostname_ip": hostname_ip,
+        "notes": _clean(row.get('notes')),
+        "default_icon_path": _clean(row.get('default_icon_path')),
+    }, None
+
+
+def _unique_rows(chunk, report):
+    """The rows of a chunk whose names are neither taken nor repeated within the chunk."""
+    names = [mapping["name"] for _, mapping in chunk]
+    taken = {row[0] for row in db.session.query(DeviceConfig.name).filter(DeviceConfig.name.in_(names))}
+
+    rows, seen = [], set()
+    for line_number, mapping in chunk:
+        name = mapping["name"]
+        if name in taken:
+            report.error(line_number, f"Device config with name '{name}' already exists")
+        elif name in seen:
+            report.error(line_number, f"Duplicate name '{name}' earlier in this import")
+        else:
+            seen.add(name)
+            rows.append((line_number, mapping))
+    return rows
+
+
+def _flush_chunk(chunk, created_by_id, report):
+    rows = _unique_rows(chunk, report)
+    if not rows:
+        return
+    to_insert = [dict(mapping, created_by_id=created_by_id) for _, mapping in rows]
+    try:
+        db.session.bulk_insert_mappings(DeviceConfig, to_insert)
+        bump_catalog_version()  # Bulk inserts bypass the ORM flush hook
+        db.session.commit()
+    except IntegrityError:
+        # A concurrent writer took some of the names: check them again and insert the rest
+        db.session.rollback()
+        rows = _unique_rows(rows, report)
+        if not rows:
+            return
+        to_insert = [dict(mapping, created_by_id=created_by_id) for _, mapping in rows]
+        db.session.bulk_insert_mappings(DeviceConfig, to_insert)
+        bump_catalog_version()
+        db.session.commit()
+    report.created += len(to_insert)
+
+
+def import_device_configs(rows, created_by_id, chunk_size=None, on_chunk=None):
+    """Imports (line_number, row) pairs; each valid chunk is committed on its own.
+
+    Invalid rows are skipped and reported, so a single bad line does not throw
+    away the rest of a large inventory. `on_chunk(report)` is called after each
+    chunk has been written.
+    """
+    chunk_size = chunk_size or IMPORT_CHUNK_SIZE
+    type_ids, type_ids_by_name = _device_type_lookup()
+    report = ImportReport()
+    chunk = []
+
+    try:
+        for line_number, row in rows:
+            report.total_rows += 1
+            mapping, error = _validate_row(row, type_ids, type_ids_by_name)
+            if error:
+                report.error(line_number, error)
+                continue
+            chunk.append((line_number, mapping))
+            if len(chunk) >= chunk_size:
+                _flush_chunk(chunk, created_by_id, report)
+                chunk = []
+                if on_chunk:
+                    on_chunk(report)
+    except ImportFormatError as e:
+        raise ImportFormatError(f"{e}; {report.created} rows before it were imported")
+
+    if chunk:
+        _flush_chunk(chunk, created_by_id, report)
+    return report
@@ -0,0 +1,136 @@
+"""In-process request metrics rendered in the Prometheus text format.
+
+Per route (blueprint endpoint + method) it records request latency, the number
+of SQL statements and total DB time per request, and the response payload size,
+each as a fixed-bucket histogram. Recording a request costs a few dict lookups
+under one lock, so this is cheap enough to leave enabled under load.
+"""
+import bisect
+import threading
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 250, 1000)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'total', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Histograms and counters keyed by (endpoint, method)."""
+
+    HISTOGRAMS = (
+        ('http_request_duration_seconds', 'Request latency per route', LATENCY_BUCKETS),
+        ('http_request_db_statements', 'SQL statements issued per request', STATEMENT_BUCKETS),
+        ('http_request_db_seconds', 'Total time spent in the database per request', LATENCY_BUCKETS),
+        ('http_response_size_bytes', 'Response payload size', SIZE_BUCKETS),
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {name: {} for name, _, _ in self.HISTOGRAMS}
+        self._requests = {}
+
+    def record(self, endpoint, method, status, duration, statements, db_seconds, size):
+        key = (endpoint, method)
+        with self._lock:
+            status_key = (endpoint, method, str(status))
+            self._requests[status_key] = self._requests.get(status_key, 0) + 1
+            values = (duration, statements, db_seconds, size)
+            for (name, _, buckets), value in zip(self.HISTOGRAMS, values):
+                if value is None:
+                    continue
+                series = self._histograms[name]
+                histogram = series.get(key)
+                if histogram is None:
+                    histogram = series[key] = Histogram(buckets)
+                histogram.observe(value)
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {name: {} for name, _, _ in self.HISTOGRAMS}
+            self._requests = {}
+
+    def render(self):
+        """Returns all metrics in the Prometheus text exposition format (0.0.4)."""
+        lines = ['# HELP http_requests_total Requests handled per route and status',
+                 '# TYPE http_requests_total counter']
+        with self._lock:
+            for (endpoint, method, status), count in sorted(self._requests.items()):
+                lines.append(f'http_requests_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} {count}')
+            for name, help_text, _ in self.HISTOGRAMS:
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for (endpoint, method), histogram in sorted(self._histograms[name].items()):
+                    labels = f'endpoint="{endpoint}",method="{method}"'
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                    lines.append(f'{name}_sum{{{labels}}} {histogram.total:.6f}')
+                    lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'metrics_started' in g:
+        g.metrics_statement_started = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'metrics_statement_started' in g:
+        g.metrics_db_seconds += time.perf_counter() - g.pop('metrics_statement_started')
+        g.metrics_statements += 1
+
+
+def init_app(app):
+    """Installs the per-request timing hooks once per app."""
+    if 'request_metrics' in app.extensions:
+        return
+    app.extensions['request_metrics'] = True
+    app.before_request(start_request_timer)
+    app.after_request(_record_current_request)
+
+
+def start_request_timer():
+    g.metrics_started = time.perf_counter()
+    g.metrics_statements = 0
+    g.metrics_db_seconds = 0.0
+
+
+def _record_current_request(response):
+    return record_request(request, response)
+
+
+def record_request(request, response):
+    started = g.get('metrics_started')
+    if started is None:
+        return response
+    endpoint = request.url_rule.endpoint if request.url_rule else 'unmatched'
+    size = None if response.is_streamed else response.calculate_content_length()
+    metrics.record(endpoint, request.method, response.status_code, time.perf_counter() - started,
+                   g.metrics_statements, g.metrics_db_seconds, size)
+    return response
@@ -0,0 +1,118 @@
+"""Background job handlers for heavy topology and catalog operations.
+
+Each handler mirrors its synchronous route; ownership and request validation
+happen in the route before the job is submitted.
+"""
+import io
+
+from .collaboration import hub
+from .device_import import ImportFormatError, import_device_configs, rows_for_content_type
+from .jobs import JobError, jobs
+from .json_provider import loads
+from .models import db, LabTopology
+from .serializers import serialize_topology_summary
+from .topology_analysis import load_graph
+from .topology_archive import ARCHIVE_MIMETYPE, ArchiveError, export_topology, import_topology
+from .topology_layout import LayoutError, compute_layout, parse_layout_options
+from .topology_revisions import bump_revision
+from .topology_snapshots import GraphEdit, record_snapshot
+from .topology_writer import TopologyWriteError, apply_node_moves, delete_topology, save_topology_full
+
+
+def _topology(context):
+    topology = db.session.get(LabTopology, context.params["topology_id"])
+    if topology is None:
+        raise JobError("Topology no longer exists")
+    return topology
+
+
+@jobs.handler('topology.save')
+def run_topology_save(context):
+    topology = _topology(context)
+    context.progress(0.05, "Writing nodes and edges")
+    try:
+        save_topology_full(topology, loads(context.payload))
+    except (TopologyWriteError, ValueError) as e:
+        raise JobError(str(e))
+    context.progress(0.7, "Recording version")
+    revision = bump_revision(topology.id)
+    record_snapshot(topology.id, revision)
+    db.session.commit()
+    hub.publish(topology.id, 'reload', {"revision": revision})
+    return {"topology_id": topology.id, "revision": revision}
+
+
+@jobs.handler('topology.layout')
+def run_topology_layout(context):
+    topology = _topology(context)
+    try:
+        options = parse_layout_options(context.params)
+        context.progress(0.05, f"Computing {options['algorithm']} layout")
+        positions = compute_layout(load_graph(topology.id), **options)
+    except LayoutError as e:
+        raise JobError(str(e))
+    if not context.params.get('apply', True):
+        return {"algorithm": options["algorithm"],
+                "positions": {str(instance_id): position for instance_id, position in positions.items()}}
+
+    context.progress(0.8, "Saving positions")
+    hub.take_unpersisted_moves(topology.id)
+    moved = GraphEdit()
+    revision = apply_node_moves(topology.id, positions, moved)
+    if revision is not None:
+        record_snapshot(topology.id, revision, moved)
+        db.session.commit()
+        hub.publish(topology.id, 'reload', {"revision": revision})
+    return {"topology_id": topology.id, "algorithm": options["algorithm"], "revision": revision}
+
+
+@jobs.handler('topology.delete')
+def run_topology_delete(context):
+    topology = _topology(context)
+    context.progress(0.1, "Deleting topology")
+    delete_topology(topology)
+    db.session.commit()
+    return {"topology_id": context.params["topology_id"]}
+
+
+@jobs.handler('topology.import')
+def run_topology_import(context):
+    context.progress(0.05, "Importing archive")
+    try:
+        topology = import_topology(context.payload, context.params["user_id"], name=context.params.get("name"))
+    except ArchiveError as e:
+        raise JobError(str(e))
+    context.progress(0.8, "Recording version")
+    record_snapshot(topology.id, bump_revision(topology.id))
+    db.session.commit()
+    return serialize_topology_summary(topology)
+
+
+@jobs.handler('topology.export')
+def run_topology_export(context):
+    topology = _topology(context)
+    context.progress(0.1, "Packing archive")
+    context.result_payload = export_topology(topology)
+    context.result_mimetype = ARCHIVE_MIMETYPE
+    return {"topology_id": topology.id, "bytes": len(context.result_payload)}
+
+
+@jobs.handler('device_configs.import')
+def run_device_configs_import(context):
+    stream = io.BytesIO(context.payload)
+    try:
+        rows = rows_for_content_type(context.params["content_type"], stream)
+    except ImportFormatError as e:
+        raise JobError(str(e))
+    total = len(context.payload) or 1
+
+    def on_chunk(report):
+        # Every chunk is committed before this runs, so progress can be persisted
+        context.progress(stream.tell() / total, f"{report.created} created, {report.error_count} errors",
+                         persist=True)
+
+    try:
+        report = import_device_configs(rows, created_by_id=context.params["created_by_id"], on_chunk=on_chunk)
+    except ImportFormatError as e:
+        raise JobError(str(e))
+    return report.as_dict()
@@ -0,0 +1,292 @@
+"""In-process background jobs backed by the `background_jobs` table.
+
+Heavy operations (large saves, imports, exports, topology deletes) are stored
+as a job row and executed by a bounded thread pool (JOB_WORKERS, default 2),
+so the request returns 202 Accepted at once and at most JOB_WORKERS heavy
+operations run concurrently per process. Handlers report progress through
+`JobContext.progress`; clients poll GET /api/jobs/<id>.
+
+Request bodies and results are kept in the job row (`payload` and
+`result_payload`), so a job needs nothing from the request that created it.
+Progress of running jobs is kept in memory (a handler usually sits inside one
+transaction, which a progress UPDATE must not commit) and written to the row
+when the handler says its work so far is committed, and when the job ends.
+When JOBS_RUN_INLINE is set (default: app.testing) jobs run synchronously in
+submit(), which keeps tests deterministic.
+
+Jobs live in the thread pool of the process that accepted them. That process
+stamps `heartbeat_at` on its queued and running jobs every
+JOB_HEARTBEAT_INTERVAL seconds. At startup, init_app fails the jobs whose
+heartbeat is older than JOB_STALE_SECONDS: their process stopped, so they
+would otherwise stay queued or running forever.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import jsonify
+from sqlalchemy import func
+from sqlalchemy.exc import SQLAlchemyError
+
+from .json_provider import dumps, loads
+from .models import db, User
+from .serializers import isoformat
+
+DEFAULT_WORKERS = 2
+JOBS_URL = '/api/jobs'
+PROGRESS_MIN_INTERVAL = 0.5  # Seconds between persisted progress updates
+JOB_HEARTBEAT_INTERVAL = 30.0
+JOB_STALE_SECONDS = 300.0
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_SUCCEEDED = 'succeeded'
+JOB_FAILED = 'failed'
+FINISHED_STATES = (JOB_SUCCEEDED, JOB_FAILED)
+
+
+class JobError(Exception):
+    """Raised by a handler to fail its job with a message meant for the client."""
+
+
+class BackgroundJob(db.Model):
+    __tablename__ = 'background_jobs'
+    __table_args__ = (db.Index('ix_background_jobs_user_created', 'user_id', 'created_at'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(64), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey(User.id, ondelete='CASCADE'), nullable=False)
+    status = db.Column(db.String(16), nullable=False, default=JOB_QUEUED)
+    progress = db.Column(db.Float, nullable=False, default=0.0)
+    message = db.Column(db.String(255))
+    params = db.Column(db.Text)  # JSON
+    payload = db.deferred(db.Column(db.LargeBinary))  # Request body the handler works on
+    result = db.Column(db.Text)  # JSON
+    result_payload = db.deferred(db.Column(db.LargeBinary))  # Binary output, e.g. an export archive
+    result_mimetype = db.Column(db.String(100))
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)  # Last sign of life from the process that owns the job
+
+
+_live_lock = threading.Lock()
+_live_progress = {}  # job id -> (fraction, message) of jobs running in this process
+
+
+def serialize_job(job):
+    progress, message = job.progress, job.message
+    if job.status == JOB_RUNNING:
+        with _live_lock:
+            progress, message = _live_progress.get(job.id, (progress, message))
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "progress": round(progress, 4),
+        "message": message,
+        "result": loads(job.result) if job.result else None,
+        "has_download": job.result_mimetype is not None,
+        "error": job.error,
+        "created_at": isoformat(job.created_at),
+        "started_at": isoformat(job.started_at),
+        "finished_at": isoformat(job.finished_at),
+    }
+
+
+class JobContext:
+    """Handed to handlers: decoded params and payload, plus progress reporting."""
+
+    def __init__(self, job_id, params, payload):
+        self.job_id = job_id
+        self.params = params
+        self.payload = payload
+        self.result_payload = None
+        self.result_mimetype = None
+        self._last_progress = 0.0
+
+    def progress(self, fraction, message=None, persist=False):
+        """Records progress (0..1).
+
+        Pass persist=True only right after the handler committed its own work:
+        the progress UPDATE is committed on the handler's session.
+        """
+        fraction = max(0.0, min(fraction, 1.0))
+        with _live_lock:
+            _, previous_message = _live_progress.get(self.job_id, (0.0, None))
+            message = message[:255] if message is not None else previous_message
+            _live_progress[self.job_id] = (fraction, message)
+        now = time.monotonic()
+        if persist and now - self._last_progress >= PROGRESS_MIN_INTERVAL:
+            self._last_progress = now
+            BackgroundJob.query.filter_by(id=self.job_id).update(
+                {"progress": fraction, "message": message}, synchronize_session=False)
+            db.session.commit()
+
+
+class JobQueue:
+    def __init__(self):
+        self._handlers = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        self._heartbeat = None
+        self._pending = set()  # Ids of the jobs queued or running in this process
+
+    def handler(self, kind):
+        """Decorator registering `fn(context)` for jobs of `kind`; its return value is the JSON result."""
+        def register(fn):
+            self._handlers[kind] = fn
+            return fn
+        return register
+
+    def submit(self, app, kind, user_id, params=None, payload=None):
+        """Stores a queued job and schedules it; returns the job (committed)."""
+        if kind not in self._handlers:
+            raise KeyError(f"No handler registered for job kind {kind!r}")
+        job = BackgroundJob(kind=kind, user_id=user_id, params=dumps(params or {}), payload=payload,
+                            heartbeat_at=datetime.utcnow())
+        db.session.add(job)
+        db.session.commit()
+
+        if app.config.get('JOBS_RUN_INLINE', app.testing):
+            self.run(app, job.id)
+            db.session.refresh(job)
+        else:
+            with self._lock:
+                self._pending.add(job.id)
+            self._pool(app).submit(self.run, app, job.id)
+        return job
+
+    def _pool(self, app):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=app.config.get('JOB_WORKERS', DEFAULT_WORKERS),
+                                                    thread_name_prefix='job-worker')
+                self._heartbeat = threading.Thread(target=self._beat, args=(app,), name='job-heartbeat', daemon=True)
+                self._heartbeat.start()
+            return self._executor
+
+    def _beat(self, app):
+        """Keeps the heartbeat of this process's jobs fresh so that no restart elsewhere fails them."""
+        interval = app.config.get('JOB_HEARTBEAT_INTERVAL', JOB_HEARTBEAT_INTERVAL)
+        while True:
+            time.sleep(interval)
+            with self._lock:
+                job_ids = list(self._pending)
+            if not job_ids:
+                continue
+            with app.app_context():
+                try:
+                    BackgroundJob.query.filter(BackgroundJob.id.in_(job_ids)).update(
+                        {"heartbeat_at": datetime.utcnow()}, synchronize_session=False)
+                    db.session.commit()
+                except SQLAlchemyError:
+                    db.session.rollback()
+                    app.logger.exception("Job heartbeat failed")
+                finally:
+                    db.session.remove()
+
+    def supersede_queued(self, kind, user_id, params):
+        """Fails the user's queued (not yet started) `kind` jobs with the same params; returns how many.
+
+        The caller commits, typically by submitting the job that replaces them.
+        """
+        return BackgroundJob.query.filter_by(kind=kind, user_id=user_id, params=dumps(params),
+                                             status=JOB_QUEUED).update(
+            {"status": JOB_FAILED, "finished_at": datetime.utcnow(), "payload": None,
+             "error": "Superseded by a newer request"}, synchronize_session=False)
+
+    def fail_stale(self, app):
+        """Fails queued/running jobs whose process stopped beating; returns how many."""
+        cutoff = datetime.utcnow() - timedelta(seconds=app.config.get('JOB_STALE_SECONDS', JOB_STALE_SECONDS))
+        failed = BackgroundJob.query.filter(
+            BackgroundJob.status.in_((JOB_QUEUED, JOB_RUNNING)),
+            func.coalesce(BackgroundJob.heartbeat_at, BackgroundJob.created_at) < cutoff,
+        ).update({"status": JOB_FAILED, "finished_at": datetime.utcnow(), "payload": None,
+                  "error": "Interrupted by a server restart; please try again"}, synchronize_session=False)
+        db.session.commit()
+        return failed
+
+    def run(self, app, job_id):
+        """Executes one job in its own app context (and therefore its own DB session)."""
+        with app.app_context():
+            try:
+                claimed = BackgroundJob.query.filter_by(id=job_id, status=JOB_QUEUED).update(
+                    {"status": JOB_RUNNING, "started_at": datetime.utcnow()}, synchronize_session=False)
+                db.session.commit()
+                if not claimed:
+                    return
+                job = db.session.get(BackgroundJob, job_id)
+                context = JobContext(job_id, loads(job.params) if job.params else {}, job.payload)
+                db.session.expunge(job)  # Keep the payload out of later flushes
+
+                try:
+                    result = self._handlers[job.kind](context)
+                except Exception as e:
+                    db.session.rollback()
+                    if not isinstance(e, JobError):
+                        app.logger.exception("Background job %s (%s) failed", job_id, job.kind)
+                    self._finish(job_id, JOB_FAILED, error=str(e) if isinstance(e, JobError) else "Internal error")
+                    return
+                self._finish(job_id, JOB_SUCCEEDED, result=result, context=context)
+            finally:
+                with _live_lock:
+                    _live_progress.pop(job_id, None)
+                with self._lock:
+                    self._pending.discard(job_id)
+                db.session.remove()
+
+    @staticmethod
+    def _finish(job_id, status, result=None, error=None, context=None):
+        values = {
+            "status": status,
+            "finished_at": datetime.utcnow(),
+            "error": error,
+            # The request body is no longer needed once the job has run
+            "payload": None,
+        }
+        if status == JOB_SUCCEEDED:
+            values.update(progress=1.0, result=dumps(result) if result is not None else None)
+            if context is not None and context.result_payload is not None:
+                values.update(result_payload=context.result_payload, result_mimetype=context.result_mimetype)
+        BackgroundJob.query.filter_by(id=job_id).update(values, synchronize_session=False)
+        db.session.commit()
+
+
+jobs = JobQueue()
+
+
+def init_app(app):
+    """Fails the jobs left behind by stopped processes (JOBS_RECOVER_ON_START, default: not app.testing)."""
+    if 'background_jobs' in app.extensions:
+        return
+    app.extensions['background_jobs'] = jobs
+    if not app.config.get('JOBS_RECOVER_ON_START', not app.testing):
+        return
+    with app.app_context():
+        try:
+            failed = jobs.fail_stale(app)
+        except SQLAlchemyError:  # e.g. the table does not exist before the first migration
+            db.session.rollback()
+            app.logger.warning("Could not check for interrupted background jobs", exc_info=True)
+            return
+        finally:
+            db.session.remove()
+        if failed:
+            app.logger.warning("Marked %d interrupted background jobs as failed", failed)
+
+
+def wants_async(request):
+    """True when the client asked for a 202 via `Prefer: respond-async` or `?async=1`."""
+    prefer = request.headers.get('Prefer', '')
+    return 'respond-async' in prefer.lower() or request.args.get('async') in ('1', 'true')
+
+
+def accepted_response(job):
+    """202 Accepted with the job's status document and where to poll it."""
+    response = jsonify(serialize_job(job))
+    response.status_code = 202
+    response.headers['Location'] = f"{JOBS_URL}/{job.id}"
+    return response
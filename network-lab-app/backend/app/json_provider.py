@@ -0,0 +1,178 @@
+"""Fast JSON encoding and response compression shared by every blueprint.
+
+`FastJSONProvider` replaces Flask's default JSON provider, so every existing
+`jsonify` call goes through it. It uses orjson when installed (several times
+faster than the stdlib encoder) and falls back to the stdlib otherwise.
+Both paths encode datetimes as ISO 8601; serializers still format them
+themselves so their payloads also survive a plain `json.dumps`.
+
+`compress_response` gzip- or brotli-encodes JSON bodies when the client
+accepts it (brotli only if the `brotli` package is installed). It is opt-in
+(JSON_COMPRESSION = True); usually a reverse proxy compresses instead.
+Compressed bodies of responses with a strong ETag are cached, so cached
+catalog responses are compressed once per catalog version rather than per
+request.
+
+Both are installed by init_app, which routes.register_blueprints calls.
+"""
+import decimal
+import gzip
+import hashlib
+import json
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import date, datetime, time
+
+from flask import current_app, request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+COMPRESSION_MIN_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+COMPRESSED_CACHE_SIZE = 64
+COMPRESSIBLE_MIMETYPES = ('application/json', 'text/plain', 'text/csv')
+
+_ORJSON_OPTIONS = (orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY) if orjson else 0
+
+_compressed_lock = threading.Lock()
+_compressed_cache = OrderedDict()  # (etag, encoding, body digest) -> compressed body
+
+
+def _default(value):
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if hasattr(value, 'tolist'):  # NumPy scalars/arrays on the stdlib path
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _stdlib_dumps(obj):
+    return json.dumps(obj, default=_default, ensure_ascii=False, separators=(',', ':'))
+
+
+def dumps_bytes(obj):
+    """Compact JSON as UTF-8 bytes, for code that writes JSON outside of a response."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS)
+    return _stdlib_dumps(obj).encode()
+
+
+def dumps(obj):
+    """Compact JSON as str."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS).decode()
+    return _stdlib_dumps(obj)
+
+
+def loads(data):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """JSON provider backed by orjson when available.
+
+    Keys keep their insertion order (`sort_keys = False`): clients never depend
+    on key order, and sorting every dict is a large part of encoding cost.
+    """
+    sort_keys = False
+    default = staticmethod(_default)
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS).decode()
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        if orjson is None:
+            body = _stdlib_dumps(obj) + '\n'
+        else:
+            body = orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def _negotiate_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+
+def _compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def compress_response(response):
+    """after_request hook: compresses eligible bodies for clients that accept it (if JSON_COMPRESSION)."""
+    if (not current_app.config.get('JSON_COMPRESSION', False)
+            or response.direct_passthrough or response.is_streamed
+            or response.status_code != 200
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = _negotiate_encoding()
+    if encoding is None:
+        return response
+    body = response.get_data()
+    if len(body) < COMPRESSION_MIN_SIZE:
+        return response
+
+    etag, weak = response.get_etag()
+    cache_key = None
+    if etag and not weak:
+        # Hashing is far cheaper than compressing; it keeps a reused ETag from serving stale bytes.
+        cache_key = (etag, encoding, hashlib.blake2b(body, digest_size=16).digest())
+    compressed = None
+    if cache_key:
+        with _compressed_lock:
+            compressed = _compressed_cache.get(cache_key)
+            if compressed is not None:
+                _compressed_cache.move_to_end(cache_key)
+    if compressed is None:
+        compressed = _compress(body, encoding)
+        if cache_key:
+            with _compressed_lock:
+                _compressed_cache[cache_key] = compressed
+                while len(_compressed_cache) > COMPRESSED_CACHE_SIZE:
+                    _compressed_cache.popitem(last=False)
+
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    if etag:
+        # The compressed bytes differ from the identity body, so the validator becomes weak.
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_app(app):
+    """Installs the provider and the compression hook once per app."""
+    if 'fast_json' in app.extensions:
+        return
+    app.extensions['fast_json'] = True
+    app.json = FastJSONProvider(app)
+    app.after_request(compress_response)
@@ -0,0 +1,129 @@
+"""Keyset pagination, filtering and sparse fieldsets for list endpoints.
+
+List routes keep returning a plain JSON array. When more rows are available the
+opaque cursor for the next page is sent in the `X-Next-Cursor` header, so
+existing clients that never pass `limit` keep getting the full list.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from flask import jsonify
+
+DEFAULT_MAX_LIMIT = 500
+LIST_QUERY_ARGS = ('limit', 'cursor', 'fields', 'name_prefix', 'updated_after', 'updated_before')
+
+
+class ListQueryError(Exception):
+    """Raised for malformed pagination/filter query parameters (HTTP 400)."""
+
+
+def has_list_query_args(args, extra=()):
+    return any(name in args for name in LIST_QUERY_ARGS + tuple(extra))
+
+
+def encode_cursor(last_id):
+    raw = json.dumps({"after": last_id}, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        last_id = json.loads(base64.urlsafe_b64decode(padded.encode()))["after"]
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise ListQueryError("Invalid cursor")
+    if not isinstance(last_id, int):
+        raise ListQueryError("Invalid cursor")
+    return last_id
+
+
+def parse_limit(args, max_limit=DEFAULT_MAX_LIMIT):
+    """Returns the requested page size, or None when the client wants everything."""
+    if 'limit' not in args:
+        return None
+    try:
+        limit = int(args['limit'])
+    except ValueError:
+        raise ListQueryError("limit must be an integer")
+    if limit < 1:
+        raise ListQueryError("limit must be positive")
+    return min(limit, max_limit)
+
+
+def parse_fields(args, allowed):
+    """Parses `fields=a,b,c` into a tuple of field names, or None for all fields."""
+    if not args.get('fields'):
+        return None
+    fields = tuple(f.strip() for f in args['fields'].split(',') if f.strip())
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise ListQueryError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def parse_datetime_arg(args, name):
+    value = args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ListQueryError(f"{name} must be an ISO 8601 datetime")
+
+
+def escape_like(value):
+    """Escapes LIKE wildcards in `value`; use with escape='\\'."""
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def apply_name_prefix(query, column, args):
+    prefix = args.get('name_prefix')
+    if not prefix:
+        return query
+    return query.filter(column.like(escape_like(prefix) + '%', escape='\\'))
+
+
+def apply_updated_range(query, column, args):
+    updated_after = parse_datetime_arg(args, 'updated_after')
+    updated_before = parse_datetime_arg(args, 'updated_before')
+    if updated_after:
+        query = query.filter(column >= updated_after)
+    if updated_before:
+        query = query.filter(column < updated_before)
+    return query
+
+
+def keyset_paginate(query, id_column, args, row_id=lambda row: row.id):
+    """Orders by `id_column` and returns (rows, next_cursor) for the requested page.
+
+    Uses `id > last_seen_id` instead of OFFSET, so every page costs the same
+    index range scan no matter how deep the client has paged. `row_id` extracts
+    the id from a result row when the query returns tuples.
+    """
+    if args.get('cursor'):
+        query = query.filter(id_column > decode_cursor(args['cursor']))
+    query = query.order_by(id_column)
+
+    limit = parse_limit(args)
+    if limit is None:
+        return query.all(), None
+
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    return rows[:limit], encode_cursor(row_id(rows[limit - 1]))
+
+
+def project(item, fields):
+    if fields is None:
+        return item
+    return {name: item[name] for name in fields}
+
+
+def list_response(items, next_cursor=None):
+    response = jsonify(items)
+    if next_cursor is not None:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response, 200
@@ -0,0 +1,98 @@
+"""TCP reachability probes for DeviceConfig.hostname_ip targets.
+
+All targets of a request are probed concurrently with asyncio (bounded by a
+semaphore), so checking a thousand devices takes roughly one connect timeout
+instead of one timeout per device. Results are cached per target for
+REACHABILITY_TTL seconds.
+"""
+import asyncio
+import threading
+import time
+
+from flask import current_app
+
+DEFAULT_PORT = 22
+DEFAULT_TIMEOUT = 2.0
+DEFAULT_CONCURRENCY = 256
+DEFAULT_TTL = 60.0
+
+_cache_lock = threading.Lock()
+_results = {}  # (host, port) -> result dict (including "checked_at")
+
+
+def parse_target(hostname_ip, default_port):
+    """Splits 'host', 'host:port', '[v6]:port' or 'user@host' into (host, port)."""
+    target = (hostname_ip or '').strip()
+    if '@' in target:
+        target = target.rsplit('@', 1)[1]
+    if target.startswith('['):
+        host, _, rest = target[1:].partition(']')
+        port = rest[1:] if rest.startswith(':') else ''
+    elif target.count(':') == 1:
+        host, port = target.split(':')
+    else:
+        host, port = target, ''  # Plain hostname/IPv4 or bare IPv6
+    return host, int(port) if port.isdigit() else default_port
+
+
+async def probe(host, port, timeout):
+    started = time.perf_counter()
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except asyncio.TimeoutError:
+        return {"reachable": False, "error": "timeout"}
+    except OSError as e:
+        return {"reachable": False, "error": e.strerror or e.__class__.__name__}
+    except (OverflowError, ValueError):  # Port out of range, or a host name IDNA cannot encode
+        return {"reachable": False, "error": "invalid target"}
+    latency_ms = round((time.perf_counter() - started) * 1000, 2)
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return {"reachable": True, "latency_ms": latency_ms}
+
+
+async def probe_many(targets, timeout, concurrency):
+    """Probes (host, port) pairs concurrently; returns {target: result}."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(target):
+        async with semaphore:
+            return target, await probe(target[0], target[1], timeout)
+
+    return dict(await asyncio.gather(*(bounded(target) for target in targets)))
+
+
+def check_configs(configs, force=False):
+    """Returns reachability for (config_id, hostname_ip) pairs, probing only stale targets."""
+    config = current_app.config
+    port = config.get('REACHABILITY_PORT', DEFAULT_PORT)
+    ttl = config.get('REACHABILITY_TTL', DEFAULT_TTL)
+    now = time.time()
+
+    targets = {config_id: parse_target(hostname_ip, port) for config_id, hostname_ip in configs}
+    with _cache_lock:
+        stale = {target for target in targets.values()
+                 if force or target not in _results or now - _results[target]["checked_at"] >= ttl}
+
+    if stale:
+        probed = asyncio.run(probe_many(
+            stale,
+            timeout=config.get('REACHABILITY_TIMEOUT', DEFAULT_TIMEOUT),
+            concurrency=config.get('REACHABILITY_CONCURRENCY', DEFAULT_CONCURRENCY),
+        ))
+        checked_at = time.time()
+        with _cache_lock:
+            for target, result in probed.items():
+                _results[target] = dict(result, checked_at=checked_at)
+
+    with _cache_lock:
+        return [dict(_results[target], device_config_id=config_id, host=target[0], port=target[1])
+                for config_id, target in targets.items()]
+
+
+def clear_cache():
+    with _cache_lock:
+        _results.clear()
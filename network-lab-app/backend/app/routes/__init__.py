@@ -0,0 +1,34 @@
+"""API blueprints and the app-wide hooks they rely on.
+
+create_app registers auth_bp together with the extensions it sets up (db,
+JWT) and then calls register_blueprints(app) once. Every other blueprint and
+every app-wide hook (JSON provider, replica stickiness, request metrics,
+recovery of interrupted background jobs) is installed here, explicitly,
+instead of as a side effect of importing or registering some blueprint.
+"""
+from .. import db_routing, instrumentation, json_provider
+from .. import jobs as background_jobs  # routes.jobs (the blueprint module) would shadow the name
+from .admin import admin_bp
+from .jobs import jobs_bp
+from .lab import lab_bp
+from .metrics import metrics_bp
+from .search import search_bp
+from .terminal import terminal_bp
+
+BLUEPRINTS = (
+    (lab_bp, '/api/lab'),
+    (admin_bp, '/api/admin'),
+    (jobs_bp, '/api/jobs'),
+    (search_bp, '/api/search'),
+    (terminal_bp, '/api/terminal'),
+    (metrics_bp, '/api'),
+)
+
+
+def register_blueprints(app):
+    json_provider.init_app(app)
+    db_routing.init_app(app)
+    instrumentation.init_app(app)
+    background_jobs.init_app(app)
+    for blueprint, url_prefix in BLUEPRINTS:
+        app.register_blueprint(blueprint, url_prefix=url_prefix)
@@ -1,9 +1,21 @@
-from flask import Blueprint, request, jsonify
-from ..models import db, DeviceType, DeviceConfig, User # Added User for created_by_id
+from flask import Blueprint, current_app, request, jsonify
+from ..models import db, DeviceType, DeviceConfig, LabDeviceInstance, User # Added User for created_by_id
 from flask_jwt_extended import jwt_required, get_jwt
-
+from .. import job_handlers # Registers the background job kinds
+from ..admission import admission_controlled
+from ..catalog_cache import cached_catalog_response
+from ..device_import import ImportFormatError, import_device_configs, rows_for_content_type
+from ..jobs import accepted_response, jobs, wants_async
+from ..pagination import (ListQueryError, apply_name_prefix, apply_updated_range, has_list_query_args,
+                          keyset_paginate, list_response, parse_fields, project)
+from ..reachability import check_configs
+from ..serializers import serialize_device_config, serialize_device_type
+
+# Registered by routes.register_blueprints with url_prefix='/api/admin'
 admin_bp = Blueprint('admin_bp', __name__)
 
+DEVICE_CONFIG_FIELDS = ('id', 'name', 'device_type_id', 'device_type_name', 'hostname_ip', 'default_icon_path', 'notes')
+
 def check_admin():
     """Helper function to check if current user is admin."""
     claims = get_jwt()
@@ -14,8 +26,10 @@ def check_admin():
 @jwt_required()
 def get_device_types():
     # No admin check here, allow authenticated users to see types for selection
-    types = DeviceType.query.all()
-    return jsonify([{"id": t.id, "name": t.name, "default_icon_path": t.default_icon_path} for t in types]), 200
+    return cached_catalog_response(
+        'device-types',
+        lambda: [serialize_device_type(t) for t in DeviceType.query.all()]
+    )
 
 @admin_bp.route('/device-types', methods=['POST'])
 @jwt_required()
@@ -36,7 +50,7 @@ def create_device_type():
     new_type = DeviceType(name=name, default_icon_path=default_icon_path)
     db.session.add(new_type)
     db.session.commit()
-    return jsonify({"id": new_type.id, "name": new_type.name, "default_icon_path": new_type.default_icon_path}), 201
+    return jsonify(serialize_device_type(new_type)), 201
 
 @admin_bp.route('/device-types/<int:type_id>', methods=['PUT'])
 @jwt_required()
@@ -59,7 +73,7 @@ def update_device_type(type_id):
         device_type.default_icon_path = data.get('default_icon_path')
 
     db.session.commit()
-    return jsonify({"id": device_type.id, "name": device_type.name, "default_icon_path": device_type.default_icon_path}), 200
+    return jsonify(serialize_device_type(device_type)), 200
 
 @admin_bp.route('/device-types/<int:type_id>', methods=['DELETE'])
 @jwt_required()
@@ -82,22 +96,36 @@ def delete_device_type(type_id):
 @jwt_required()
 def get_device_configs():
     # No admin check, allow authenticated users to see configs for lab building
-    configs = DeviceConfig.query.all()
-    results = []
-    for cfg in configs:
-        # Eager load or ensure device_type is accessible
-        device_type_name = cfg.device_type.name if cfg.device_type else "Unknown"
-        icon_path = cfg.default_icon_path or (cfg.device_type.default_icon_path if cfg.device_type else None)
-        results.append({
-            "id": cfg.id,
-            "name": cfg.name,
-            "device_type_id": cfg.device_type_id,
-            "device_type_name": device_type_name,
-            "hostname_ip": cfg.hostname_ip,
-            "default_icon_path": icon_path,
-            "notes": cfg.notes
-        })
-    return jsonify(results), 200
+    def configs_query():
+        # Join the type in the same query instead of lazy-loading cfg.device_type per row
+        return db.session.query(DeviceConfig, DeviceType).outerjoin(
+            DeviceType, DeviceConfig.device_type_id == DeviceType.id
+        )
+
+    if not has_list_query_args(request.args, extra=('device_type_id',)):
+        return cached_catalog_response(
+            'device-configs',
+            lambda: [serialize_device_config(cfg, device_type) for cfg, device_type in configs_query().all()]
+        )
+
+    try:
+        fields = parse_fields(request.args, DEVICE_CONFIG_FIELDS)
+        query = configs_query()
+        if 'device_type_id' in request.args:
+            device_type_id = request.args.get('device_type_id', type=int)
+            if device_type_id is None:
+                raise ListQueryError("device_type_id must be an integer")
+            query = query.filter(DeviceConfig.device_type_id == device_type_id)
+        query = apply_name_prefix(query, DeviceConfig.name, request.args)
+        query = apply_updated_range(query, DeviceConfig.updated_at, request.args)
+        rows, next_cursor = keyset_paginate(query, DeviceConfig.id, request.args, row_id=lambda row: row[0].id)
+    except ListQueryError as e:
+        return jsonify({"msg": str(e)}), 400
+
+    return list_response(
+        [project(serialize_device_config(cfg, device_type), fields) for cfg, device_type in rows],
+        next_cursor
+    )
 
 @admin_bp.route('/device-configs', methods=['POST'])
 @jwt_required()
@@ -136,32 +164,49 @@ def create_device_config():
     db.session.add(new_config)
     db.session.commit()
 
-    icon_path = new_config.default_icon_path or (device_type.default_icon_path if device_type else None)
-    return jsonify({
-        "id": new_config.id,
-        "name": new_config.name,
-        "device_type_id": new_config.device_type_id,
-        "device_type_name": device_type.name,
-        "hostname_ip": new_config.hostname_ip,
-        "default_icon_path": icon_path,
-        "notes": new_config.notes
-    }), 201
+    return jsonify(serialize_device_config(new_config, device_type)), 201
+
+@admin_bp.route('/device-configs/import', methods=['POST'])
+@jwt_required()
+@admission_controlled('device_configs.import')
+def import_device_configs_bulk():
+    """Streams a CSV (with header) or JSON Lines body of device configs into the catalog."""
+    if not check_admin():
+        return jsonify({"msg": "Administration rights required"}), 403
+
+    try:
+        rows = rows_for_content_type(request.content_type, request.stream)
+    except ImportFormatError as e:
+        return jsonify({"msg": str(e)}), 415
+
+    if wants_async(request): # The body is stored with the job, so it is read here instead of streamed
+        return accepted_response(jobs.submit(
+            current_app._get_current_object(), 'device_configs.import', get_jwt()["sub"],
+            params={"content_type": request.content_type, "created_by_id": get_jwt()["sub"]},
+            payload=request.get_data()))
+
+    try:
+        report = import_device_configs(rows, created_by_id=get_jwt()["sub"])
+    except ImportFormatError as e:
+        return jsonify({"msg": str(e)}), 400
+    return jsonify(report.as_dict()), 200
+
+@admin_bp.route('/device-configs/reachability', methods=['GET'])
+@jwt_required()
+def get_device_configs_reachability():
+    """TCP reachability of the whole catalog, probed concurrently (?refresh=1 ignores the cache)."""
+    if not check_admin():
+        return jsonify({"msg": "Administration rights required"}), 403
+    configs = db.session.query(DeviceConfig.id, DeviceConfig.hostname_ip).order_by(DeviceConfig.id).all()
+    return jsonify(check_configs(configs, force=request.args.get('refresh') in ('1', 'true'))), 200
 
 @admin_bp.route('/device-configs/<int:config_id>', methods=['GET'])
 @jwt_required()
 def get_device_config_detail(config_id):
-    config = DeviceConfig.query.get_or_404(config_id)
-    device_type_name = config.device_type.name if config.device_type else "Unknown"
-    icon_path = config.default_icon_path or (config.device_type.default_icon_path if config.device_type else None)
-    return jsonify({
-        "id": config.id,
-        "name": config.name,
-        "device_type_id": config.device_type_id,
-        "device_type_name": device_type_name,
-        "hostname_ip": config.hostname_ip,
-        "default_icon_path": icon_path,
-        "notes": config.notes
-    }), 200
+    config, device_type = db.session.query(DeviceConfig, DeviceType).outerjoin(
+        DeviceType, DeviceConfig.device_type_id == DeviceType.id
+    ).filter(DeviceConfig.id == config_id).first_or_404()
+    return jsonify(serialize_device_config(config, device_type)), 200
 
 @admin_bp.route('/device-configs/<int:config_id>', methods=['PUT'])
 @jwt_required()
@@ -191,16 +236,7 @@ def update_device_config(config_id):
 
     db.session.commit()
 
-    updated_icon_path = config.default_icon_path or (device_type.default_icon_path if device_type else None)
-    return jsonify({
-        "id": config.id,
-        "name": config.name,
-        "device_type_id": config.device_type_id,
-        "device_type_name": device_type.name,
-        "hostname_ip": config.hostname_ip,
-        "default_icon_path": updated_icon_path,
-        "notes": config.notes
-    }), 200
+    return jsonify(serialize_device_config(config, device_type)), 200
 
 @admin_bp.route('/device-configs/<int:config_id>', methods=['DELETE'])
 @jwt_required()
@@ -210,8 +246,9 @@ def delete_device_config(config_id):
 
     config = DeviceConfig.query.get_or_404(config_id)
 
-    # Check if this config is used in any lab instances
-    if config.lab_instances: # Assumes lab_instances relationship is defined in DeviceConfig model
+    # Check if this config is used in any lab instances (EXISTS-style probe instead of loading them all)
+    in_use = db.session.query(LabDeviceInstance.id).filter_by(device_config_id=config_id).first()
+    if in_use:
         return jsonify({"msg": "Cannot delete: Device configuration is used in one or more lab topologies."}), 409
 
     db.session.delete(config)
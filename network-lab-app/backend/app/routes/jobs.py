@@ -0,0 +1,50 @@
+from flask import Blueprint, Response, abort, jsonify, request
+from flask_jwt_extended import jwt_required, get_jwt, get_jwt_identity
+from ..jobs import FINISHED_STATES, BackgroundJob, serialize_job
+from ..pagination import ListQueryError, parse_limit
+
+# Registered by routes.register_blueprints with url_prefix='/api/jobs' (see jobs.JOBS_URL)
+jobs_bp = Blueprint('jobs_bp', __name__)
+
+MAX_LISTED_JOBS = 100
+
+def _visible_job_or_404(job_id):
+    job = BackgroundJob.query.get_or_404(job_id)
+    if str(job.user_id) != str(get_jwt_identity()) and not get_jwt().get("is_admin", False):
+        abort(404) # Same answer as for a missing job
+    return job
+
+@jobs_bp.route('', methods=['GET'])
+@jwt_required()
+def list_jobs():
+    """The current user's most recent jobs (?status=running etc.)."""
+    try:
+        limit = parse_limit(request.args, max_limit=MAX_LISTED_JOBS) or 20
+    except ListQueryError as e:
+        return jsonify({"msg": str(e)}), 400
+    query = BackgroundJob.query.filter_by(user_id=get_jwt_identity())
+    if request.args.get('status'):
+        query = query.filter_by(status=request.args['status'])
+    jobs = query.order_by(BackgroundJob.id.desc()).limit(limit).all()
+    return jsonify([serialize_job(job) for job in jobs]), 200
+
+@jobs_bp.route('/<int:job_id>', methods=['GET'])
+@jwt_required()
+def get_job(job_id):
+    """Status and progress of a job; poll until status is 'succeeded' or 'failed'."""
+    job = _visible_job_or_404(job_id)
+    response = jsonify(serialize_job(job))
+    if job.status not in FINISHED_STATES:
+        response.headers['Retry-After'] = '1'
+    return response, 200
+
+@jobs_bp.route('/<int:job_id>/result', methods=['GET'])
+@jwt_required()
+def download_job_result(job_id):
+    """Binary output of a finished job, e.g. an exported topology archive."""
+    job = _visible_job_or_404(job_id)
+    if job.result_payload is None:
+        return jsonify({"msg": "This job has no downloadable result"}), 404
+    response = Response(job.result_payload, mimetype=job.result_mimetype or 'application/octet-stream')
+    response.headers['Content-Disposition'] = f'attachment; filename="job-{job.id}-result"'
+    return response
@@ -1,21 +1,46 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
 from ..models import db, LabTopology, LabDeviceInstance, LabConnection, DeviceConfig, DeviceType
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required, get_jwt, get_jwt_identity
+from .. import job_handlers # Registers the background job kinds
+from ..admission import admission_controlled
+from ..collaboration import event_stream, hub
+from ..jobs import accepted_response, jobs, wants_async
+from ..pagination import (ListQueryError, apply_name_prefix, apply_updated_range, keyset_paginate,
+                          list_response, parse_fields, project)
+from ..reachability import check_configs
+from ..serializers import serialize_edge_row, serialize_topology_summary
+from ..topology_changes import changes_since
+from ..topology_clone import (CloneError, TopologyTemplate, clone_topology, copy_names, existing_user_ids,
+                              parse_user_ids, serialize_template)
+from ..topology_archive import ARCHIVE_MIMETYPE, ArchiveError, export_topology, import_topology
+from ..topology_analysis import ANALYSIS_METRICS, analyze, load_graph
+from ..topology_layout import LayoutError, LayoutUnavailable, compute_layout, parse_layout_options
+from ..topology_reader import load_topology_detail, stream_topology_detail
+from ..topology_revisions import RevisionConflict, bump_revision, current_revision
+from ..topology_snapshots import (GraphEdit, SnapshotNotFound, list_snapshots, materialize,
+                                  record_snapshot, state_to_react_flow, state_to_save_payload)
+from ..topology_spatial import ViewportError, load_viewport, parse_bbox
+from ..topology_writer import (TopologyWriteError, apply_node_moves, apply_topology_delta, delete_topology,
+                               parse_instance_id, save_topology_full, validate_full_save, with_pending_moves)
 
+# Registered by routes.register_blueprints with url_prefix='/api/lab'
 lab_bp = Blueprint('lab_bp', __name__)
 
+TOPOLOGY_SUMMARY_FIELDS = ('id', 'name', 'description', 'created_at', 'updated_at')
+
 @lab_bp.route('/topologies', methods=['GET'])
 @jwt_required()
 def get_lab_topologies():
     current_user_id = get_jwt_identity()
-    topologies = LabTopology.query.filter_by(user_id=current_user_id).all()
-    return jsonify([{
-        "id": t.id,
-        "name": t.name,
-        "description": t.description,
-        "created_at": t.created_at.isoformat() if t.created_at else None,
-        "updated_at": t.updated_at.isoformat() if t.updated_at else None
-    } for t in topologies]), 200
+    query = LabTopology.query.filter_by(user_id=current_user_id)
+    try:
+        fields = parse_fields(request.args, TOPOLOGY_SUMMARY_FIELDS)
+        query = apply_name_prefix(query, LabTopology.name, request.args)
+        query = apply_updated_range(query, LabTopology.updated_at, request.args)
+        topologies, next_cursor = keyset_paginate(query, LabTopology.id, request.args)
+    except ListQueryError as e:
+        return jsonify({"msg": str(e)}), 400
+    return list_response([project(serialize_topology_summary(t), fields) for t in topologies], next_cursor)
 
 @lab_bp.route('/topologies', methods=['POST'])
 @jwt_required()
@@ -35,57 +60,23 @@ def create_lab_topology():
     )
     db.session.add(new_topology)
     db.session.commit()
-    return jsonify({
-        "id": new_topology.id,
-        "name": new_topology.name,
-        "description": new_topology.description,
-        "created_at": new_topology.created_at.isoformat() if new_topology.created_at else None,
-        "updated_at": new_topology.updated_at.isoformat() if new_topology.updated_at else None
-    }), 201
+    return jsonify(serialize_topology_summary(new_topology)), 201
 
 @lab_bp.route('/topologies/<int:topology_id>', methods=['GET'])
 @jwt_required()
 def get_lab_topology_detail(topology_id):
     current_user_id = get_jwt_identity()
     topology = LabTopology.query.filter_by(id=topology_id, user_id=current_user_id).first_or_404()
-
-    device_instances_data = []
-    # Ensure relationships are loaded or handle potential None values gracefully
-    for instance in topology.device_instances or []:
-        device_config = instance.device_config
-        if device_config:
-            device_type = device_config.device_type
-            icon_path = device_config.default_icon_path or (device_type.default_icon_path if device_type else None)
-
-            device_instances_data.append({
-                "id": str(instance.id),
-                "type": 'deviceNode',
-                "position": {"x": instance.canvas_x, "y": instance.canvas_y},
-                "data": {
-                    "label": instance.instance_name or device_config.name,
-                    "deviceConfigId": instance.device_config_id,
-                    "hostnameIp": device_config.hostname_ip,
-                    "iconPath": icon_path,
-                }
-            })
-
-    connections_data = []
-    for conn in topology.connections or []:
-        connections_data.append({
-            "id": f"edge_{conn.source_instance_id}-{conn.target_instance_id}_{conn.id}", # More unique edge ID
-            "source": str(conn.source_instance_id),
-            "target": str(conn.target_instance_id),
-        })
-
-    return jsonify({
-        "id": topology.id,
-        "name": topology.name,
-        "description": topology.description,
-        "nodes": device_instances_data,
-        "edges": connections_data,
-        "created_at": topology.created_at.isoformat() if topology.created_at else None,
-        "updated_at": topology.updated_at.isoformat() if topology.updated_at else None
-    }), 200
+    if 'bbox' in request.args:
+        # Only the nodes inside the viewport, their edges and stubs for off-screen neighbours
+        try:
+            return jsonify(load_viewport(topology, parse_bbox(request.args['bbox']))), 200
+        except ViewportError as e:
+            return jsonify({"msg": str(e)}), 400
+    if request.args.get('stream') in ('1', 'true'):
+        # Opt-in for very large labs: constant memory, first byte sent immediately
+        return Response(stream_with_context(stream_topology_detail(topology)), mimetype='application/json')
+    return jsonify(load_topology_detail(topology)), 200
 
 @lab_bp.route('/topologies/<int:topology_id>', methods=['PUT'])
 @jwt_required()
@@ -98,87 +89,418 @@ def update_lab_topology_metadata(topology_id):
     topology.description = data.get('description', topology.description)
 
     db.session.commit()
-    return jsonify({
-        "id": topology.id,
-        "name": topology.name,
-        "description": topology.description,
-        "created_at": topology.created_at.isoformat() if topology.created_at else None,
-        "updated_at": topology.updated_at.isoformat() if topology.updated_at else None
-    }), 200
+    return jsonify(serialize_topology_summary(topology)), 200
 
 
 @lab_bp.route('/topologies/<int:topology_id>/save', methods=['POST'])
 @jwt_required()
+@admission_controlled('topology.save', target_arg='topology_id')
 def save_lab_topology_full(topology_id):
     current_user_id = get_jwt_identity()
     topology = LabTopology.query.filter_by(id=topology_id, user_id=current_user_id).first_or_404()
-    data = request.get_json()
+    data = request.get_json(silent=True)
 
-    # Delete existing connections first
-    LabConnection.query.filter_by(topology_id=topology_id).delete(synchronize_session='fetch')
-    # Then delete existing device instances
-    LabDeviceInstance.query.filter_by(topology_id=topology_id).delete(synchronize_session='fetch')
-
-    db.session.flush()
-
-    frontend_node_id_to_backend_instance_id = {}
-
-    for node_data in data.get('nodes', []):
-        frontend_node_id = node_data.get('id')
-        device_config_id = node_data.get('data', {}).get('deviceConfigId') # Correctly access nested data
-        position = node_data.get('position', {})
-        instance_name = node_data.get('data', {}).get('label')
-
-
-        if not device_config_id:
-             db.session.rollback()
-             return jsonify({"msg": f"Missing deviceConfigId for node {frontend_node_id}"}), 400
-
-        if not DeviceConfig.query.get(device_config_id):
-            db.session.rollback()
-            return jsonify({"msg": f"Invalid device_config_id: {device_config_id} for node {frontend_node_id}"}), 400
-
-        instance = LabDeviceInstance(
-            topology_id=topology_id,
-            device_config_id=device_config_id,
-            instance_name=instance_name,
-            canvas_x=position.get('x', 0),
-            canvas_y=position.get('y', 0)
-        )
-        db.session.add(instance)
-        db.session.flush()
-
-        if frontend_node_id: # Ensure frontend_node_id is present
-             frontend_node_id_to_backend_instance_id[frontend_node_id] = instance.id
-
-    for edge_data in data.get('edges', []):
-        frontend_source_id = edge_data.get('source')
-        frontend_target_id = edge_data.get('target')
-
-        backend_source_instance_id = frontend_node_id_to_backend_instance_id.get(frontend_source_id)
-        backend_target_instance_id = frontend_node_id_to_backend_instance_id.get(frontend_target_id)
-
-        if backend_source_instance_id and backend_target_instance_id:
-            connection = LabConnection(
-                topology_id=topology_id,
-                source_instance_id=backend_source_instance_id,
-                target_instance_id=backend_target_instance_id
-            )
-            db.session.add(connection)
-        else:
-            print(f"Warning: Could not map frontend edge {edge_data.get('id')} to backend instances. Missing mapping for Source: {frontend_source_id} (maps to {backend_source_instance_id}) or Target: {frontend_target_id} (maps to {backend_target_instance_id})")
-            # Consider whether to error out or just skip faulty edges
-            # For now, skipping.
+    if wants_async(request):
+        try:
+            validate_full_save(data) # Reject a bad body now rather than as a failed job
+        except TopologyWriteError as e:
+            return jsonify({"msg": str(e)}), 400
+        # Only the newest graph matters: queued saves of this topology would just be overwritten
+        params = {"topology_id": topology_id}
+        jobs.supersede_queued('topology.save', current_user_id, params)
+        job = jobs.submit(current_app._get_current_object(), 'topology.save', current_user_id,
+                          params=params, payload=request.get_data())
+        return accepted_response(job)
+
+    try:
+        save_topology_full(topology, data)
+    except TopologyWriteError as e:
+        db.session.rollback()
+        return jsonify({"msg": str(e)}), 400
 
+    revision = bump_revision(topology_id)
+    record_snapshot(topology_id, revision)
     db.session.commit()
+    hub.publish(topology_id, 'reload', {"revision": revision})
     return get_lab_topology_detail(topology_id)
 
+@lab_bp.route('/topologies/<int:topology_id>/delta', methods=['POST'])
+@jwt_required()
+@admission_controlled('topology.delta')
+def save_lab_topology_delta(topology_id):
+    """Applies only the added/moved/renamed/removed nodes and edges of an edit."""
+    current_user_id = get_jwt_identity()
+    topology = LabTopology.query.filter_by(id=topology_id, user_id=current_user_id).first_or_404()
+    data = request.get_json() or {}
+
+    try:
+        edit = GraphEdit()
+        result = apply_topology_delta(topology, data, edit)
+    except RevisionConflict as e:
+        db.session.rollback()
+        return jsonify({"msg": str(e), "revision": e.current_revision}), 409
+    except TopologyWriteError as e:
+        db.session.rollback()
+        return jsonify({"msg": str(e)}), 400
+
+    record_snapshot(topology_id, result["revision"], edit)
+    db.session.commit()
+    hub.publish(topology_id, 'delta', dict(result, delta=data))
+    return jsonify(result), 200
+
+@lab_bp.route('/topologies/<int:topology_id>/changes', methods=['GET'])
+@jwt_required()
+def get_lab_topology_changes(topology_id):
+    """Node/edge upserts and removals since ?since=<revision>; "reload": true means fetch the full detail."""
+    current_user_id = get_jwt_identity()
+    LabTopology.query.filter_by(id=topology_id, user_id=current_user_id).first_or_404()
+    since = request.args.get('since', type=int)
+    if since is None:
+        return jsonify({"msg": "since must be a revision number"}), 400
+
+    revision = current_revision(topology_id)
+    change = changes_since(topology_id, since, revision)
+    if change is None:
+        return jsonify({"since": since, "revision": revision, "reload": True}), 200
+
+    upserted = state_to_react_flow({"nodes": change["nodes"]["set"], "edges": change["edges"]["set"]})
+    removed_edges = sorted((int(key), source, target) for key, (source, target) in change["edges"]["del"].items())
+    return jsonify({
+        "since": since,
+        "revision": revision,
+        "reload": False,
+        "nodes": {"upserted": upserted["nodes"], "removed": sorted(change["nodes"]["del"], key=int)},
+        "edges": {"upserted": upserted["edges"], "removed": [serialize_edge_row(row)["id"] for row in removed_edges]},
+    }), 200
+
+@lab_bp.route('/topologies/<int:topology_id>/events', methods=['GET'])
+@jwt_required(locations=['headers', 'query_string']) # EventSource cannot send headers; use ?jwt=<token>
+def get_lab_topology_events(topology_id):
+    """Server-Sent Events stream of the live edits made to a topology."""
+    current_user_id = get_jwt_identity()
+    LabTopology.query.filter_by(id=topology_id, user_id=current_user_id).first_or_404()
+    subscriber = hub.subscribe(topology_id)
+    response = Response(event_stream(topology_id, subscriber), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no' # Keep nginx from buffering the stream
+    return response
+
+@lab_bp.route('/topologies/<int:topology_id>/live', methods=['POST'])
+@jwt_required()
+@admission_controlled('topology.live')
+def post_lab_topology_live_edit(topology_id):
+    """Live edit in the delta format (without baseRevision).
+
+    Pure moves are coalesced and persisted in batches (202). Anything structural
+    is written immediately, in one revision with any moves still waiting to be persisted.
+    """
+    current_user_id = get_jwt_identity()
+    topology = LabTopology.query.filter_by(id=topology_id, user_id=current_user_id).first_or_404()
+    data = request.get_json() or {}
+    nodes = data.get('nodes') or {}
+    edges = data.get('edges') or {}
+
+    structural = any(nodes.get(k) for k in ('added', 'renamed', 'removed')) or any(edges.values())
+    if not structural:
+        positions = {}
+        for node in nodes.get('moved') or []:
+            instance_id = parse_instance_id(node.get('id'))
+            if instance_id is None:
+                return jsonify({"msg": f"Invalid node id: {node.get('id')}"}), 400
+            positions[instance_id] = node.get('position') or {}
+        hub.queue_moves(current_app._get_current_object(), topology_id, positions)
+        return jsonify({"queued": len(positions)}), 202
+
+    pending_moves = hub.take_unpersisted_moves(topology_id)
+    edit = GraphEdit()
+    try:
+        delta = with_pending_moves(topology_id, data, pending_moves) if pending_moves else data
+        result = apply_topology_delta(topology, dict(delta, baseRevision=current_revision(topology_id)), edit)
+    except RevisionConflict as e:
+        db.session.rollback()
+        hub.requeue_moves(topology_id, pending_moves)
+        return jsonify({"msg": str(e), "revision": e.current_revision}), 409
+    except TopologyWriteError as e:
+        db.session.rollback()
+        hub.requeue_moves(topology_id, pending_moves)
+        return jsonify({"msg": str(e)}), 400
+
+    record_snapshot(topology_id, result["revision"], edit)
+    db.session.commit()
+    hub.discard_moves(topology_id, [parse_instance_id(i) for i in nodes.get('removed') or []])
+    hub.publish(topology_id, 'delta', dict(result, delta=data))
+    return jsonify(result), 200
+
+@lab_bp.route('/topologies/<int:topology_id>/versions', methods=['GET'])
+@jwt_required()
+def get_lab_topology_versions(topology_id):
+    current_user_id = get_jwt_identity()
+    LabTopology.query.filter_by(id=topology_id, user_id=current_user_id).first_or_404()
+    return jsonify(list_snapshots(topology_id)), 200
+
+@lab_bp.route('/topologies/<int:topology_id>/versions/<int:revision>', methods=['GET'])
+@jwt_required()
+def get_lab_topology_version(topology_id, revision):
+    current_user_id = get_jwt_identity()
+    topology = LabTopology.query.filter_by(id=topology_id, user_id=current_user_id).first_or_404()
+    try:
+        state = materialize(topology_id, revision)
+    except SnapshotNotFound as e:
+        return jsonify({"msg": str(e)}), 404
+
+    payload = state_to_react_flow(state)
+    payload.update({"id": topology.id, "name": topology.name, "revision": revision})
+    return jsonify(payload), 200
+
+@lab_bp.route('/topologies/<int:topology_id>/versions/<int:revision>/restore', methods=['POST'])
+@jwt_required()
+@admission_controlled('topology.restore')
+def restore_lab_topology_version(topology_id, revision):
+    """Makes an old revision the current graph; this is recorded as a new revision."""
+    current_user_id = get_jwt_identity()
+    topology = LabTopology.query.filter_by(id=topology_id, user_id=current_user_id).first_or_404()
+    try:
+        state = materialize(topology_id, revision)
+        save_topology_full(topology, state_to_save_payload(state))
+    except SnapshotNotFound as e:
+        return jsonify({"msg": str(e)}), 404
+    except TopologyWriteError as e:
+        db.session.rollback()
+        return jsonify({"msg": f"Cannot restore revision {revision}: {e}"}), 400
+
+    new_revision = bump_revision(topology_id)
+    record_snapshot(topology_id, new_revision)
+    db.session.commit()
+    return get_lab_topology_detail(topology_id)
+
+@lab_bp.route('/topologies/<int:topology_id>/analysis', methods=['GET'])
+@jwt_required()
+def get_lab_topology_analysis(topology_id):
+    """Graph metrics: ?metrics=components,cycles,articulation_points,degree and ?source=&target= for a path."""
+    current_user_id = get_jwt_identity()
+    LabTopology.query.filter_by(id=topology_id, user_id=current_user_id).first_or_404()
+
+    requested = request.args.get('metrics')
+    metrics = tuple(m.strip() for m in requested.split(',') if m.strip()) if requested else ANALYSIS_METRICS
+    unknown = [m for m in metrics if m not in ANALYSIS_METRICS]
+    if unknown:
+        return jsonify({"msg": f"Unknown metrics: {', '.join(unknown)}"}), 400
+
+    graph = load_graph(topology_id)
+    source = parse_instance_id(request.args.get('source'))
+    target = parse_instance_id(request.args.get('target'))
+    if ('source' in request.args or 'target' in request.args) and (source not in graph.index or target not in graph.index):
+        return jsonify({"msg": "source and target must both be nodes of this topology"}), 400
+
+    return jsonify(analyze(graph, metrics, source, target)), 200
+
+@lab_bp.route('/topologies/<int:topology_id>/layout', methods=['POST'])
+@jwt_required()
+@admission_controlled('topology.layout')
+def layout_lab_topology(topology_id):
+    """Lays out every node on the server and saves the positions as a new revision.
+
+    Body: {"algorithm": "force" | "layered" | "grid", "spacing": 150, "iterations": 60, "apply": true};
+    with "apply": false the positions are only returned.
+    """
+    current_user_id = get_jwt_identity()
+    LabTopology.query.filter_by(id=topology_id, user_id=current_user_id).first_or_404()
+    data = request.get_json(silent=True) or {}
+    if wants_async(request):
+        return accepted_response(jobs.submit(current_app._get_current_object(), 'topology.layout', current_user_id,
+                                             params=dict(data, topology_id=topology_id)))
+    try:
+        options = parse_layout_options(data)
+        positions = compute_layout(load_graph(topology_id), **options)
+    except LayoutUnavailable as e:
+        return jsonify({"msg": str(e)}), 501
+    except LayoutError as e:
+        return jsonify({"msg": str(e)}), 400
+
+    revision = None
+    if data.get('apply', True):
+        hub.take_unpersisted_moves(topology_id) # Dragged positions not yet written are superseded
+        moved = GraphEdit()
+        revision = apply_node_moves(topology_id, positions, moved)
+        if revision is not None:
+            record_snapshot(topology_id, revision, moved)
+            db.session.commit()
+            hub.publish(topology_id, 'reload', {"revision": revision})
+    return jsonify({
+        "algorithm": options["algorithm"],
+        "revision": revision if revision is not None else current_revision(topology_id),
+        "positions": {str(instance_id): position for instance_id, position in positions.items()},
+    }), 200
+
+@lab_bp.route('/topologies/<int:topology_id>/reachability', methods=['GET'])
+@jwt_required()
+def get_lab_topology_reachability(topology_id):
+    """TCP reachability of every device config used in the topology (?refresh=1 ignores the cache)."""
+    current_user_id = get_jwt_identity()
+    LabTopology.query.filter_by(id=topology_id, user_id=current_user_id).first_or_404()
+    configs = db.session.query(DeviceConfig.id, DeviceConfig.hostname_ip).join(
+        LabDeviceInstance, LabDeviceInstance.device_config_id == DeviceConfig.id
+    ).filter(LabDeviceInstance.topology_id == topology_id).distinct().all()
+    return jsonify(check_configs(configs, force=request.args.get('refresh') in ('1', 'true'))), 200
+
+@lab_bp.route('/topologies/<int:topology_id>/export', methods=['GET'])
+@jwt_required()
+def export_lab_topology(topology_id):
+    """Compact binary archive of the topology, for moving labs between environments."""
+    current_user_id = get_jwt_identity()
+    topology = LabTopology.query.filter_by(id=topology_id, user_id=current_user_id).first_or_404()
+    if wants_async(request): # The archive is downloaded from /api/jobs/<id>/result
+        return accepted_response(jobs.submit(current_app._get_current_object(), 'topology.export', current_user_id,
+                                             params={"topology_id": topology_id}))
+    response = Response(export_topology(topology), mimetype=ARCHIVE_MIMETYPE)
+    response.headers['Content-Disposition'] = f'attachment; filename="topology-{topology_id}.nlab"'
+    return response
+
+@lab_bp.route('/topologies/import', methods=['POST'])
+@jwt_required()
+@admission_controlled('topology.import')
+def import_lab_topology():
+    """Creates a new topology from an export archive (?name= overrides the archived name)."""
+    current_user_id = get_jwt_identity()
+    if wants_async(request):
+        return accepted_response(jobs.submit(
+            current_app._get_current_object(), 'topology.import', current_user_id,
+            params={"user_id": current_user_id, "name": request.args.get('name')}, payload=request.get_data()))
+    try:
+        topology = import_topology(request.get_data(), current_user_id, name=request.args.get('name'))
+    except ArchiveError as e:
+        db.session.rollback()
+        return jsonify({"msg": str(e)}), 400
+
+    revision = bump_revision(topology.id)
+    record_snapshot(topology.id, revision)
+    db.session.commit()
+    return jsonify(serialize_topology_summary(topology)), 201
+
 @lab_bp.route('/topologies/<int:topology_id>', methods=['DELETE'])
 @jwt_required()
 def delete_lab_topology(topology_id):
     current_user_id = get_jwt_identity()
     topology = LabTopology.query.filter_by(id=topology_id, user_id=current_user_id).first_or_404()
+    if wants_async(request):
+        return accepted_response(jobs.submit(current_app._get_current_object(), 'topology.delete', current_user_id,
+                                             params={"topology_id": topology_id}))
+
+    delete_topology(topology)
+    db.session.commit()
+    return '', 204
+
+def _copy_count(data):
+    try:
+        count = int(data.get('count', 1))
+    except (TypeError, ValueError):
+        raise CloneError("count must be an integer")
+    if count < 1:
+        raise CloneError("count must be at least 1")
+    return count
+
+def _copy_name(data, default):
+    name = data.get('name')
+    if name is None:
+        return default
+    if not isinstance(name, str) or not name.strip():
+        raise CloneError("name must be a non-empty string")
+    return name
+
+@lab_bp.route('/topologies/<int:topology_id>/clone', methods=['POST'])
+@jwt_required()
+@admission_controlled('topology.copy')
+def clone_lab_topology(topology_id):
+    """Copies a topology inside the database; body: {"name": ..., "count": 1}. '{n}' in name is the copy number."""
+    current_user_id = get_jwt_identity()
+    topology = LabTopology.query.filter_by(id=topology_id, user_id=current_user_id).first_or_404()
+    data = request.get_json(silent=True) or {}
+    try:
+        count = _copy_count(data)
+        copies = clone_topology(topology, [current_user_id] * count,
+                                copy_names(_copy_name(data, f"{topology.name} (copy)"), count))
+    except CloneError as e:
+        db.session.rollback()
+        return jsonify({"msg": str(e)}), 400
+
+    summaries = [serialize_topology_summary(copy) for copy in copies] # Before commit expires the rows
+    db.session.commit()
+    return jsonify(summaries), 201
+
+@lab_bp.route('/templates', methods=['GET'])
+@jwt_required()
+def get_lab_templates():
+    """Published templates, visible to every user."""
+    templates = TopologyTemplate.query.order_by(TopologyTemplate.name, TopologyTemplate.id).all()
+    return jsonify([serialize_template(t) for t in templates]), 200
+
+@lab_bp.route('/topologies/<int:topology_id>/template', methods=['POST'])
+@jwt_required()
+def publish_lab_template(topology_id):
+    """Publishes a topology as a template; publishing again updates its name and description."""
+    current_user_id = get_jwt_identity()
+    topology = LabTopology.query.filter_by(id=topology_id, user_id=current_user_id).first_or_404()
+    data = request.get_json(silent=True) or {}
 
-    db.session.delete(topology)
+    template = TopologyTemplate.query.filter_by(topology_id=topology_id).first()
+    created = template is None
+    if created:
+        template = TopologyTemplate(topology_id=topology_id, created_by_id=current_user_id,
+                                    name=data.get('name') or topology.name,
+                                    description=data.get('description', topology.description))
+        db.session.add(template)
+    else:
+        template.name = data.get('name') or template.name
+        template.description = data.get('description', template.description)
+    db.session.commit()
+    return jsonify(serialize_template(template)), 201 if created else 200
+
+@lab_bp.route('/templates/<int:template_id>', methods=['DELETE'])
+@jwt_required()
+def unpublish_lab_template(template_id):
+    template = TopologyTemplate.query.get_or_404(template_id)
+    if str(template.created_by_id) != str(get_jwt_identity()) and not get_jwt().get("is_admin", False):
+        return jsonify({"msg": "Only the publisher or an administrator can remove a template"}), 403
+    db.session.delete(template)
     db.session.commit()
     return '', 204
+
+@lab_bp.route('/templates/<int:template_id>/instantiate', methods=['POST'])
+@jwt_required()
+@admission_controlled('topology.copy')
+def instantiate_lab_template(template_id):
+    """Creates topologies from a template.
+
+    Body: {"count": 1, "name": ...} makes copies owned by the caller;
+    {"user_ids": [...]} makes one copy per user instead, which only
+    administrators may do (e.g. a copy per student).
+    """
+    current_user_id = get_jwt_identity()
+    template = TopologyTemplate.query.get_or_404(template_id)
+    source = db.session.get(LabTopology, template.topology_id)
+    data = request.get_json(silent=True) or {}
+
+    try:
+        name = _copy_name(data, template.name)
+        user_ids = data.get('user_ids')
+        if user_ids is not None:
+            if not get_jwt().get("is_admin", False):
+                return jsonify({"msg": "Only administrators can create copies for other users"}), 403
+            user_ids = parse_user_ids(user_ids)
+            missing = set(user_ids) - existing_user_ids(user_ids)
+            if missing:
+                raise CloneError(f"Unknown user_ids: {sorted(missing, key=str)[:20]}")
+            owner_ids = user_ids
+            names = copy_names(name, len(user_ids)) if '{n}' in name else [name] * len(user_ids)
+        else:
+            count = _copy_count(data)
+            owner_ids = [current_user_id] * count
+            names = copy_names(name, count)
+        copies = clone_topology(source, owner_ids, names, description=template.description)
+    except CloneError as e:
+        db.session.rollback()
+        return jsonify({"msg": str(e)}), 400
+
+    summaries = [serialize_topology_summary(copy) for copy in copies]
+    db.session.commit()
+    return jsonify(summaries), 201
@@ -0,0 +1,13 @@
+from flask import Blueprint, Response, current_app, jsonify, request
+from ..instrumentation import metrics
+
+# Registered by routes.register_blueprints with url_prefix='/api'
+metrics_bp = Blueprint('metrics_bp', __name__)
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    # Scrapers have no JWT; protect the endpoint with a static token if one is configured
+    token = current_app.config.get('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return jsonify({"msg": "Invalid metrics token"}), 401
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
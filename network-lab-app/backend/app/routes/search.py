@@ -0,0 +1,37 @@
+from flask import Blueprint, jsonify, request
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from ..pagination import ListQueryError, decode_cursor, encode_cursor, list_response, parse_limit
+from ..search import SearchQueryError, parse_types, search
+
+# Registered by routes.register_blueprints with url_prefix='/api/search'
+search_bp = Blueprint('search_bp', __name__)
+
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+
+@search_bp.route('', methods=['GET'])
+@jwt_required()
+def search_everything():
+    """Ranked matches for ?q= over device configs and the user's topologies (?types=device_configs,topologies).
+
+    Results are paged by rank; the cursor for the next page is in X-Next-Cursor
+    and the number of matches in X-Total-Count. X-Search-Truncated: true means
+    the user has more matching topologies than are ranked, so that count is a
+    lower bound.
+    """
+    try:
+        types = parse_types(request.args.get('types'))
+        limit = parse_limit(request.args, MAX_SEARCH_LIMIT) or DEFAULT_SEARCH_LIMIT
+        offset = decode_cursor(request.args['cursor']) if request.args.get('cursor') else 0
+        if offset < 0:
+            raise ListQueryError("Invalid cursor")
+        total, results, truncated = search(get_jwt_identity(), request.args.get('q'), types, offset, limit)
+    except (SearchQueryError, ListQueryError) as e:
+        return jsonify({"msg": str(e)}), 400
+
+    next_offset = offset + len(results)
+    response, status = list_response(results, encode_cursor(next_offset) if next_offset < total else None)
+    response.headers['X-Total-Count'] = str(total)
+    if truncated:
+        response.headers['X-Search-Truncated'] = 'true'
+    return response, status
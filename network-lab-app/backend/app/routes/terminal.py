@@ -0,0 +1,99 @@
+import json
+from flask import Blueprint, current_app, jsonify
+from flask_jwt_extended import get_jwt, get_jwt_identity, verify_jwt_in_request
+from ..models import db, LabTopology, LabDeviceInstance, DeviceConfig
+from ..reachability import parse_target
+from ..ssh_broker import BrokerConnectError, BrokerUnavailable, broker_pool, relay
+
+try:
+    from flask_sock import Sock
+except ImportError:  # flask-sock is optional; without it the terminal routes answer 501
+    Sock = None
+
+# Registered by routes.register_blueprints with url_prefix='/api/terminal'
+terminal_bp = Blueprint('terminal_bp', __name__)
+
+AUTH_TIMEOUT = 30 # Seconds the client has to send its {"type": "auth"} frame
+
+def _resolve_instance_target(instance_id):
+    row = db.session.query(DeviceConfig.hostname_ip).join(
+        LabDeviceInstance, LabDeviceInstance.device_config_id == DeviceConfig.id
+    ).join(LabTopology, LabTopology.id == LabDeviceInstance.topology_id).filter(
+        LabDeviceInstance.id == instance_id, LabTopology.user_id == get_jwt_identity()
+    ).first()
+    return row[0] if row else None
+
+def _resolve_config_target(config_id):
+    if not get_jwt().get("is_admin", False):
+        return None
+    row = db.session.query(DeviceConfig.hostname_ip).filter(DeviceConfig.id == config_id).first()
+    return row[0] if row else None
+
+def _close(ws, message):
+    try:
+        ws.send(json.dumps({"type": "error", "msg": message}))
+        ws.close(reason=1008, message=message)
+    except Exception:
+        pass
+
+def _run_terminal(ws, resolve, object_id):
+    """Authenticates the socket, opens a pooled SSH shell to the device and relays it."""
+    try:
+        verify_jwt_in_request(locations=['query_string']) # Browsers cannot set headers on WebSockets
+    except Exception:
+        return _close(ws, "Missing or invalid token")
+    hostname_ip = resolve(object_id)
+    if hostname_ip is None:
+        return _close(ws, "Device not found")
+    db.session.remove() # Don't hold a DB connection for the lifetime of the terminal
+
+    # The device credentials never touch the database: the first frame carries them.
+    try:
+        auth = json.loads(ws.receive(timeout=AUTH_TIMEOUT) or 'null')
+    except ValueError:
+        auth = None
+    if not isinstance(auth, dict) or auth.get('type') != 'auth':
+        return _close(ws, 'Expected {"type": "auth"} as the first message')
+
+    config = current_app.config
+    host, port = parse_target(hostname_ip, config.get('SSH_BROKER_PORT', 22))
+    login_user = hostname_ip.rsplit('@', 1)[0] if '@' in hostname_ip else None
+    username = auth.get('username') or login_user or config.get('SSH_BROKER_USERNAME')
+    if not username:
+        return _close(ws, "A username is required")
+
+    try:
+        channel, release = broker_pool().open_shell(
+            get_jwt_identity(), host, port, username, password=auth.get('password'),
+            width=int(auth.get('cols', 80)), height=int(auth.get('rows', 24)),
+        )
+    except (TypeError, ValueError):
+        return _close(ws, "cols and rows must be integers")
+    except (BrokerConnectError, BrokerUnavailable) as e:
+        return _close(ws, str(e))
+
+    ws.send(json.dumps({"type": "ready", "host": host, "port": port}))
+    try:
+        relay(ws, channel)
+    except Exception: # The browser went away; nothing left to report to
+        pass
+    finally:
+        release()
+
+if Sock is not None:
+    sock = Sock()
+
+    @sock.route('/instances/<int:instance_id>', bp=terminal_bp)
+    def lab_instance_terminal(ws, instance_id):
+        """Terminal on the device behind a LabDeviceInstance of one of the user's topologies."""
+        _run_terminal(ws, _resolve_instance_target, instance_id)
+
+    @sock.route('/device-configs/<int:config_id>', bp=terminal_bp)
+    def device_config_terminal(ws, config_id):
+        """Terminal on a catalog DeviceConfig (admins only)."""
+        _run_terminal(ws, _resolve_config_target, config_id)
+else:
+    @terminal_bp.route('/instances/<int:instance_id>')
+    @terminal_bp.route('/device-configs/<int:config_id>')
+    def terminal_unavailable(**_):
+        return jsonify({"msg": "Web terminals require the flask-sock package"}), 501
@@ -0,0 +1,361 @@
+"""Ranked search over device configs and the user's topologies.
+
+Device configs are searched through an in-memory index built from one query
+and rebuilt whenever the catalog version (catalog_cache) changes:
+
+* whole-value and word-prefix matching: the lowercased names and hostnames,
+  and the words of name, hostname_ip and notes, are kept sorted so all keys
+  starting with a term form one bisected range;
+* substring matching: trigram postings over name and hostname_ip; the
+  candidates of a term are the intersection of its trigrams' postings;
+* IP/CIDR matching: hostnames that are IP addresses, sorted as integers, so
+  a CIDR term is a range lookup.
+
+A term scores the best RANKS entry it reaches in any field. The tiers are
+applied to whole posting ranges rather than config by config, so broad
+terms stay fast at 100k configs. Every term has to match (AND) and the
+scores of the terms add up; only the requested page is turned into results.
+
+While a new index is being built, concurrent searches keep using the
+previous one. Topologies are per user and few, so they are filtered with
+LIKE in the database and ranked the same way in Python. The database orders
+the candidates by the same tiers (word starts approximated as "after a
+space") before TOPOLOGY_CANDIDATE_LIMIT applies, so the cut drops the
+weakest matches; when it applies, the search reports itself truncated.
+"""
+import ipaddress
+import re
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+
+from .catalog_cache import catalog_version
+from sqlalchemy import case, func
+
+from .models import db, DeviceConfig, DeviceType, LabTopology
+from .pagination import escape_like
+from .serializers import isoformat
+
+SEARCH_TYPES = ('device_configs', 'topologies')
+MAX_QUERY_TERMS = 8
+TOPOLOGY_CANDIDATE_LIMIT = 1000
+MIN_SUBSTRING_LENGTH = 3  # Shorter terms only match whole values and word prefixes
+INDEX_BUILD_BATCH = 5000
+
+# (field, kind of match) -> score; a term counts with its best match
+RANKS = {
+    ('name', 'exact'): 100, ('name', 'prefix'): 80, ('name', 'word'): 60, ('name', 'substring'): 40,
+    ('hostname_ip', 'exact'): 90, ('hostname_ip', 'network'): 85, ('hostname_ip', 'prefix'): 50,
+    ('hostname_ip', 'word'): 30, ('hostname_ip', 'substring'): 30,
+    ('notes', 'word'): 15,
+    ('description', 'word'): 15, ('description', 'substring'): 10,
+}
+
+_WORD = re.compile(r'[a-z0-9]+')
+_PREFIX_END = '\U0010ffff'
+
+_build_lock = threading.Lock()
+_current = {"version": None, "index": None}
+
+
+class SearchQueryError(Exception):
+    """Raised for an empty or malformed search query (HTTP 400)."""
+
+
+def parse_terms(query):
+    terms = [term for term in (query or '').lower().split() if term]
+    if not terms:
+        raise SearchQueryError("q must contain at least one search term")
+    if len(terms) > MAX_QUERY_TERMS:
+        raise SearchQueryError(f"At most {MAX_QUERY_TERMS} search terms are allowed")
+    return terms
+
+
+def parse_types(value):
+    """Parses the comma separated `types` parameter; all types when empty."""
+    if not value:
+        return SEARCH_TYPES
+    types = tuple(t.strip() for t in value.split(',') if t.strip())
+    unknown = [t for t in types if t not in SEARCH_TYPES]
+    if unknown:
+        raise SearchQueryError(f"Unknown search types: {', '.join(unknown)} (use {', '.join(SEARCH_TYPES)})")
+    return types
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _parse_network(term):
+    """The IP network a term denotes ('10.0.0.0/8', or a single address), or None."""
+    if not any(ch.isdigit() for ch in term) or not ('.' in term or ':' in term):
+        return None
+    try:
+        return ipaddress.ip_network(term, strict=False)
+    except ValueError:
+        return None
+
+
+class _SortedKeys:
+    """(key, position) pairs sorted by key, as parallel sequences."""
+
+    def __init__(self, pairs):
+        pairs.sort()
+        self.keys = [key for key, _ in pairs]
+        self.positions = array('l', [position for _, position in pairs])
+
+    def range(self, low, high):
+        return self.positions[bisect_left(self.keys, low):bisect_right(self.keys, high)]
+
+    def exact(self, term):
+        return self.range(term, term)
+
+    def prefix(self, term):
+        return self.range(term, term + _PREFIX_END)
+
+
+class _WordIndex:
+    """Word -> positions, with the words sorted for prefix lookups."""
+
+    def __init__(self):
+        self.postings = {}
+        self.words = []
+
+    def add(self, text, position):
+        for word in set(_WORD.findall(text)):
+            self.postings.setdefault(word, array('l')).append(position)
+
+    def freeze(self):
+        self.words = sorted(self.postings)
+
+    def prefix(self, term):
+        low = bisect_left(self.words, term)
+        high = bisect_right(self.words, term + _PREFIX_END)
+        return [self.postings[word] for word in self.words[low:high]]
+
+
+class ConfigSearchIndex:
+    def __init__(self, rows):
+        self.ids = array('l')
+        self.rows = []  # (name, hostname_ip, device_type_name) for the results
+        self.names = []  # Lowercased; also the tie-breaker between equal scores
+        self.hosts = []
+        self.words = {'name': _WordIndex(), 'hostname_ip': _WordIndex(), 'notes': _WordIndex()}
+        self.trigrams = {}  # trigram -> array of positions (name or hostname)
+        names, hosts, addresses = [], [], {4: [], 6: []}
+
+        for position, (config_id, name, hostname_ip, notes, type_name) in enumerate(rows):
+            name_l, host_l = (name or '').lower(), (hostname_ip or '').lower()
+            self.ids.append(config_id)
+            self.rows.append((name, hostname_ip, type_name or "Unknown"))
+            self.names.append(name_l)
+            self.hosts.append(host_l)
+            names.append((name_l, position))
+            hosts.append((host_l, position))
+            self.words['name'].add(name_l, position)
+            self.words['hostname_ip'].add(host_l, position)
+            self.words['notes'].add((notes or '').lower(), position)
+            for gram in _trigrams(name_l) | _trigrams(host_l):
+                self.trigrams.setdefault(gram, array('l')).append(position)
+            try:
+                address = ipaddress.ip_address(host_l)
+            except ValueError:
+                continue
+            addresses[address.version].append((int(address), position))
+
+        self.values = {'name': _SortedKeys(names), 'hostname_ip': _SortedKeys(hosts)}
+        for words in self.words.values():
+            words.freeze()
+        # Keys stay plain ints: IPv6 addresses do not fit an array typecode
+        self.addresses = {version: _SortedKeys(pairs) for version, pairs in addresses.items()}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _substring_candidates(self, term):
+        grams = sorted(_trigrams(term), key=lambda g: len(self.trigrams.get(g, ())))
+        if not grams or grams[0] not in self.trigrams:
+            return set()
+        found = set(self.trigrams[grams[0]])
+        for gram in grams[1:]:
+            found.intersection_update(self.trigrams[gram])
+            if not found:
+                break
+        return found
+
+    def _match_term(self, term):
+        """{position: (score, matched fields)} of the configs matching one term."""
+        best = {}
+
+        def mark(positions, field, kind):
+            score = RANKS[(field, kind)]
+            for position in positions:
+                match = best.get(position)
+                if match is None:
+                    best[position] = (score, {field})
+                else:
+                    match[1].add(field)
+                    if score > match[0]:
+                        best[position] = (score, match[1])
+
+        for field, values in self.values.items():
+            mark(values.exact(term), field, 'exact')
+            mark(values.prefix(term), field, 'prefix')
+        for field, words in self.words.items():
+            for postings in words.prefix(term):
+                mark(postings, field, 'word')
+        network = _parse_network(term)
+        if network is not None:
+            mark(self.addresses[network.version].range(int(network.network_address),
+                                                       int(network.broadcast_address)), 'hostname_ip', 'network')
+        if len(term) >= MIN_SUBSTRING_LENGTH:
+            candidates = self._substring_candidates(term)
+            mark([p for p in candidates if term in self.names[p]], 'name', 'substring')
+            mark([p for p in candidates if term in self.hosts[p]], 'hostname_ip', 'substring')
+        return best
+
+    def search(self, terms):
+        """{position: (score, matched fields)} of the configs matching every term."""
+        matches = None
+        for term in terms:
+            term_matches = self._match_term(term)
+            if matches is None:
+                matches = term_matches
+            else:
+                matches = {position: (score + term_matches[position][0], fields | term_matches[position][1])
+                           for position, (score, fields) in matches.items() if position in term_matches}
+            if not matches:
+                break
+        return matches or {}
+
+    def result(self, position, score, fields):
+        name, hostname_ip, type_name = self.rows[position]
+        return {"type": "device_config", "id": self.ids[position], "name": name, "hostname_ip": hostname_ip,
+                "device_type_name": type_name, "score": score, "matched": sorted(fields)}
+
+
+def _build_config_index():
+    rows = (db.session.query(DeviceConfig.id, DeviceConfig.name, DeviceConfig.hostname_ip, DeviceConfig.notes,
+                             DeviceType.name)
+            .outerjoin(DeviceType, DeviceConfig.device_type_id == DeviceType.id)
+            .order_by(DeviceConfig.id))
+    return ConfigSearchIndex(rows.yield_per(INDEX_BUILD_BATCH))
+
+
+def config_index():
+    """The index for the current catalog version; a stale one is served while another thread rebuilds."""
+    version = catalog_version()
+    index = _current["index"]
+    if _current["version"] == version:
+        return index
+    if not _build_lock.acquire(blocking=index is None):
+        return index
+    try:
+        if _current["version"] != version:
+            _current["index"], _current["version"] = _build_config_index(), version
+        return _current["index"]
+    finally:
+        _build_lock.release()
+
+
+def reset_index():
+    with _build_lock:
+        _current["index"] = _current["version"] = None
+
+
+def _topology_term_score(name, description, term):
+    """(score, matched fields) of one term against a lowercased topology name and description."""
+    if name == term:
+        name_kind = 'exact'
+    elif name.startswith(term):
+        name_kind = 'prefix'
+    elif any(word.startswith(term) for word in _WORD.findall(name)):
+        name_kind = 'word'
+    else:
+        name_kind = 'substring' if term in name else None
+    if any(word.startswith(term) for word in _WORD.findall(description)):
+        description_kind = 'word'
+    else:
+        description_kind = 'substring' if term in description else None
+
+    scores = {}
+    if name_kind:
+        scores['name'] = RANKS[('name', name_kind)]
+    if description_kind:
+        scores['description'] = RANKS[('description', description_kind)]
+    return max(scores.values(), default=0), set(scores)
+
+
+def _sql_term_score(name, description, term):
+    """SQL estimate of _topology_term_score: every name tier outranks every description tier."""
+    escaped = escape_like(term)
+
+    def like(column, pattern):
+        return column.like(pattern, escape='\\')
+
+    return case(
+        (name == term, RANKS[('name', 'exact')]),
+        (like(name, f"{escaped}%"), RANKS[('name', 'prefix')]),
+        (like(name, f"% {escaped}%"), RANKS[('name', 'word')]),
+        (like(name, f"%{escaped}%"), RANKS[('name', 'substring')]),
+        (db.or_(like(description, f"{escaped}%"), like(description, f"% {escaped}%")), RANKS[('description', 'word')]),
+        (like(description, f"%{escaped}%"), RANKS[('description', 'substring')]),
+        else_=0,
+    )
+
+
+def search_topologies(user_id, terms):
+    """([(score, lowercased name, result)], truncated) of the user's topologies matching every term.
+
+    `truncated` is set when more than TOPOLOGY_CANDIDATE_LIMIT topologies
+    matched; the best-ranked candidates are the ones kept.
+    """
+    name = func.lower(func.coalesce(LabTopology.name, ''))
+    description = func.lower(func.coalesce(LabTopology.description, ''))
+    query = LabTopology.query.filter_by(user_id=user_id)
+    for term in terms:
+        pattern = f"%{escape_like(term)}%"
+        query = query.filter(db.or_(name.like(pattern, escape='\\'), description.like(pattern, escape='\\')))
+    estimate = sum(_sql_term_score(name, description, term) for term in terms)
+    candidates = query.order_by(estimate.desc(), name, LabTopology.id).limit(TOPOLOGY_CANDIDATE_LIMIT + 1).all()
+    truncated = len(candidates) > TOPOLOGY_CANDIDATE_LIMIT
+
+    results = []
+    for topology in candidates[:TOPOLOGY_CANDIDATE_LIMIT]:
+        name, description = (topology.name or '').lower(), (topology.description or '').lower()
+        total, fields = 0, set()
+        for term in terms:
+            score, matched = _topology_term_score(name, description, term)
+            if not score:  # LIKE matched across word boundaries the ranking does not count
+                break
+            total += score
+            fields |= matched
+        else:
+            results.append((total, name, {
+                "type": "topology", "id": topology.id, "name": topology.name,
+                "description": topology.description, "updated_at": isoformat(topology.updated_at),
+                "score": total, "matched": sorted(fields)}))
+    return results, truncated
+
+
+def search(user_id, query, types=SEARCH_TYPES, offset=0, limit=20):
+    """Returns (number of matches, the matches offset..offset + limit, truncated), best first.
+
+    `truncated` means some topologies beyond TOPOLOGY_CANDIDATE_LIMIT were
+    not ranked, so the number of matches is a lower bound.
+    """
+    truncated = False
+    terms = parse_terms(query)
+    ranked = []  # (-score, name, kind, id, result or (position, score, fields))
+    index = None
+    if 'device_configs' in types:
+        index = config_index()
+        ranked += [(-score, index.names[position], 0, index.ids[position], (position, score, fields))
+                   for position, (score, fields) in index.search(terms).items()]
+    if 'topologies' in types:
+        topologies, truncated = search_topologies(user_id, terms)
+        ranked += [(-score, name, 1, result["id"], result) for score, name, result in topologies]
+
+    ranked.sort(key=lambda entry: entry[:4])
+    page = [index.result(*item) if kind == 0 else item for _, _, kind, _, item in ranked[offset:offset + limit]]
+    return len(ranked), page, truncated
@@ -0,0 +1,65 @@
+"""Shared helpers for turning database rows into API payloads."""
+
+
+def isoformat(value):
+    return value.isoformat() if value else None
+
+
+def effective_icon_path(config_icon_path, type_icon_path):
+    """A DeviceConfig's own icon wins over the default icon of its DeviceType."""
+    return config_icon_path or type_icon_path
+
+
+def serialize_device_type(device_type):
+    return {"id": device_type.id, "name": device_type.name, "default_icon_path": device_type.default_icon_path}
+
+
+def serialize_device_config(config, device_type):
+    """`device_type` is passed in explicitly so callers control how it was loaded."""
+    return {
+        "id": config.id,
+        "name": config.name,
+        "device_type_id": config.device_type_id,
+        "device_type_name": device_type.name if device_type else "Unknown",
+        "hostname_ip": config.hostname_ip,
+        "default_icon_path": effective_icon_path(config.default_icon_path,
+                                                 device_type.default_icon_path if device_type else None),
+        "notes": config.notes
+    }
+
+
+def serialize_node_row(row):
+    """Builds a React Flow node from a row produced by `topology_reader.NODE_COLUMNS`."""
+    (instance_id, instance_name, canvas_x, canvas_y, device_config_id,
+     config_name, hostname_ip, config_icon_path, type_icon_path) = row
+    return {
+        "id": str(instance_id),
+        "type": 'deviceNode',
+        "position": {"x": canvas_x, "y": canvas_y},
+        "data": {
+            "label": instance_name or config_name,
+            "deviceConfigId": device_config_id,
+            "hostnameIp": hostname_ip,
+            "iconPath": effective_icon_path(config_icon_path, type_icon_path),
+        }
+    }
+
+
+def serialize_edge_row(row):
+    """Builds a React Flow edge from a row produced by `topology_reader.EDGE_COLUMNS`."""
+    connection_id, source_instance_id, target_instance_id = row
+    return {
+        "id": f"edge_{source_instance_id}-{target_instance_id}_{connection_id}",
+        "source": str(source_instance_id),
+        "target": str(target_instance_id),
+    }
+
+
+def serialize_topology_summary(topology):
+    return {
+        "id": topology.id,
+        "name": topology.name,
+        "description": topology.description,
+        "created_at": isoformat(topology.created_at),
+        "updated_at": isoformat(topology.updated_at)
+    }
@@ -0,0 +1,293 @@
+"""Server-side SSH broker for browser terminals.
+
+Authenticated paramiko transports are pooled per (owner, host, port, username,
+credential digest). Reopening a device's terminal opens a new channel on the
+existing transport instead of doing a full SSH handshake. Transports that stay
+without open channels for SSH_POOL_IDLE_TIMEOUT seconds are closed.
+
+Device host keys are checked against the known_hosts file at
+SSH_BROKER_KNOWN_HOSTS (default ~/.ssh/known_hosts); devices without a
+matching entry are refused. Setting SSH_BROKER_VERIFY_HOST_KEYS to false
+skips the check, e.g. for throwaway lab devices.
+
+paramiko is an optional dependency; `BrokerUnavailable` is raised without it.
+"""
+import codecs
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+
+from flask import current_app
+
+try:
+    import paramiko
+except ImportError:  # pragma: no cover - optional dependency
+    paramiko = None
+
+DEFAULT_IDLE_TIMEOUT = 300.0
+DEFAULT_CONNECT_TIMEOUT = 10.0
+DEFAULT_KNOWN_HOSTS = '~/.ssh/known_hosts'
+
+
+class BrokerUnavailable(Exception):
+    """Raised when the SSH broker cannot be used (paramiko is not installed)."""
+
+
+class BrokerConnectError(Exception):
+    """Raised when the device cannot be reached or rejects the credentials."""
+
+
+class KnownHostsPolicy:
+    """Accepts a device only if its host key matches an entry of a known_hosts file."""
+
+    def __init__(self, path=DEFAULT_KNOWN_HOSTS):
+        self.path = os.path.expanduser(path)
+        self._keys = None
+        self._lock = threading.Lock()
+
+    def _known_keys(self):
+        with self._lock:
+            if self._keys is None:
+                self._keys = paramiko.HostKeys()
+                if os.path.exists(self.path):
+                    self._keys.load(self.path)
+            return self._keys
+
+    def __call__(self, host, port, key):
+        name = host if port == 22 else f"[{host}]:{port}"
+        known = self._known_keys().lookup(name)
+        if known is None:
+            raise BrokerConnectError(f"Host key of {host}:{port} is not in {self.path}")
+        if known.get(key.get_name()) != key:
+            raise BrokerConnectError(f"Host key of {host}:{port} does not match {self.path}")
+
+
+def accept_any_host_key(host, port, key):
+    """Host key policy that skips verification (SSH_BROKER_VERIFY_HOST_KEYS = False)."""
+
+
+class _PooledTransport:
+    __slots__ = ('transport', 'channels', 'idle_since')
+
+    def __init__(self, transport):
+        self.transport = transport
+        self.channels = 0
+        self.idle_since = time.monotonic()
+
+
+class TransportPool:
+    """Authenticated transports shared by the terminals of one owner.
+
+    `host_key_policy(host, port, key)` raises BrokerConnectError to refuse a
+    device; the default is KnownHostsPolicy() on ~/.ssh/known_hosts.
+    """
+
+    def __init__(self, idle_timeout=DEFAULT_IDLE_TIMEOUT, connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 host_key_policy=None):
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        self.host_key_policy = host_key_policy or KnownHostsPolicy()
+        self._lock = threading.Lock()
+        self._connecting = {}  # key -> Lock, so concurrent opens share one handshake
+        self._entries = {}
+        self._reaper = None
+
+    @staticmethod
+    def pool_key(owner_id, host, port, username, secret):
+        # Only the holder of the same secret may reuse an authenticated transport.
+        digest = hmac.new(b'ssh-broker', (secret or '').encode(), hashlib.sha256).hexdigest()
+        return (str(owner_id), host, port, username, digest)
+
+    def _connect(self, host, port, username, password=None, pkey=None):
+        try:
+            transport = paramiko.Transport((host, port))
+        except (paramiko.SSHException, OSError) as e:
+            raise BrokerConnectError(f"SSH connection to {host}:{port} failed: {e}")
+        try:
+            transport.banner_timeout = self.connect_timeout
+            transport.start_client(timeout=self.connect_timeout)
+            self.host_key_policy(host, port, transport.get_remote_server_key())
+            if pkey is not None:
+                transport.auth_publickey(username, pkey)
+            else:
+                transport.auth_password(username, password or '')
+        except BrokerConnectError:
+            transport.close()
+            raise
+        except (paramiko.SSHException, OSError) as e:
+            transport.close()
+            raise BrokerConnectError(f"SSH connection to {host}:{port} failed: {e}")
+        transport.set_keepalive(30)
+        return transport
+
+    def _transport(self, key, host, port, username, password, pkey):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.transport.is_active():
+                entry.channels += 1
+                return entry
+            connect_lock = self._connecting.setdefault(key, threading.Lock())
+
+        with connect_lock:
+            try:
+                with self._lock:
+                    entry = self._entries.get(key)
+                    if entry is not None and entry.transport.is_active():
+                        entry.channels += 1
+                        return entry
+                transport = self._connect(host, port, username, password, pkey)
+                with self._lock:
+                    entry = self._entries[key] = _PooledTransport(transport)
+                    entry.channels += 1
+                    self._ensure_reaper()
+                    return entry
+            finally:
+                # Opens already waiting on this lock find the entry; later ones start from _entries
+                with self._lock:
+                    if self._connecting.get(key) is connect_lock:
+                        del self._connecting[key]
+
+    def _ensure_reaper(self):
+        # Called with the lock held; the reaper exits once the pool is empty.
+        if self._reaper is None or not self._reaper.is_alive():
+            self._reaper = threading.Thread(target=self._reap, name='ssh-broker-reaper', daemon=True)
+            self._reaper.start()
+
+    def _reap(self):
+        while True:
+            time.sleep(max(self.idle_timeout / 2, 1.0))
+            self.evict_idle()
+            with self._lock:
+                if not self._entries:
+                    self._reaper = None
+                    return
+
+    def open_shell(self, owner_id, host, port, username, password=None, pkey=None,
+                   term='xterm', width=80, height=24):
+        """Returns (channel, release) for an interactive PTY shell on the device.
+
+        `release()` must be called when the terminal closes; the transport then
+        stays pooled until it has been idle for `idle_timeout` seconds.
+        """
+        if paramiko is None:
+            raise BrokerUnavailable("paramiko is not installed")
+        self.evict_idle()
+        key = self.pool_key(owner_id, host, port, username, password if pkey is None else pkey.get_base64())
+        entry = self._transport(key, host, port, username, password, pkey)
+        try:
+            channel = entry.transport.open_session(timeout=self.connect_timeout)
+            channel.get_pty(term=term, width=width, height=height)
+            channel.invoke_shell()
+        except (paramiko.SSHException, OSError) as e:
+            self._release(entry)
+            raise BrokerConnectError(f"Could not open a shell on {host}:{port}: {e}")
+
+        released = []
+
+        def release():
+            if not released:
+                released.append(True)
+                channel.close()
+                self._release(entry)
+        return channel, release
+
+    def _release(self, entry):
+        with self._lock:
+            entry.channels -= 1
+            if entry.channels <= 0:
+                entry.channels = 0
+                entry.idle_since = time.monotonic()
+
+    def evict_idle(self):
+        """Closes transports that have had no channels for longer than idle_timeout."""
+        now = time.monotonic()
+        evicted = []
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                dead = not entry.transport.is_active()
+                idle = entry.channels == 0 and now - entry.idle_since >= self.idle_timeout
+                if dead or idle:
+                    evicted.append(self._entries.pop(key).transport)
+        for transport in evicted:
+            transport.close()
+        return len(evicted)
+
+    def close_all(self):
+        with self._lock:
+            entries, self._entries = list(self._entries.values()), {}
+        for entry in entries:
+            entry.transport.close()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+def broker_pool(app=None):
+    """Lazily creates (once per app) the transport pool configured from the app config."""
+    app = app or current_app._get_current_object()
+    pool = app.extensions.get('ssh_broker')
+    if pool is None:
+        config = app.config
+        if config.get('SSH_BROKER_VERIFY_HOST_KEYS', True):
+            policy = KnownHostsPolicy(config.get('SSH_BROKER_KNOWN_HOSTS', DEFAULT_KNOWN_HOSTS))
+        else:
+            policy = accept_any_host_key
+        pool = TransportPool(idle_timeout=config.get('SSH_POOL_IDLE_TIMEOUT', DEFAULT_IDLE_TIMEOUT),
+                             connect_timeout=config.get('SSH_BROKER_CONNECT_TIMEOUT', DEFAULT_CONNECT_TIMEOUT),
+                             host_key_policy=policy)
+        pool = app.extensions.setdefault('ssh_broker', pool)
+    return pool
+
+
+def relay(ws, channel, poll_interval=0.5):
+    """Pumps a shell channel to a WebSocket until either side closes.
+
+    Client frames are JSON: {"type": "input", "data": "..."} or
+    {"type": "resize", "cols": 120, "rows": 40}. Terminal output is sent as
+    text frames; a reader thread keeps output flowing while input blocks.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')('replace')
+    closed = threading.Event()
+
+    def pump_output():
+        try:
+            while not closed.is_set():
+                data = channel.recv(32768)
+                if not data:
+                    break
+                text = decoder.decode(data)
+                if text:
+                    ws.send(text)
+        except Exception:  # Socket closed under us; the input loop notices as well
+            pass
+        finally:
+            closed.set()
+
+    reader = threading.Thread(target=pump_output, name='ssh-broker-relay', daemon=True)
+    reader.start()
+    try:
+        while not closed.is_set():
+            message = ws.receive(timeout=poll_interval)
+            if message is None:
+                continue
+            try:
+                frame = json.loads(message)
+            except ValueError:
+                continue
+            if not isinstance(frame, dict):
+                continue
+            if frame.get('type') == 'input' and isinstance(frame.get('data'), str):
+                channel.sendall(frame['data'].encode('utf-8'))
+            elif frame.get('type') == 'resize':
+                try:
+                    channel.resize_pty(width=int(frame.get('cols', 80)), height=int(frame.get('rows', 24)))
+                except (TypeError, ValueError):
+                    continue
+    finally:
+        closed.set()
+        channel.close()
+        reader.join(timeout=poll_interval)
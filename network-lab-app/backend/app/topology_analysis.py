@@ -0,0 +1,246 @@
+"""Graph analytics over the connections of a topology.
+
+The graph is built once per topology revision into a compact CSR structure
+(flat `array` buffers of offsets, neighbours and edge ids) and kept in a small
+LRU cache. All queries are iterative O(V + E) traversals, so they work for
+10k-node labs without recursion limits or per-node Python objects.
+"""
+import threading
+from array import array
+from collections import OrderedDict, deque
+
+from .models import db, LabDeviceInstance, LabConnection
+from .topology_revisions import current_revision
+
+ANALYSIS_CACHE_SIZE = 32
+ANALYSIS_METRICS = ('components', 'cycles', 'articulation_points', 'degree')
+
+_cache_lock = threading.Lock()
+_graph_cache = OrderedDict()  # (topology_id, revision) -> AdjacencyGraph
+
+
+class AdjacencyGraph:
+    """Undirected multigraph in CSR form; vertices are 0..n-1, `ids` maps them back to instance ids."""
+
+    def __init__(self, instance_ids, connections):
+        self.ids = array('l', instance_ids)
+        self.index = {instance_id: i for i, instance_id in enumerate(instance_ids)}
+        n = len(instance_ids)
+
+        endpoints = [(self.index[s], self.index[t]) for s, t in connections
+                     if s in self.index and t in self.index]
+        self.edge_count = len(endpoints)
+
+        degree = array('l', [0]) * n
+        for u, v in endpoints:
+            degree[u] += 1
+            degree[v] += 1
+
+        self.offsets = array('l', [0]) * (n + 1)
+        for i in range(n):
+            self.offsets[i + 1] = self.offsets[i] + degree[i]
+        self.degree = degree
+
+        self.neighbors = array('l', [0]) * (2 * self.edge_count)
+        self.edge_of = array('l', [0]) * (2 * self.edge_count)
+        cursor = self.offsets[:n]
+        for edge, (u, v) in enumerate(endpoints):
+            self.neighbors[cursor[u]] = v
+            self.edge_of[cursor[u]] = edge
+            cursor[u] += 1
+            self.neighbors[cursor[v]] = u
+            self.edge_of[cursor[v]] = edge
+            cursor[v] += 1
+
+    def __len__(self):
+        return len(self.ids)
+
+    def connected_components(self):
+        """Returns a list of components, each a list of vertex indices."""
+        seen = bytearray(len(self))
+        components = []
+        offsets, neighbors = self.offsets, self.neighbors
+        for start in range(len(self)):
+            if seen[start]:
+                continue
+            seen[start] = 1
+            component = [start]
+            queue = deque([start])
+            while queue:
+                v = queue.popleft()
+                for pos in range(offsets[v], offsets[v + 1]):
+                    w = neighbors[pos]
+                    if not seen[w]:
+                        seen[w] = 1
+                        component.append(w)
+                        queue.append(w)
+            components.append(component)
+        return components
+
+    def shortest_path(self, source, target):
+        """Fewest-hops path between two vertex indices, or None if they are not connected."""
+        if source == target:
+            return [source]
+        parent = array('l', [-1]) * len(self)
+        parent[source] = source
+        queue = deque([source])
+        offsets, neighbors = self.offsets, self.neighbors
+        while queue:
+            v = queue.popleft()
+            for pos in range(offsets[v], offsets[v + 1]):
+                w = neighbors[pos]
+                if parent[w] == -1:
+                    parent[w] = v
+                    if w == target:
+                        path = [w]
+                        while path[-1] != source:
+                            path.append(parent[path[-1]])
+                        return path[::-1]
+                    queue.append(w)
+        return None
+
+    def find_cycle(self):
+        """Returns one cycle as a list of vertex indices, or None if the graph is a forest."""
+        n = len(self)
+        parent = array('l', [-1]) * n
+        parent_edge = array('l', [-1]) * n
+        depth = array('l', [0]) * n
+        seen = bytearray(n)
+        offsets, neighbors, edge_of = self.offsets, self.neighbors, self.edge_of
+        for root in range(n):
+            if seen[root]:
+                continue
+            seen[root] = 1
+            queue = deque([root])
+            while queue:
+                v = queue.popleft()
+                for pos in range(offsets[v], offsets[v + 1]):
+                    w, edge = neighbors[pos], edge_of[pos]
+                    if edge == parent_edge[v]:
+                        continue
+                    if not seen[w]:
+                        seen[w] = 1
+                        parent[w], parent_edge[w], depth[w] = v, edge, depth[v] + 1
+                        queue.append(w)
+                        continue
+                    # Non-tree edge v-w closes a cycle through their lowest common ancestor.
+                    left, right = [v], [w]
+                    a, b = v, w
+                    while depth[a] > depth[b]:
+                        a = parent[a]
+                        left.append(a)
+                    while depth[b] > depth[a]:
+                        b = parent[b]
+                        right.append(b)
+                    while a != b:
+                        a, b = parent[a], parent[b]
+                        left.append(a)
+                        right.append(b)
+                    right.pop()  # The common ancestor is already the last entry of `left`
+                    return left + right[::-1] if v != w else [v]
+        return None
+
+    def articulation_points(self):
+        """Vertices whose removal disconnects their component (iterative Tarjan)."""
+        n = len(self)
+        disc = array('l', [-1]) * n
+        low = array('l', [0]) * n
+        is_cut = bytearray(n)
+        offsets, neighbors, edge_of = self.offsets, self.neighbors, self.edge_of
+        timer = 0
+        for root in range(n):
+            if disc[root] != -1:
+                continue
+            disc[root] = low[root] = timer
+            timer += 1
+            root_children = 0
+            stack = [[root, -1, offsets[root]]]  # vertex, edge used to reach it, next adjacency slot
+            while stack:
+                frame = stack[-1]
+                v, via_edge, pos = frame
+                if pos < offsets[v + 1]:
+                    frame[2] = pos + 1
+                    w, edge = neighbors[pos], edge_of[pos]
+                    if edge == via_edge:
+                        continue
+                    if disc[w] == -1:
+                        disc[w] = low[w] = timer
+                        timer += 1
+                        if v == root:
+                            root_children += 1
+                        stack.append([w, edge, offsets[w]])
+                    elif disc[w] < low[v]:
+                        low[v] = disc[w]
+                else:
+                    stack.pop()
+                    if stack:
+                        u = stack[-1][0]
+                        if low[v] < low[u]:
+                            low[u] = low[v]
+                        if u != root and low[v] >= disc[u]:
+                            is_cut[u] = 1
+            if root_children > 1:
+                is_cut[root] = 1
+        return [v for v in range(n) if is_cut[v]]
+
+
+def load_graph(topology_id):
+    """Returns the AdjacencyGraph of a topology, built at most once per revision."""
+    key = (topology_id, current_revision(topology_id))
+    with _cache_lock:
+        graph = _graph_cache.get(key)
+        if graph is not None:
+            _graph_cache.move_to_end(key)
+            return graph
+
+    instance_ids = [row[0] for row in db.session.query(LabDeviceInstance.id)
+                    .filter(LabDeviceInstance.topology_id == topology_id)
+                    .order_by(LabDeviceInstance.id)]
+    connections = db.session.query(LabConnection.source_instance_id, LabConnection.target_instance_id) \
+        .filter(LabConnection.topology_id == topology_id).all()
+    graph = AdjacencyGraph(instance_ids, connections)
+
+    with _cache_lock:
+        _graph_cache[key] = graph
+        _graph_cache.move_to_end(key)
+        while len(_graph_cache) > ANALYSIS_CACHE_SIZE:
+            _graph_cache.popitem(last=False)
+    return graph
+
+
+def analyze(graph, metrics, source=None, target=None):
+    """Runs the requested analyses; node ids in the result are React Flow (string) ids."""
+    def node_ids(vertices):
+        return [str(graph.ids[v]) for v in vertices]
+
+    result = {"node_count": len(graph), "edge_count": graph.edge_count}
+    components = None
+    if 'components' in metrics or 'cycles' in metrics:
+        components = graph.connected_components()
+    if 'components' in metrics:
+        result["components"] = {
+            "count": len(components),
+            "sizes": sorted((len(c) for c in components), reverse=True),
+            "members": [node_ids(sorted(c)) for c in sorted(components, key=len, reverse=True)],
+        }
+    if 'cycles' in metrics:
+        cycle = graph.find_cycle()
+        result["cycles"] = {
+            "has_cycle": cycle is not None,
+            # Number of independent cycles (cycle space dimension): E - V + C
+            "independent_cycles": graph.edge_count - len(graph) + len(components),
+            "example": node_ids(cycle) if cycle else None,
+        }
+    if 'articulation_points' in metrics:
+        result["articulation_points"] = node_ids(graph.articulation_points())
+    if 'degree' in metrics:
+        result["degree"] = {str(graph.ids[v]): graph.degree[v] for v in range(len(graph))}
+    if source is not None and target is not None:
+        path = graph.shortest_path(graph.index[source], graph.index[target])
+        result["shortest_path"] = {
+            "source": str(source),
+            "target": str(target),
+            "path": node_ids(path) if path else None,
+            "hops": len(path) - 1 if path else None,
+        }
+    return result
@@ -0,0 +1,181 @@
+"""Compact binary export/import of lab topologies.
+
+Layout of an archive (all integers little-endian)::
+
+    b"NLAB" | uint16 format version | zlib(body)
+
+    body = uint32 node_count | uint32 edge_count | uint32 meta_length | meta JSON
+           | int32[node_count] device_config_ids
+           | int32[node_count] canvas_x | int32[node_count] canvas_y
+           | int32[edge_count] source node indexes | int32[edge_count] target node indexes
+
+Nodes are stored column by column and edges as pairs of indexes into the node
+columns, so archives do not depend on database ids. The meta JSON holds the
+topology name/description and the (usually few) non-empty instance names as a
+sparse {index: name} map. A 50k-node lab packs to a few hundred KB.
+"""
+import struct
+import sys
+import zlib
+from array import array
+
+from .json_provider import dumps_bytes, loads
+from .models import db, LabTopology, LabDeviceInstance, LabConnection
+from .topology_writer import existing_device_config_ids
+
+ARCHIVE_MAGIC = b'NLAB'
+ARCHIVE_FORMAT_VERSION = 1
+ARCHIVE_MIMETYPE = 'application/vnd.network-lab.topology'
+ARCHIVE_INSERT_CHUNK_SIZE = 5000
+ARCHIVE_MAX_BODY_SIZE = 256 * 1024 * 1024  # Guards against decompression bombs
+
+_PREAMBLE = struct.Struct('<4sH')
+_COUNTS = struct.Struct('<III')
+_INT32_MIN, _INT32_MAX = -2 ** 31, 2 ** 31 - 1
+
+
+class ArchiveError(Exception):
+    """Raised when an archive is malformed, of an unknown version or references unknown configs."""
+
+
+def _int32_column(values):
+    column = array('i', values)
+    if sys.byteorder == 'big':
+        column.byteswap()
+    return column.tobytes()
+
+
+def _read_int32_column(body, offset, count):
+    end = offset + 4 * count
+    if end > len(body):
+        raise ArchiveError("Archive is truncated")
+    column = array('i')
+    column.frombytes(body[offset:end])
+    if sys.byteorder == 'big':
+        column.byteswap()
+    return column, end
+
+
+def _coordinate(value):
+    return min(max(int(round(value or 0)), _INT32_MIN), _INT32_MAX)
+
+
+def export_topology(topology):
+    """Packs a topology's graph into the binary archive format (two column queries)."""
+    nodes = db.session.query(
+        LabDeviceInstance.id, LabDeviceInstance.device_config_id, LabDeviceInstance.instance_name,
+        LabDeviceInstance.canvas_x, LabDeviceInstance.canvas_y
+    ).filter(LabDeviceInstance.topology_id == topology.id).order_by(LabDeviceInstance.id).all()
+    edges = db.session.query(LabConnection.source_instance_id, LabConnection.target_instance_id) \
+        .filter(LabConnection.topology_id == topology.id).order_by(LabConnection.id).all()
+
+    index_of = {node.id: i for i, node in enumerate(nodes)}
+    edge_pairs = [(index_of[s], index_of[t]) for s, t in edges if s in index_of and t in index_of]
+    meta = {
+        "name": topology.name,
+        "description": topology.description,
+        "names": {str(i): node.instance_name for i, node in enumerate(nodes) if node.instance_name},
+    }
+    meta_bytes = dumps_bytes(meta)
+
+    body = b''.join((
+        _COUNTS.pack(len(nodes), len(edge_pairs), len(meta_bytes)),
+        meta_bytes,
+        _int32_column(node.device_config_id for node in nodes),
+        _int32_column(_coordinate(node.canvas_x) for node in nodes),
+        _int32_column(_coordinate(node.canvas_y) for node in nodes),
+        _int32_column(s for s, _ in edge_pairs),
+        _int32_column(t for _, t in edge_pairs),
+    ))
+    return _PREAMBLE.pack(ARCHIVE_MAGIC, ARCHIVE_FORMAT_VERSION) + zlib.compress(body, 6)
+
+
+def decode_archive(data):
+    """Returns (meta, config_ids, xs, ys, sources, targets) from archive bytes."""
+    if len(data) < _PREAMBLE.size:
+        raise ArchiveError("Not a topology archive")
+    magic, version = _PREAMBLE.unpack_from(data)
+    if magic != ARCHIVE_MAGIC:
+        raise ArchiveError("Not a topology archive")
+    if version != ARCHIVE_FORMAT_VERSION:
+        raise ArchiveError(f"Unsupported archive format version: {version}")
+    decompressor = zlib.decompressobj()
+    try:
+        body = decompressor.decompress(data[_PREAMBLE.size:], ARCHIVE_MAX_BODY_SIZE)
+    except zlib.error:
+        raise ArchiveError("Archive body is corrupt")
+    if decompressor.unconsumed_tail:
+        raise ArchiveError("Archive is too large")
+    if not decompressor.eof:
+        raise ArchiveError("Archive is truncated")
+
+    if len(body) < _COUNTS.size:
+        raise ArchiveError("Archive is truncated")
+    node_count, edge_count, meta_length = _COUNTS.unpack_from(body)
+    offset = _COUNTS.size + meta_length
+    try:
+        meta = loads(body[_COUNTS.size:offset])
+    except ValueError:
+        raise ArchiveError("Archive metadata is corrupt")
+    if not isinstance(meta, dict):
+        raise ArchiveError("Archive metadata is corrupt")
+
+    config_ids, offset = _read_int32_column(body, offset, node_count)
+    xs, offset = _read_int32_column(body, offset, node_count)
+    ys, offset = _read_int32_column(body, offset, node_count)
+    sources, offset = _read_int32_column(body, offset, edge_count)
+    targets, offset = _read_int32_column(body, offset, edge_count)
+    if offset != len(body):
+        raise ArchiveError("Archive has trailing data")
+    if edge_count and not (0 <= min(min(sources), min(targets)) and max(max(sources), max(targets)) < node_count):
+        raise ArchiveError("Archive edge references a missing node")
+    return meta, config_ids, xs, ys, sources, targets
+
+
+def _bulk_insert(model, rows, return_defaults=False):
+    """Inserts `rows` in chunks; with `return_defaults` each row dict receives its new "id"."""
+    for start in range(0, len(rows), ARCHIVE_INSERT_CHUNK_SIZE):
+        db.session.bulk_insert_mappings(model, rows[start:start + ARCHIVE_INSERT_CHUNK_SIZE],
+                                        return_defaults=return_defaults)
+
+
+def import_topology(data, user_id, name=None):
+    """Creates a new topology owned by `user_id` from archive bytes; the caller commits.
+
+    Instances and connections are written with chunked bulk INSERTs. The
+    instance INSERTs return the generated id of every row, so edges are
+    remapped per row rather than by assuming ids follow insertion order.
+    """
+    meta, config_ids, xs, ys, sources, targets = decode_archive(data)
+
+    names = meta.get('names') or {}
+    if not isinstance(names, dict) or not all(isinstance(value, str) for value in names.values()):
+        raise ArchiveError("Archive instance names are corrupt")
+    if any(not isinstance(meta.get(field), (str, type(None))) for field in ('name', 'description')):
+        raise ArchiveError("Archive name and description must be strings")
+
+    distinct_config_ids = set(config_ids)
+    missing = distinct_config_ids - existing_device_config_ids(distinct_config_ids)
+    if missing:
+        raise ArchiveError(f"Unknown device_config_ids: {sorted(missing)[:20]}")
+
+    topology_name = name or meta.get('name')
+    if not topology_name:
+        raise ArchiveError("Topology name is required")
+    topology = LabTopology(name=topology_name, description=meta.get('description'), user_id=user_id)
+    db.session.add(topology)
+    db.session.flush()
+
+    instance_rows = [
+        {"topology_id": topology.id, "device_config_id": config_id,
+         "instance_name": names.get(str(i)), "canvas_x": x, "canvas_y": y}
+        for i, (config_id, x, y) in enumerate(zip(config_ids, xs, ys))
+    ]
+    _bulk_insert(LabDeviceInstance, instance_rows, return_defaults=True)
+    instance_ids = [row["id"] for row in instance_rows]
+    _bulk_insert(LabConnection, [
+        {"topology_id": topology.id, "source_instance_id": instance_ids[s],
+         "target_instance_id": instance_ids[t]}
+        for s, t in zip(sources, targets)
+    ])
+    return topology
@@ -0,0 +1,103 @@
+"""Change feed for polling clients.
+
+Every recorded revision also stores the compact change that produced it
+(node and edge upserts and deletes, zlib-compressed JSON), written by
+topology_snapshots.record_snapshot. A client that last saw revision N asks
+for the changes since N and gets them merged into one delta. Deleted edges
+keep their endpoints, so clients can remove them by their React Flow id.
+
+Only the last CHANGE_LOG_RETENTION revisions of a topology are kept; older
+rows are compacted away every CHANGE_LOG_COMPACT_EVERY revisions. When the
+requested range is no longer (or was never) fully covered by the log, the
+client is told to reload the whole topology instead.
+
+Change format (JSON keys are strings)::
+
+    {"nodes": {"set": {"<instance_id>": [device_config_id, instance_name, x, y]}, "del": ["<instance_id>"]},
+     "edges": {"set": {"<connection_id>": [source, target]}, "del": {"<connection_id>": [source, target]}}}
+"""
+import zlib
+from datetime import datetime
+
+from .json_provider import dumps_bytes, loads
+from .models import db, LabTopology
+
+CHANGE_LOG_RETENTION = 500
+CHANGE_LOG_COMPACT_EVERY = 50
+
+
+class LabTopologyChange(db.Model):
+    __tablename__ = 'lab_topology_changes'
+    __table_args__ = (db.UniqueConstraint('topology_id', 'revision', name='uq_change_topology_revision'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    topology_id = db.Column(db.Integer, db.ForeignKey(LabTopology.id, ondelete='CASCADE'), nullable=False, index=True)
+    revision = db.Column(db.Integer, nullable=False)
+    payload = db.Column(db.LargeBinary, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+def record_change(topology_id, revision, diff, removed_edges):
+    """Stores the change of `revision` (a topology_snapshots diff).
+
+    `removed_edges` maps (at least) the deleted connection ids to their
+    endpoints. Called by record_snapshot inside the transaction of the write.
+    """
+    change = {
+        "nodes": diff["nodes"],
+        "edges": {"set": diff["edges"]["set"],
+                  "del": {key: removed_edges[key] for key in diff["edges"]["del"]}},
+    }
+    db.session.add(LabTopologyChange(topology_id=topology_id, revision=revision,
+                                     payload=zlib.compress(dumps_bytes(change), 6)))
+    if revision % CHANGE_LOG_COMPACT_EVERY == 0:
+        compact_changes(topology_id, revision - CHANGE_LOG_RETENTION)
+
+
+def compact_changes(topology_id, up_to_revision):
+    """Drops the logged changes of revisions <= `up_to_revision`."""
+    LabTopologyChange.query.filter(
+        LabTopologyChange.topology_id == topology_id,
+        LabTopologyChange.revision <= up_to_revision
+    ).delete(synchronize_session=False)
+
+
+def delete_changes(topology_id):
+    LabTopologyChange.query.filter_by(topology_id=topology_id).delete(synchronize_session=False)
+
+
+def merge_changes(changes):
+    """Folds consecutive changes into one; later changes win."""
+    merged = {"nodes": {"set": {}, "del": set()}, "edges": {"set": {}, "del": {}}}
+    for change in changes:
+        nodes, edges = merged["nodes"], merged["edges"]
+        for key, value in change["nodes"]["set"].items():
+            nodes["set"][key] = value
+            nodes["del"].discard(key)
+        for key in change["nodes"]["del"]:
+            nodes["set"].pop(key, None)
+            nodes["del"].add(key)
+        for key, value in change["edges"]["set"].items():
+            edges["set"][key] = value
+            edges["del"].pop(key, None)
+        for key, value in change["edges"]["del"].items():
+            edges["set"].pop(key, None)
+            edges["del"][key] = value
+    return merged
+
+
+def changes_since(topology_id, since, current):
+    """The merged change from `since` to `current`, or None if the log cannot provide it."""
+    if since == current:
+        return merge_changes([])
+    if since > current or since < 0:
+        return None
+    rows = (db.session.query(LabTopologyChange.revision, LabTopologyChange.payload)
+            .filter(LabTopologyChange.topology_id == topology_id,
+                    LabTopologyChange.revision > since,
+                    LabTopologyChange.revision <= current)
+            .order_by(LabTopologyChange.revision)
+            .all())
+    if len(rows) != current - since:  # Compacted away, or written before the log existed
+        return None
+    return merge_changes(loads(zlib.decompress(payload)) for _, payload in rows)
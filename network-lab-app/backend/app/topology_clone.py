@@ -0,0 +1,146 @@
+"""Server-side copies of topologies: clones and template instantiation.
+
+Copies never leave the database. The new LabTopology rows are inserted in one
+batch, then every instance and every connection of the source is copied to
+all of them with one INSERT ... SELECT per table, so making 200 copies costs
+the same handful of statements as making one.
+
+Connection endpoints are remapped by position: the n-th instance (by id) of
+a copy corresponds to the n-th instance of the source. This relies on ids
+being assigned in the order the SELECT feeds rows to the INSERT, which holds
+for SQLite and PostgreSQL.
+
+Every copy starts at revision 1 with a keyframe of its graph, so its version
+history and change feed work from the start.
+
+A template is a published topology: any user can instantiate it, which
+copies its current graph into new topologies they own. Only administrators
+can instantiate it into other users' accounts.
+"""
+from datetime import datetime
+
+from sqlalchemy import func, insert, select, true
+
+from .models import db, LabTopology, LabDeviceInstance, LabConnection, User
+from .serializers import isoformat
+from .topology_revisions import start_revisions
+from .topology_snapshots import record_keyframes
+
+MAX_COPIES = 500
+COPY_NUMBER_PLACEHOLDER = '{n}'
+
+
+class CloneError(Exception):
+    """Raised when a clone or instantiation request cannot be carried out."""
+
+
+class TopologyTemplate(db.Model):
+    __tablename__ = 'lab_topology_templates'
+
+    id = db.Column(db.Integer, primary_key=True)
+    topology_id = db.Column(db.Integer, db.ForeignKey(LabTopology.id, ondelete='CASCADE'),
+                            nullable=False, unique=True)
+    name = db.Column(db.String(100), nullable=False)
+    description = db.Column(db.Text)
+    created_by_id = db.Column(db.Integer, db.ForeignKey(User.id, ondelete='CASCADE'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+def serialize_template(template):
+    return {
+        "id": template.id,
+        "topology_id": template.topology_id,
+        "name": template.name,
+        "description": template.description,
+        "created_by_id": template.created_by_id,
+        "created_at": isoformat(template.created_at),
+    }
+
+
+def delete_templates(topology_id):
+    """Unpublishes the template of a topology that is being deleted."""
+    TopologyTemplate.query.filter_by(topology_id=topology_id).delete(synchronize_session=False)
+
+
+def copy_names(base_name, count):
+    """Names for `count` copies; '{n}' in `base_name` is replaced by the copy number (1-based)."""
+    if COPY_NUMBER_PLACEHOLDER in base_name:
+        return [base_name.replace(COPY_NUMBER_PLACEHOLDER, str(n)) for n in range(1, count + 1)]
+    if count == 1:
+        return [base_name]
+    return [f"{base_name} #{n}" for n in range(1, count + 1)]
+
+
+def _copy_graph(source_id, target_ids):
+    """Copies the instances and connections of `source_id` into every topology in `target_ids`."""
+    instances = LabDeviceInstance.__table__
+    connections = LabConnection.__table__
+    targets = select(LabTopology.id.label('topology_id')).where(LabTopology.id.in_(target_ids)).subquery()
+
+    db.session.execute(insert(instances).from_select(
+        ['topology_id', 'device_config_id', 'instance_name', 'canvas_x', 'canvas_y'],
+        select(targets.c.topology_id, instances.c.device_config_id, instances.c.instance_name,
+               instances.c.canvas_x, instances.c.canvas_y)
+        .select_from(targets.join(instances, true()))
+        .where(instances.c.topology_id == source_id)
+        .order_by(targets.c.topology_id, instances.c.id)
+    ))
+
+    source_rank = select(
+        instances.c.id, func.row_number().over(order_by=instances.c.id).label('n')
+    ).where(instances.c.topology_id == source_id).cte('source_rank')
+    copy_rank = select(
+        instances.c.id, instances.c.topology_id,
+        func.row_number().over(partition_by=instances.c.topology_id, order_by=instances.c.id).label('n')
+    ).where(instances.c.topology_id.in_(target_ids)).cte('copy_rank')
+    source_from, source_to = source_rank.alias('source_from'), source_rank.alias('source_to')
+    copy_from, copy_to = copy_rank.alias('copy_from'), copy_rank.alias('copy_to')
+
+    db.session.execute(insert(connections).from_select(
+        ['topology_id', 'source_instance_id', 'target_instance_id'],
+        select(copy_from.c.topology_id, copy_from.c.id, copy_to.c.id)
+        .select_from(connections)
+        .join(source_from, source_from.c.id == connections.c.source_instance_id)
+        .join(source_to, source_to.c.id == connections.c.target_instance_id)
+        .join(copy_from, copy_from.c.n == source_from.c.n)
+        .join(copy_to, (copy_to.c.n == source_to.c.n) & (copy_to.c.topology_id == copy_from.c.topology_id))
+        .where(connections.c.topology_id == source_id)
+        .order_by(copy_from.c.topology_id, connections.c.id)
+    ))
+
+
+def clone_topology(source, owner_ids, names, description=None):
+    """Creates one copy of `source` per entry of `owner_ids`/`names`; returns the new topologies.
+
+    Each copy starts at revision 1 with a keyframe snapshot. The caller commits.
+    """
+    if not owner_ids:
+        raise CloneError("At least one copy is required")
+    if len(owner_ids) > MAX_COPIES:
+        raise CloneError(f"At most {MAX_COPIES} copies can be made at once")
+    if any(not name for name in names):
+        raise CloneError("Topology name is required")
+
+    copies = [LabTopology(name=name, description=source.description if description is None else description,
+                          user_id=owner_id)
+              for owner_id, name in zip(owner_ids, names)]
+    db.session.add_all(copies)
+    db.session.flush()  # One batched INSERT; ids are assigned here
+    copy_ids = [copy.id for copy in copies]
+    _copy_graph(source.id, copy_ids)
+    record_keyframes(copy_ids, start_revisions(copy_ids))
+    return copies
+
+
+def parse_user_ids(value):
+    """Validates a `user_ids` body field: a list of integer user ids."""
+    if not isinstance(value, list) or not all(isinstance(i, int) and not isinstance(i, bool) for i in value):
+        raise CloneError("user_ids must be a list of integer user ids")
+    return value
+
+
+def existing_user_ids(user_ids):
+    """Returns the subset of `user_ids` that exist, with one query."""
+    if not user_ids:
+        return set()
+    return {row[0] for row in db.session.query(User.id).filter(User.id.in_(set(user_ids)))}
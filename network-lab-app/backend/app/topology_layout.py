@@ -0,0 +1,197 @@
+"""Automatic canvas layouts computed on the server.
+
+Layouts work on the cached AdjacencyGraph of topology_analysis and return one
+(x, y) per vertex, so labs of thousands of nodes never have to be laid out
+by React Flow in the browser:
+
+* ``grid``: vertices in breadth-first order (neighbours end up close),
+  row-major in a square grid.
+* ``layered``: breadth-first layers from the highest-degree vertex of each
+  component, ordered within a layer by the barycenter of their parents.
+* ``force``: Fruchterman-Reingold with NumPy. Repulsion is exact up to
+  FORCE_EXACT_LIMIT vertices and otherwise estimated against a fresh random
+  sample of FORCE_REPULSION_SAMPLES vertices per iteration, so an iteration
+  costs O(n * samples + E) instead of O(n^2). 10k vertices take a few
+  seconds on one core.
+
+``grid`` and ``layered`` are plain Python (O(V + E)); ``force`` needs the
+optional numpy package and raises LayoutUnavailable without it.
+"""
+import math
+from collections import deque
+
+try:
+    import numpy as np
+except ImportError:  # Optional dependency; only the force layout needs it
+    np = None
+
+LAYOUT_ALGORITHMS = ('force', 'layered', 'grid')
+DEFAULT_SPACING = 150  # Canvas units between neighbouring nodes
+DEFAULT_ITERATIONS = 60
+MAX_ITERATIONS = 500
+FORCE_EXACT_LIMIT = 1000
+FORCE_REPULSION_SAMPLES = 256
+FORCE_CHUNK_PAIRS = 2_000_000  # Bounds the temporary (rows x columns x 2) arrays
+FORCE_GRAVITY = 0.02
+
+
+class LayoutError(Exception):
+    """Raised for invalid layout parameters."""
+
+
+class LayoutUnavailable(LayoutError):
+    """Raised when the requested algorithm needs an optional package that is not installed."""
+
+
+def _bfs_components(graph):
+    """Components in breadth-first order, each started at its highest-degree vertex."""
+    n = len(graph)
+    degree, offsets, neighbors = graph.degree, graph.offsets, graph.neighbors
+    seen = bytearray(n)
+    components = []
+    for start in sorted(range(n), key=lambda v: -degree[v]):
+        if seen[start]:
+            continue
+        seen[start] = 1
+        order, depth = [start], [0]
+        queue = deque([(start, 0)])
+        while queue:
+            v, d = queue.popleft()
+            for pos in range(offsets[v], offsets[v + 1]):
+                w = neighbors[pos]
+                if not seen[w]:
+                    seen[w] = 1
+                    order.append(w)
+                    depth.append(d + 1)
+                    queue.append((w, d + 1))
+        components.append((order, depth))
+    return components
+
+
+def grid_layout(graph, spacing=DEFAULT_SPACING):
+    positions = [(0, 0)] * len(graph)
+    columns = max(1, math.ceil(math.sqrt(len(graph))))
+    order = [v for component, _ in _bfs_components(graph) for v in component]
+    for i, v in enumerate(order):
+        positions[v] = ((i % columns) * spacing, (i // columns) * spacing)
+    return positions
+
+
+def _barycenter(graph, v, slots_above):
+    above = [slots_above[w] for w in graph.neighbors[graph.offsets[v]:graph.offsets[v + 1]] if w in slots_above]
+    return sum(above) / len(above) if above else 0.0
+
+
+def layered_layout(graph, spacing=DEFAULT_SPACING):
+    """Top-down layers per component; components are placed side by side."""
+    positions = [(0, 0)] * len(graph)
+    x_offset = 0
+    for order, depth in _bfs_components(graph):
+        layers = [[] for _ in range(depth[-1] + 1)]
+        for v, d in zip(order, depth):
+            layers[d].append(v)
+        for d in range(1, len(layers)):
+            slots_above = {v: i for i, v in enumerate(layers[d - 1])}
+            layers[d].sort(key=lambda v: _barycenter(graph, v, slots_above))
+
+        width = max(len(layer) for layer in layers)
+        for d, layer in enumerate(layers):
+            indent = (width - len(layer)) * spacing / 2
+            for i, v in enumerate(layer):
+                positions[v] = (round(x_offset + indent + i * spacing), d * spacing)
+        x_offset += (width + 1) * spacing
+    return positions
+
+
+def _repulsion(x, y, others, k2, scale):
+    """Sum of the k^2/d repulsive forces on every vertex from the vertices in `others`."""
+    n = len(x)
+    disp_x, disp_y = np.empty(n), np.empty(n)
+    other_x, other_y = x[others], y[others]
+    rows = max(1, FORCE_CHUNK_PAIRS // max(1, len(others)))
+    for start in range(0, n, rows):
+        stop = start + rows
+        dx = x[start:stop, None] - other_x[None, :]
+        dy = y[start:stop, None] - other_y[None, :]
+        # The self term has dx == dy == 0, so it adds nothing
+        strength = (k2 * scale) / np.maximum(dx * dx + dy * dy, 1e-2)
+        disp_x[start:stop] = (dx * strength).sum(axis=1)
+        disp_y[start:stop] = (dy * strength).sum(axis=1)
+    return disp_x, disp_y
+
+
+def force_layout(graph, spacing=DEFAULT_SPACING, iterations=DEFAULT_ITERATIONS, seed=0):
+    if np is None:
+        raise LayoutUnavailable("The force layout requires the numpy package")
+    n = len(graph)
+    if n == 0:
+        return []
+    rng = np.random.default_rng(seed)
+    degree = np.asarray(graph.degree, dtype=np.int64)
+    sources = np.repeat(np.arange(n), degree)
+    targets = np.asarray(graph.neighbors, dtype=np.int64)
+    keep = sources < targets  # Each edge appears twice in CSR form; self-loops exert no force
+    sources, targets = sources[keep], targets[keep]
+
+    k = float(spacing)
+    k2 = k * k
+    side = math.sqrt(n) * k
+    x, y = rng.uniform(0, side, size=n), rng.uniform(0, side, size=n)
+    temperature = side / 10
+    cooling = temperature / (iterations + 1)
+    exact = n <= FORCE_EXACT_LIMIT
+    everyone = np.arange(n)
+    gravity = FORCE_GRAVITY * math.sqrt(n)
+
+    for _ in range(iterations):
+        if exact:
+            disp_x, disp_y = _repulsion(x, y, everyone, k2, 1.0)
+        else:
+            sample = rng.choice(n, FORCE_REPULSION_SAMPLES, replace=False)
+            disp_x, disp_y = _repulsion(x, y, sample, k2, n / FORCE_REPULSION_SAMPLES)
+
+        dx, dy = x[sources] - x[targets], y[sources] - y[targets]
+        pull = np.sqrt(dx * dx + dy * dy) / k  # |F| = d^2 / k along the edge
+        for disp, delta in ((disp_x, dx), (disp_y, dy)):
+            weights = delta * pull
+            disp -= np.bincount(sources, weights=weights, minlength=n)
+            disp += np.bincount(targets, weights=weights, minlength=n)
+        disp_x -= (x - x.mean()) * gravity
+        disp_y -= (y - y.mean()) * gravity
+
+        length = np.maximum(np.sqrt(disp_x * disp_x + disp_y * disp_y), 1e-9)
+        step = np.minimum(length, temperature) / length
+        x += disp_x * step
+        y += disp_y * step
+        temperature = max(temperature - cooling, k / 10)
+
+    x, y = np.rint(x - x.min()).astype(int), np.rint(y - y.min()).astype(int)
+    return list(zip(x.tolist(), y.tolist()))
+
+
+def parse_layout_options(data):
+    """Validates the algorithm/spacing/iterations of a layout request body."""
+    algorithm = data.get('algorithm') or 'force'
+    if algorithm not in LAYOUT_ALGORITHMS:
+        raise LayoutError(f"Unknown layout algorithm: {algorithm} (use {', '.join(LAYOUT_ALGORITHMS)})")
+    try:
+        spacing = int(data.get('spacing', DEFAULT_SPACING))
+        iterations = int(data.get('iterations', DEFAULT_ITERATIONS))
+    except (TypeError, ValueError):
+        raise LayoutError("spacing and iterations must be integers")
+    if not 10 <= spacing <= 2000:
+        raise LayoutError("spacing must be between 10 and 2000")
+    if not 1 <= iterations <= MAX_ITERATIONS:
+        raise LayoutError(f"iterations must be between 1 and {MAX_ITERATIONS}")
+    return {"algorithm": algorithm, "spacing": spacing, "iterations": iterations}
+
+
+def compute_layout(graph, algorithm, spacing=DEFAULT_SPACING, iterations=DEFAULT_ITERATIONS):
+    """Returns {instance_id: {"x", "y"}} for every node of `graph`."""
+    if algorithm == 'force':
+        positions = force_layout(graph, spacing, iterations)
+    elif algorithm == 'layered':
+        positions = layered_layout(graph, spacing)
+    else:
+        positions = grid_layout(graph, spacing)
+    return {graph.ids[v]: {"x": x, "y": y} for v, (x, y) in enumerate(positions)}
@@ -0,0 +1,88 @@
+from .json_provider import dumps
+from .models import db, LabDeviceInstance, LabConnection, DeviceConfig, DeviceType
+from .serializers import serialize_edge_row, serialize_node_row, serialize_topology_summary
+from .topology_revisions import current_revision
+
+# Column order is the contract with serializers.serialize_node_row / serialize_edge_row.
+NODE_COLUMNS = (
+    LabDeviceInstance.id,
+    LabDeviceInstance.instance_name,
+    LabDeviceInstance.canvas_x,
+    LabDeviceInstance.canvas_y,
+    LabDeviceInstance.device_config_id,
+    DeviceConfig.name,
+    DeviceConfig.hostname_ip,
+    DeviceConfig.default_icon_path,
+    DeviceType.default_icon_path,
+)
+EDGE_COLUMNS = (
+    LabConnection.id,
+    LabConnection.source_instance_id,
+    LabConnection.target_instance_id,
+)
+
+
+def node_rows_query(topology_id):
+    """Instances joined with their config and type; instances without a config are skipped."""
+    return (db.session.query(*NODE_COLUMNS)
+            .join(DeviceConfig, LabDeviceInstance.device_config_id == DeviceConfig.id)
+            .outerjoin(DeviceType, DeviceConfig.device_type_id == DeviceType.id)
+            .filter(LabDeviceInstance.topology_id == topology_id)
+            .order_by(LabDeviceInstance.id))
+
+
+def edge_rows_query(topology_id):
+    return (db.session.query(*EDGE_COLUMNS)
+            .filter(LabConnection.topology_id == topology_id)
+            .order_by(LabConnection.id))
+
+
+def load_topology_detail(topology):
+    """Builds the React Flow payload for a topology in a fixed number of queries.
+
+    One joined query for instances/configs/types and one for connections, no
+    matter how many devices the lab contains. Rows are plain tuples, so no ORM
+    objects or lazy relationships are touched.
+    """
+    payload = serialize_topology_summary(topology)
+    payload["nodes"] = [serialize_node_row(row) for row in node_rows_query(topology.id)]
+    payload["edges"] = [serialize_edge_row(row) for row in edge_rows_query(topology.id)]
+    payload["revision"] = current_revision(topology.id)
+    return payload
+
+
+STREAM_CHUNK_SIZE = 1000
+
+
+def _stream_json_array(rows, serialize_row):
+    """Yields a JSON array body in chunks of STREAM_CHUNK_SIZE rows."""
+    first = True
+    chunk = []
+    for row in rows:
+        chunk.append(dumps(serialize_row(row)))
+        if len(chunk) >= STREAM_CHUNK_SIZE:
+            yield ('' if first else ',') + ','.join(chunk)
+            first = False
+            chunk = []
+    if chunk:
+        yield ('' if first else ',') + ','.join(chunk)
+
+
+def stream_topology_detail(topology):
+    """Generates the same payload as load_topology_detail as a sequence of JSON text chunks.
+
+    Rows are fetched through a server-side cursor (`stream_results`) in batches
+    of STREAM_CHUNK_SIZE and written out as they arrive, so memory stays flat
+    and the first bytes are sent before the whole topology has been read.
+    """
+    header = serialize_topology_summary(topology)
+    header["revision"] = current_revision(topology.id)
+    yield dumps(header)[:-1] + ',"nodes":['
+
+    node_rows = node_rows_query(topology.id).execution_options(stream_results=True).yield_per(STREAM_CHUNK_SIZE)
+    yield from _stream_json_array(node_rows, serialize_node_row)
+    yield '],"edges":['
+
+    edge_rows = edge_rows_query(topology.id).execution_options(stream_results=True).yield_per(STREAM_CHUNK_SIZE)
+    yield from _stream_json_array(edge_rows, serialize_edge_row)
+    yield ']}'
@@ -0,0 +1,89 @@
+from sqlalchemy.exc import IntegrityError
+
+from .models import db, LabTopology
+
+
+class RevisionConflict(Exception):
+    """Raised when a write is based on a revision that is no longer current."""
+
+    def __init__(self, current_revision):
+        super().__init__(f"Topology has changed (current revision is {current_revision})")
+        self.current_revision = current_revision
+
+
+class LabTopologyRevision(db.Model):
+    """Monotonic revision counter per topology, bumped by every graph write.
+
+    Kept in its own table so that bumping it is a single-row UPDATE and does not
+    touch (or lock) the LabTopology row itself. `move_revisions` counts the
+    move-only revisions since the last structural write; a client based on any
+    of them is still current for the purpose of conflict checks.
+    """
+    __tablename__ = 'lab_topology_revisions'
+
+    topology_id = db.Column(db.Integer, db.ForeignKey(LabTopology.id, ondelete='CASCADE'), primary_key=True)
+    revision = db.Column(db.Integer, nullable=False, default=0)
+    move_revisions = db.Column(db.Integer, nullable=False, default=0)
+
+
+def current_revision(topology_id):
+    """Returns the current revision of a topology (0 if it was never saved)."""
+    revision = db.session.query(LabTopologyRevision.revision).filter_by(topology_id=topology_id).scalar()
+    return revision or 0
+
+
+def bump_revision(topology_id, expected=None, structural=True):
+    """Increments the revision of a topology and returns the new value.
+
+    If `expected` is given, the bump only succeeds when no structural write
+    happened after that revision (optimistic concurrency); otherwise
+    RevisionConflict is raised. Writes that only move nodes pass
+    structural=False, so batched drags do not invalidate other clients' base
+    revisions. Must be called inside the transaction that performs the write.
+    """
+    revision = _increment(topology_id, expected, structural)
+    if revision is not None:
+        return revision
+
+    revision = current_revision(topology_id)
+    if revision or (expected is not None and expected != 0):
+        raise RevisionConflict(revision)
+
+    # First write to this topology: create the counter row. A concurrent first
+    # write may create it first; then this write increments that row instead.
+    try:
+        with db.session.begin_nested():
+            db.session.add(LabTopologyRevision(topology_id=topology_id, revision=1,
+                                               move_revisions=0 if structural else 1))
+        return 1
+    except IntegrityError:
+        revision = _increment(topology_id, expected, structural)
+        if revision is None:
+            raise RevisionConflict(current_revision(topology_id))
+        return revision
+
+
+def start_revisions(topology_ids):
+    """Creates the counters of new topologies at revision 1 (one bulk INSERT); returns 1."""
+    db.session.bulk_insert_mappings(LabTopologyRevision, [
+        {"topology_id": topology_id, "revision": 1, "move_revisions": 0} for topology_id in topology_ids
+    ])
+    return 1
+
+
+def _increment(topology_id, expected, structural):
+    """Bumps an existing counter row; returns the new revision, or None if no row matched."""
+    query = LabTopologyRevision.query.filter_by(topology_id=topology_id)
+    if expected is not None:
+        query = query.filter(LabTopologyRevision.revision >= expected,
+                             LabTopologyRevision.revision - LabTopologyRevision.move_revisions <= expected)
+    moves = 0 if structural else LabTopologyRevision.move_revisions + 1
+    updated = query.update({LabTopologyRevision.revision: LabTopologyRevision.revision + 1,
+                            LabTopologyRevision.move_revisions: moves},
+                           synchronize_session=False)
+    return current_revision(topology_id) if updated else None
+
+
+def delete_revision(topology_id):
+    """Removes the revision counter of a topology that is being deleted."""
+    LabTopologyRevision.query.filter_by(topology_id=topology_id).delete(synchronize_session=False)
@@ -0,0 +1,286 @@
+"""Version history for lab topologies.
+
+Every save records a snapshot row. Most rows hold a zlib-compressed delta
+against the previous revision; every KEYFRAME_INTERVAL revisions (or whenever
+a delta would not be much smaller than the full graph) a full keyframe is
+stored instead. Rebuilding any revision therefore costs one keyframe plus at
+most KEYFRAME_INTERVAL - 1 deltas, fetched with two queries.
+
+Edit-sized writes (deltas, moves, layouts) pass the GraphEdit that
+topology_writer filled in, so their delta is built from the touched rows
+alone; only keyframes read the whole graph.
+
+Graph state format (JSON keys are strings)::
+
+    {"nodes": {"<instance_id>": [device_config_id, instance_name, x, y]},
+     "edges": {"<connection_id>": [source_instance_id, target_instance_id]}}
+"""
+import zlib
+from datetime import datetime
+
+from .json_provider import dumps_bytes, loads
+from .models import db, LabTopology, LabDeviceInstance, LabConnection, DeviceConfig, DeviceType
+from .serializers import serialize_edge_row, serialize_node_row
+from .topology_changes import record_change
+
+KEYFRAME_INTERVAL = 20
+EDIT_ROWS_CHUNK_SIZE = 900  # Keeps `IN (...)` lists below SQLite's parameter limit
+KEYFRAME_BATCH_TOPOLOGIES = 50
+
+
+class SnapshotNotFound(Exception):
+    """Raised when the requested revision has no recorded snapshot."""
+
+
+class LabTopologySnapshot(db.Model):
+    __tablename__ = 'lab_topology_snapshots'
+    __table_args__ = (db.UniqueConstraint('topology_id', 'revision', name='uq_snapshot_topology_revision'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    topology_id = db.Column(db.Integer, db.ForeignKey(LabTopology.id, ondelete='CASCADE'), nullable=False, index=True)
+    revision = db.Column(db.Integer, nullable=False)
+    is_keyframe = db.Column(db.Boolean, nullable=False, default=False)
+    payload = db.Column(db.LargeBinary, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class GraphEdit:
+    """The rows an edit-sized write touched, collected by topology_writer."""
+
+    def __init__(self):
+        self.node_ids = set()  # Added, moved or renamed instances
+        self.removed_node_ids = set()
+        self.edge_ids = set()  # Added connections
+        self.removed_edges = {}  # Connection id -> [source, target], read before the delete
+
+
+def _pack(data):
+    return zlib.compress(dumps_bytes(data), 6)
+
+
+def _unpack(payload):
+    return loads(zlib.decompress(payload))
+
+
+def capture_state(topology_id):
+    """Reads the current graph of a topology (two column queries)."""
+    nodes = db.session.query(
+        LabDeviceInstance.id, LabDeviceInstance.device_config_id, LabDeviceInstance.instance_name,
+        LabDeviceInstance.canvas_x, LabDeviceInstance.canvas_y
+    ).filter(LabDeviceInstance.topology_id == topology_id)
+    edges = db.session.query(
+        LabConnection.id, LabConnection.source_instance_id, LabConnection.target_instance_id
+    ).filter(LabConnection.topology_id == topology_id)
+    return {
+        "nodes": {str(i): [config_id, name, x, y] for i, config_id, name, x, y in nodes},
+        "edges": {str(i): [source, target] for i, source, target in edges},
+    }
+
+
+def _chunks(ids):
+    ids = sorted(ids)
+    for start in range(0, len(ids), EDIT_ROWS_CHUNK_SIZE):
+        yield ids[start:start + EDIT_ROWS_CHUNK_SIZE]
+
+
+def edit_diff(topology_id, edit):
+    """The diff of an edit (as diff_states would compute it), reading only the touched rows."""
+    nodes, edges = {}, {}
+    for chunk in _chunks(edit.node_ids):
+        rows = db.session.query(
+            LabDeviceInstance.id, LabDeviceInstance.device_config_id, LabDeviceInstance.instance_name,
+            LabDeviceInstance.canvas_x, LabDeviceInstance.canvas_y
+        ).filter(LabDeviceInstance.topology_id == topology_id, LabDeviceInstance.id.in_(chunk))
+        nodes.update((str(i), [config_id, name, x, y]) for i, config_id, name, x, y in rows)
+    for chunk in _chunks(edit.edge_ids):
+        rows = db.session.query(
+            LabConnection.id, LabConnection.source_instance_id, LabConnection.target_instance_id
+        ).filter(LabConnection.topology_id == topology_id, LabConnection.id.in_(chunk))
+        edges.update((str(i), [source, target]) for i, source, target in rows)
+    removed_nodes = {str(i) for i in edit.removed_node_ids | edit.node_ids} - nodes.keys()
+    return {
+        "nodes": {"set": nodes, "del": sorted(removed_nodes, key=int)},
+        "edges": {"set": edges, "del": sorted((str(i) for i in edit.removed_edges), key=int)},
+    }
+
+
+def diff_states(old, new):
+    """Returns the changes that turn graph state `old` into `new`."""
+    diff = {}
+    for part in ("nodes", "edges"):
+        old_items, new_items = old[part], new[part]
+        changed = {key: value for key, value in new_items.items() if old_items.get(key) != value}
+        removed = [key for key in old_items if key not in new_items]
+        diff[part] = {"set": changed, "del": removed}
+    return diff
+
+
+def apply_diff(state, diff):
+    for part in ("nodes", "edges"):
+        items = state[part]
+        for key in diff[part]["del"]:
+            items.pop(key, None)
+        items.update(diff[part]["set"])
+    return state
+
+
+def materialize(topology_id, revision):
+    """Rebuilds the graph state of a topology at `revision`."""
+    keyframe = (LabTopologySnapshot.query
+                .filter(LabTopologySnapshot.topology_id == topology_id,
+                        LabTopologySnapshot.revision <= revision,
+                        LabTopologySnapshot.is_keyframe.is_(True))
+                .order_by(LabTopologySnapshot.revision.desc())
+                .first())
+    if keyframe is None:
+        raise SnapshotNotFound(f"No snapshot for revision {revision}")
+
+    deltas = (db.session.query(LabTopologySnapshot.revision, LabTopologySnapshot.payload)
+              .filter(LabTopologySnapshot.topology_id == topology_id,
+                      LabTopologySnapshot.revision > keyframe.revision,
+                      LabTopologySnapshot.revision <= revision)
+              .order_by(LabTopologySnapshot.revision)
+              .all())
+    last_revision = deltas[-1].revision if deltas else keyframe.revision
+    if last_revision != revision:
+        raise SnapshotNotFound(f"No snapshot for revision {revision}")
+
+    state = _unpack(keyframe.payload)
+    for delta in deltas:
+        apply_diff(state, _unpack(delta.payload))
+    return state
+
+
+def _store(topology_id, revision, is_keyframe, payload):
+    db.session.add(LabTopologySnapshot(topology_id=topology_id, revision=revision,
+                                       is_keyframe=is_keyframe, payload=payload))
+    return is_keyframe
+
+
+def record_snapshot(topology_id, revision, edit=None):
+    """Stores the snapshot for `revision`, just written by the current transaction.
+
+    With the GraphEdit of an edit-sized write, the delta is read from the
+    touched rows only. Without one, the graph is captured and diffed against
+    the previous revision. Also logs the change for the change feed
+    (topology_changes). Without a previous snapshot, nothing is known about
+    the graph before this write, so a keyframe is stored and the change log
+    gets a gap (clients reload). Returns whether a keyframe was stored.
+    """
+    previous = (db.session.query(db.func.max(LabTopologySnapshot.revision))
+                .filter_by(topology_id=topology_id)
+                .scalar())
+    last_keyframe = (db.session.query(db.func.max(LabTopologySnapshot.revision))
+                     .filter_by(topology_id=topology_id, is_keyframe=True)
+                     .scalar())
+    keyframe_due = last_keyframe is None or revision - last_keyframe >= KEYFRAME_INTERVAL
+
+    if edit is not None and previous == revision - 1:
+        diff = edit_diff(topology_id, edit)
+        record_change(topology_id, revision, diff,
+                      {str(i): ends for i, ends in edit.removed_edges.items()})
+        if keyframe_due:
+            return _store(topology_id, revision, True, _pack(capture_state(topology_id)))
+        return _store(topology_id, revision, False, _pack(diff))
+
+    state = capture_state(topology_id)
+    previous_state = None
+    if previous is not None:
+        try:
+            previous_state = materialize(topology_id, previous)
+        except SnapshotNotFound:
+            pass  # Broken history: store a keyframe and leave a gap in the change log
+    diff = diff_states(previous_state, state) if previous_state is not None else None
+    if diff is not None:
+        record_change(topology_id, revision, diff, previous_state["edges"])
+
+    full = _pack(state)
+    if previous is not None and diff is not None and not keyframe_due:
+        delta = _pack(diff)
+        if len(delta) * 2 < len(full):
+            return _store(topology_id, revision, False, delta)
+    return _store(topology_id, revision, True, full)
+
+
+def record_keyframes(topology_ids, revision):
+    """Stores a keyframe at `revision` for each of many new topologies (e.g. fresh copies).
+
+    The graphs are read and the rows inserted per batch of
+    KEYFRAME_BATCH_TOPOLOGIES topologies: three statements per batch.
+    """
+    topology_ids = sorted(topology_ids)
+    for start in range(0, len(topology_ids), KEYFRAME_BATCH_TOPOLOGIES):
+        batch = topology_ids[start:start + KEYFRAME_BATCH_TOPOLOGIES]
+        states = {topology_id: {"nodes": {}, "edges": {}} for topology_id in batch}
+        nodes = db.session.query(
+            LabDeviceInstance.topology_id, LabDeviceInstance.id, LabDeviceInstance.device_config_id,
+            LabDeviceInstance.instance_name, LabDeviceInstance.canvas_x, LabDeviceInstance.canvas_y
+        ).filter(LabDeviceInstance.topology_id.in_(batch))
+        for topology_id, i, config_id, name, x, y in nodes:
+            states[topology_id]["nodes"][str(i)] = [config_id, name, x, y]
+        edges = db.session.query(
+            LabConnection.topology_id, LabConnection.id, LabConnection.source_instance_id,
+            LabConnection.target_instance_id
+        ).filter(LabConnection.topology_id.in_(batch))
+        for topology_id, i, source, target in edges:
+            states[topology_id]["edges"][str(i)] = [source, target]
+        db.session.bulk_insert_mappings(LabTopologySnapshot, [
+            {"topology_id": topology_id, "revision": revision, "is_keyframe": True,
+             "payload": _pack(state), "created_at": datetime.utcnow()}
+            for topology_id, state in states.items()
+        ])
+
+
+def list_snapshots(topology_id):
+    rows = (db.session.query(LabTopologySnapshot.revision, LabTopologySnapshot.is_keyframe,
+                             LabTopologySnapshot.created_at, db.func.length(LabTopologySnapshot.payload))
+            .filter_by(topology_id=topology_id)
+            .order_by(LabTopologySnapshot.revision.desc())
+            .all())
+    return [{
+        "revision": revision,
+        "is_keyframe": is_keyframe,
+        "created_at": created_at,
+        "stored_bytes": stored_bytes,
+    } for revision, is_keyframe, created_at, stored_bytes in rows]
+
+
+def state_to_react_flow(state):
+    """Turns a graph state into React Flow nodes/edges, loading config details in one query."""
+    config_ids = {node[0] for node in state["nodes"].values()}
+    configs = {}
+    if config_ids:
+        rows = (db.session.query(DeviceConfig.id, DeviceConfig.name, DeviceConfig.hostname_ip,
+                                 DeviceConfig.default_icon_path, DeviceType.default_icon_path)
+                .outerjoin(DeviceType, DeviceConfig.device_type_id == DeviceType.id)
+                .filter(DeviceConfig.id.in_(config_ids)))
+        configs = {row[0]: row[1:] for row in rows}
+
+    nodes = []
+    for instance_id, (config_id, instance_name, x, y) in sorted(state["nodes"].items(), key=lambda item: int(item[0])):
+        config_name, hostname_ip, config_icon, type_icon = configs.get(config_id, (None, None, None, None))
+        nodes.append(serialize_node_row(
+            (instance_id, instance_name, x, y, config_id, config_name, hostname_ip, config_icon, type_icon)))
+    edges = [serialize_edge_row((int(connection_id), source, target))
+             for connection_id, (source, target) in sorted(state["edges"].items(), key=lambda item: int(item[0]))]
+    return {"nodes": nodes, "edges": edges}
+
+
+def state_to_save_payload(state):
+    """Turns a graph state into the nodes/edges payload accepted by save_topology_full."""
+    return {
+        "nodes": [{
+            "id": instance_id,
+            "data": {"deviceConfigId": config_id, "label": instance_name},
+            "position": {"x": x, "y": y},
+        } for instance_id, (config_id, instance_name, x, y) in state["nodes"].items()],
+        "edges": [{
+            "id": connection_id,
+            "source": str(source),
+            "target": str(target),
+        } for connection_id, (source, target) in state["edges"].items()],
+    }
+
+
+def delete_snapshots(topology_id):
+    LabTopologySnapshot.query.filter_by(topology_id=topology_id).delete(synchronize_session=False)
@@ -0,0 +1,175 @@
+"""Viewport queries for lazily loading very large canvases.
+
+A uniform grid over the node positions (cells of GRID_CELL_SIZE canvas
+units) is built once per topology revision and kept in a small LRU cache,
+like the graphs of topology_analysis. Positions only change through writes
+that bump the revision, so a cached index is never stale.
+
+A viewport query returns the nodes inside the box, every edge incident to
+them, and a stub (id and position only) for each neighbour outside the box,
+so the editor can draw edges leaving the viewport without loading the rest
+of the lab. Only the visible nodes are read from the database in full.
+"""
+import math
+import threading
+from array import array
+from collections import OrderedDict
+
+from .models import db, LabDeviceInstance, LabConnection
+from .serializers import serialize_edge_row, serialize_node_row, serialize_topology_summary
+from .topology_reader import node_rows_query
+from .topology_revisions import current_revision
+
+GRID_CELL_SIZE = 1000
+SPATIAL_CACHE_SIZE = 16
+MAX_VIEWPORT_NODES = 5000
+VISIBLE_ROWS_CHUNK_SIZE = 900  # Keeps `IN (...)` lists below SQLite's parameter limit
+
+_cache_lock = threading.Lock()
+_index_cache = OrderedDict()  # (topology_id, revision) -> SpatialIndex
+
+
+class ViewportError(Exception):
+    """Raised for a malformed bbox parameter."""
+
+
+def parse_bbox(value):
+    """Parses 'min_x,min_y,max_x,max_y' into a tuple of floats."""
+    try:
+        min_x, min_y, max_x, max_y = (float(part) for part in value.split(','))
+    except ValueError:
+        raise ViewportError("bbox must be min_x,min_y,max_x,max_y")
+    if not all(math.isfinite(v) for v in (min_x, min_y, max_x, max_y)):
+        raise ViewportError("bbox coordinates must be finite numbers")
+    if min_x > max_x or min_y > max_y:
+        raise ViewportError("bbox minimum must not exceed its maximum")
+    return min_x, min_y, max_x, max_y
+
+
+class SpatialIndex:
+    """Node positions in a uniform grid plus incident edges per node (CSR form)."""
+
+    def __init__(self, nodes, edges, cell_size=GRID_CELL_SIZE):
+        self.cell_size = cell_size
+        self.revision = None
+        self.ids = array('l')
+        self.xs = array('d')
+        self.ys = array('d')
+        self.cells = {}  # (cell_x, cell_y) -> array of vertex indices
+        index = {}
+        for instance_id, x, y in nodes:
+            x, y = x or 0, y or 0
+            vertex = len(self.ids)
+            index[instance_id] = vertex
+            self.ids.append(instance_id)
+            self.xs.append(x)
+            self.ys.append(y)
+            self.cells.setdefault(self._cell(x, y), array('l')).append(vertex)
+        self.bounds = ((min(self.xs), min(self.ys), max(self.xs), max(self.ys)) if self.ids else None)
+
+        self.edge_ids = array('l')
+        self.edge_ends = array('l')  # Source and target vertex of edge i at 2i and 2i + 1
+        degree = array('l', [0]) * len(self.ids)
+        for edge_id, source, target in edges:
+            if source in index and target in index:
+                u, v = index[source], index[target]
+                self.edge_ids.append(edge_id)
+                self.edge_ends.extend((u, v))
+                degree[u] += 1
+                if v != u:
+                    degree[v] += 1
+
+        self.offsets = array('l', [0]) * (len(self.ids) + 1)
+        for i, d in enumerate(degree):
+            self.offsets[i + 1] = self.offsets[i] + d
+        self.incident = array('l', [0]) * self.offsets[-1]
+        cursor = self.offsets[:-1]
+        for edge in range(len(self.edge_ids)):
+            u, v = self.edge_ends[2 * edge], self.edge_ends[2 * edge + 1]
+            for w in ((u,) if u == v else (u, v)):
+                self.incident[cursor[w]] = edge
+                cursor[w] += 1
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _cell(self, x, y):
+        return int(x // self.cell_size), int(y // self.cell_size)
+
+    def visible(self, min_x, min_y, max_x, max_y):
+        """Vertex indices inside the box (inclusive), in instance id order."""
+        low_x, low_y = self._cell(min_x, min_y)
+        high_x, high_y = self._cell(max_x, max_y)
+        if (high_x - low_x + 1) * (high_y - low_y + 1) <= len(self.cells):
+            buckets = (self.cells.get((cx, cy), ()) for cx in range(low_x, high_x + 1)
+                       for cy in range(low_y, high_y + 1))
+        else:  # The box spans more cells than are occupied: scan the occupied ones
+            buckets = (bucket for (cx, cy), bucket in self.cells.items()
+                       if low_x <= cx <= high_x and low_y <= cy <= high_y)
+        xs, ys = self.xs, self.ys
+        return sorted(v for bucket in buckets for v in bucket
+                      if min_x <= xs[v] <= max_x and min_y <= ys[v] <= max_y)
+
+    def query(self, bbox, limit=MAX_VIEWPORT_NODES):
+        """Returns (visible vertices, incident edge indices, off-screen neighbour vertices, truncated)."""
+        vertices = self.visible(*bbox)
+        truncated = len(vertices) > limit
+        if truncated:
+            vertices = vertices[:limit]
+        shown = set(vertices)
+        edges = sorted({self.incident[p] for v in vertices for p in range(self.offsets[v], self.offsets[v + 1])})
+        stubs = sorted({w for edge in edges for w in self.edge_ends[2 * edge:2 * edge + 2]} - shown)
+        return vertices, edges, stubs, truncated
+
+
+def load_spatial_index(topology_id):
+    """Returns the SpatialIndex of a topology, built at most once per revision."""
+    key = (topology_id, current_revision(topology_id))
+    with _cache_lock:
+        spatial_index = _index_cache.get(key)
+        if spatial_index is not None:
+            _index_cache.move_to_end(key)
+            return spatial_index
+
+    nodes = db.session.query(LabDeviceInstance.id, LabDeviceInstance.canvas_x, LabDeviceInstance.canvas_y) \
+        .filter(LabDeviceInstance.topology_id == topology_id).order_by(LabDeviceInstance.id)
+    edges = db.session.query(LabConnection.id, LabConnection.source_instance_id, LabConnection.target_instance_id) \
+        .filter(LabConnection.topology_id == topology_id)
+    spatial_index = SpatialIndex(nodes, edges)
+    spatial_index.revision = key[1]
+
+    with _cache_lock:
+        _index_cache[key] = spatial_index
+        _index_cache.move_to_end(key)
+        while len(_index_cache) > SPATIAL_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+    return spatial_index
+
+
+def load_viewport(topology, bbox, limit=MAX_VIEWPORT_NODES):
+    """The part of the detail payload that falls inside `bbox`, plus stubs and the lab's bounds."""
+    spatial_index = load_spatial_index(topology.id)
+    vertices, edges, stubs, truncated = spatial_index.query(bbox, limit)
+
+    ids = [spatial_index.ids[v] for v in vertices]
+    nodes = []
+    for start in range(0, len(ids), VISIBLE_ROWS_CHUNK_SIZE):
+        chunk = ids[start:start + VISIBLE_ROWS_CHUNK_SIZE]
+        nodes.extend(serialize_node_row(row) for row in
+                     node_rows_query(topology.id).filter(LabDeviceInstance.id.in_(chunk)))
+
+    ends = spatial_index.edge_ends
+    payload = serialize_topology_summary(topology)
+    payload.update({
+        "revision": spatial_index.revision,
+        "bbox": list(bbox),
+        "bounds": list(spatial_index.bounds) if spatial_index.bounds else None,
+        "total_nodes": len(spatial_index),
+        "truncated": truncated,
+        "nodes": nodes,
+        "edges": [serialize_edge_row((spatial_index.edge_ids[e], spatial_index.ids[ends[2 * e]],
+                                      spatial_index.ids[ends[2 * e + 1]])) for e in edges],
+        "stubs": [{"id": str(spatial_index.ids[v]),
+                   "position": {"x": spatial_index.xs[v], "y": spatial_index.ys[v]}} for v in stubs],
+    })
+    return payload
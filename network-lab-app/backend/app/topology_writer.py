@@ -0,0 +1,355 @@
+from flask import current_app
+from .models import db, LabDeviceInstance, LabConnection, DeviceConfig
+from .topology_changes import delete_changes
+from .topology_clone import delete_templates
+from .topology_revisions import bump_revision, delete_revision
+from .topology_snapshots import delete_snapshots
+
+
+class TopologyWriteError(Exception):
+    """Raised when a save payload cannot be applied to a topology."""
+
+
+def parse_instance_id(value):
+    """Converts a React Flow node id (a string) to a backend instance id, or None."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_connection_id(value):
+    """Extracts the connection id from an edge id such as 'edge_12-14_7'."""
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        tail = value.rsplit('_', 1)[-1]
+        if tail.isdigit():
+            return int(tail)
+    return None
+
+
+def edge_id(connection):
+    return f"edge_{connection.source_instance_id}-{connection.target_instance_id}_{connection.id}"
+
+
+def existing_device_config_ids(device_config_ids):
+    """Returns the subset of the given DeviceConfig ids that exist, in one query."""
+    if not device_config_ids:
+        return set()
+    candidate_ids = {parse_instance_id(config_id) for config_id in device_config_ids} - {None}
+    if not candidate_ids:
+        return set()
+    rows = db.session.query(DeviceConfig.id).filter(DeviceConfig.id.in_(candidate_ids)).all()
+    return {row[0] for row in rows}
+
+
+def _existing_instance_ids(topology_id, instance_ids):
+    if not instance_ids:
+        return set()
+    rows = db.session.query(LabDeviceInstance.id).filter(
+        LabDeviceInstance.topology_id == topology_id,
+        LabDeviceInstance.id.in_(set(instance_ids))
+    ).all()
+    return {row[0] for row in rows}
+
+
+def validate_full_save(data):
+    """Checks a full-save payload before anything is written; raises TopologyWriteError.
+
+    The body must be an object whose `nodes` and `edges` are lists of objects,
+    and every node must reference an existing DeviceConfig (one query).
+    """
+    if not isinstance(data, dict):
+        raise TopologyWriteError("Body must be a JSON object with nodes and edges")
+    node_payloads = data.get('nodes', [])
+    edge_payloads = data.get('edges', [])
+    if not isinstance(node_payloads, list) or not all(isinstance(node, dict) for node in node_payloads):
+        raise TopologyWriteError("nodes must be a list of objects")
+    if not isinstance(edge_payloads, list) or not all(isinstance(edge, dict) for edge in edge_payloads):
+        raise TopologyWriteError("edges must be a list of objects")
+
+    config_ids = []
+    for node_data in node_payloads:
+        node_fields = node_data.get('data', {})
+        if not isinstance(node_fields, dict) or not node_fields.get('deviceConfigId'):
+            raise TopologyWriteError(f"Missing deviceConfigId for node {node_data.get('id')}")
+        config_ids.append(node_fields['deviceConfigId'])
+
+    valid_config_ids = existing_device_config_ids(config_ids)
+    for node_data, device_config_id in zip(node_payloads, config_ids):
+        if parse_instance_id(device_config_id) not in valid_config_ids:
+            raise TopologyWriteError(f"Invalid device_config_id: {device_config_id} for node {node_data.get('id')}")
+
+
+def save_topology_full(topology, data):
+    """Replaces the whole graph of a topology with the given React Flow nodes/edges.
+
+    Issues a fixed number of statements regardless of graph size: one query to
+    validate every referenced DeviceConfig (validate_full_save), one delete per
+    table, and batched inserts for instances and connections. Frontend node ids
+    are mapped to backend instance ids from a single flush. The caller commits
+    or rolls back.
+    """
+    validate_full_save(data)
+    node_payloads = data.get('nodes', [])
+    edge_payloads = data.get('edges', [])
+
+    LabConnection.query.filter_by(topology_id=topology.id).delete(synchronize_session=False)
+    LabDeviceInstance.query.filter_by(topology_id=topology.id).delete(synchronize_session=False)
+
+    instances = []
+    for node_data in node_payloads:
+        position = node_data.get('position', {})
+        instances.append(LabDeviceInstance(
+            topology_id=topology.id,
+            device_config_id=node_data['data']['deviceConfigId'],
+            instance_name=node_data['data'].get('label'),
+            canvas_x=position.get('x', 0),
+            canvas_y=position.get('y', 0)
+        ))
+    db.session.add_all(instances)
+    db.session.flush()  # Batched INSERT for all instances; ids are assigned here
+
+    frontend_node_id_to_backend_instance_id = {
+        node_data.get('id'): instance.id
+        for node_data, instance in zip(node_payloads, instances)
+        if node_data.get('id')
+    }
+
+    connection_rows = []
+    skipped_edges = []
+    for edge_data in edge_payloads:
+        source_id = frontend_node_id_to_backend_instance_id.get(edge_data.get('source'))
+        target_id = frontend_node_id_to_backend_instance_id.get(edge_data.get('target'))
+        if source_id and target_id:
+            connection_rows.append({
+                "topology_id": topology.id,
+                "source_instance_id": source_id,
+                "target_instance_id": target_id,
+            })
+        else:
+            skipped_edges.append(edge_data.get('id'))
+    if connection_rows:
+        db.session.bulk_insert_mappings(LabConnection, connection_rows)
+    if skipped_edges:
+        current_app.logger.warning("Skipped %d edges of topology %s with unmapped endpoints: %s",
+                                   len(skipped_edges), topology.id, skipped_edges)
+
+    return frontend_node_id_to_backend_instance_id
+
+
+def apply_topology_delta(topology, delta, edit=None):
+    """Applies an incremental edit to a topology inside the current transaction.
+
+    `delta` has the shape::
+
+        {
+          "baseRevision": 4,
+          "nodes": {"added": [...], "moved": [...], "renamed": [...], "removed": [...]},
+          "edges": {"added": [...], "removed": [...]}
+        }
+
+    Added and renamed nodes use the React Flow node format (the name is in
+    `data.label`); added nodes may carry a temporary client id that added
+    edges can refer to. Existing nodes and edges keep their ids.
+    Only the rows named in the delta are written. The touched ids are added to
+    `edit` (a topology_snapshots.GraphEdit) if one is given. The caller commits
+    or rolls back.
+    """
+    base_revision = delta.get('baseRevision')
+    if not isinstance(base_revision, int):
+        raise TopologyWriteError("baseRevision is required")
+
+    nodes = delta.get('nodes') or {}
+    edges = delta.get('edges') or {}
+    added_nodes = nodes.get('added') or []
+    moved_nodes = nodes.get('moved') or []
+    renamed_nodes = nodes.get('renamed') or []
+    removed_node_ids = [parse_instance_id(node_id) for node_id in nodes.get('removed') or []]
+    added_edges = edges.get('added') or []
+    removed_edge_ids = [parse_connection_id(eid) for eid in edges.get('removed') or []]
+
+    # Fail fast on a stale client before anything is written.
+    new_revision = bump_revision(topology.id, expected=base_revision)
+
+    temp_node_ids = {node.get('id') for node in added_nodes if node.get('id') is not None}
+
+    # Validate every referenced existing node with a single query.
+    referenced = set(removed_node_ids)
+    referenced.update(parse_instance_id(node.get('id')) for node in moved_nodes)
+    referenced.update(parse_instance_id(node.get('id')) for node in renamed_nodes)
+    for edge in added_edges:
+        for endpoint in (edge.get('source'), edge.get('target')):
+            if endpoint not in temp_node_ids:
+                referenced.add(parse_instance_id(endpoint))
+    if None in referenced:
+        raise TopologyWriteError("Delta references a node id that is not a saved node")
+    missing = referenced - _existing_instance_ids(topology.id, referenced)
+    if missing:
+        raise TopologyWriteError(f"Unknown node ids for this topology: {sorted(missing)}")
+    if None in removed_edge_ids:
+        raise TopologyWriteError("Delta references an invalid edge id")
+    if any(not isinstance(node.get('data'), dict) for node in renamed_nodes):
+        raise TopologyWriteError("Renamed nodes must carry the new name in data.label")
+
+    config_ids = []
+    for node in added_nodes:
+        device_config_id = (node.get('data') or {}).get('deviceConfigId')
+        if not device_config_id:
+            raise TopologyWriteError(f"Missing deviceConfigId for node {node.get('id')}")
+        config_ids.append(device_config_id)
+    valid_config_ids = existing_device_config_ids(config_ids)
+    invalid_configs = {c for c in config_ids if parse_instance_id(c) not in valid_config_ids}
+    if invalid_configs:
+        raise TopologyWriteError(f"Invalid device_config_id: {sorted(invalid_configs, key=str)}")
+
+    removed_nodes = set(removed_node_ids)
+    for edge in added_edges:
+        for endpoint in (edge.get('source'), edge.get('target')):
+            if endpoint not in temp_node_ids and parse_instance_id(endpoint) in removed_nodes:
+                raise TopologyWriteError(f"Edge {edge.get('id')} connects to a removed node")
+
+    # Removals: edges first, then nodes together with their incident edges.
+    if edit is not None and (removed_edge_ids or removed_nodes):
+        doomed = db.session.query(
+            LabConnection.id, LabConnection.source_instance_id, LabConnection.target_instance_id
+        ).filter(
+            LabConnection.topology_id == topology.id,
+            db.or_(LabConnection.id.in_(removed_edge_ids),
+                   LabConnection.source_instance_id.in_(removed_nodes),
+                   LabConnection.target_instance_id.in_(removed_nodes))
+        )
+        edit.removed_edges.update((i, [source, target]) for i, source, target in doomed)
+        edit.removed_node_ids.update(removed_nodes)
+    if removed_edge_ids:
+        LabConnection.query.filter(
+            LabConnection.topology_id == topology.id,
+            LabConnection.id.in_(removed_edge_ids)
+        ).delete(synchronize_session=False)
+    if removed_nodes:
+        LabConnection.query.filter(
+            LabConnection.topology_id == topology.id,
+            db.or_(LabConnection.source_instance_id.in_(removed_nodes),
+                   LabConnection.target_instance_id.in_(removed_nodes))
+        ).delete(synchronize_session=False)
+        LabDeviceInstance.query.filter(
+            LabDeviceInstance.topology_id == topology.id,
+            LabDeviceInstance.id.in_(removed_nodes)
+        ).delete(synchronize_session=False)
+
+    # Moves and renames of the same node collapse into one UPDATE row.
+    updates = {}
+    for node in moved_nodes:
+        position = node.get('position') or {}
+        row = updates.setdefault(parse_instance_id(node.get('id')), {})
+        row['canvas_x'] = position.get('x', 0)
+        row['canvas_y'] = position.get('y', 0)
+    for node in renamed_nodes:
+        row = updates.setdefault(parse_instance_id(node.get('id')), {})
+        row['instance_name'] = node['data'].get('label')
+    for instance_id in removed_nodes:
+        updates.pop(instance_id, None)
+    if updates:
+        db.session.bulk_update_mappings(
+            LabDeviceInstance,
+            [dict(row, id=instance_id) for instance_id, row in updates.items()]
+        )
+        if edit is not None:
+            edit.node_ids.update(updates)
+
+    node_id_map = {}
+    if added_nodes:
+        new_instances = []
+        for node in added_nodes:
+            data = node.get('data') or {}
+            position = node.get('position') or {}
+            new_instances.append(LabDeviceInstance(
+                topology_id=topology.id,
+                device_config_id=data.get('deviceConfigId'),
+                instance_name=data.get('label'),
+                canvas_x=position.get('x', 0),
+                canvas_y=position.get('y', 0)
+            ))
+        db.session.add_all(new_instances)
+        db.session.flush()  # One flush for all added nodes
+        for node, instance in zip(added_nodes, new_instances):
+            if node.get('id') is not None:
+                node_id_map[node.get('id')] = instance.id
+        if edit is not None:
+            edit.node_ids.update(instance.id for instance in new_instances)
+
+    edge_id_map = {}
+    if added_edges:
+        new_connections = []
+        for edge in added_edges:
+            source, target = edge.get('source'), edge.get('target')
+            new_connections.append(LabConnection(
+                topology_id=topology.id,
+                source_instance_id=node_id_map.get(source) or parse_instance_id(source),
+                target_instance_id=node_id_map.get(target) or parse_instance_id(target)
+            ))
+        db.session.add_all(new_connections)
+        db.session.flush()
+        for edge, connection in zip(added_edges, new_connections):
+            if edge.get('id') is not None:
+                edge_id_map[edge.get('id')] = edge_id(connection)
+        if edit is not None:
+            edit.edge_ids.update(connection.id for connection in new_connections)
+
+    return {
+        "revision": new_revision,
+        "nodeIds": {temp_id: str(instance_id) for temp_id, instance_id in node_id_map.items()},
+        "edgeIds": edge_id_map,
+    }
+
+
+def apply_node_moves(topology_id, positions, edit=None):
+    """Persists a batch of coalesced node positions ({instance_id: {"x", "y"}}).
+
+    Nodes that were removed in the meantime are ignored. Returns the new
+    revision, or None if nothing was written; the moved ids are added to
+    `edit` if given. The revision is move-only, so deltas based on an earlier
+    revision still apply. The caller commits.
+    """
+    existing = _existing_instance_ids(topology_id, positions.keys())
+    rows = [{"id": instance_id, "canvas_x": position.get('x', 0), "canvas_y": position.get('y', 0)}
+            for instance_id, position in positions.items() if instance_id in existing]
+    if not rows:
+        return None
+    db.session.bulk_update_mappings(LabDeviceInstance, rows)
+    if edit is not None:
+        edit.node_ids.update(row["id"] for row in rows)
+    return bump_revision(topology_id, structural=False)
+
+
+def with_pending_moves(topology_id, delta, positions):
+    """Returns `delta` with buffered positions ({instance_id: {"x", "y"}}) folded into nodes.moved.
+
+    This lets a structural edit write the moves in its own revision. Positions
+    of nodes that were removed in the meantime are dropped, and moves in the
+    delta itself win over buffered ones.
+    """
+    nodes = dict(delta.get('nodes') or {})
+    moved = list(nodes.get('moved') or [])
+    explicit = {parse_instance_id(node.get('id')) for node in moved}
+    existing = _existing_instance_ids(topology_id, positions.keys())
+    moved.extend({"id": str(instance_id), "position": position} for instance_id, position in positions.items()
+                 if instance_id in existing and instance_id not in explicit)
+    nodes['moved'] = moved
+    return dict(delta, nodes=nodes)
+
+
+def delete_topology(topology):
+    """Deletes a topology with its graph, history, change log, revision counter and template; the caller commits.
+
+    Connections and instances go first with one bulk DELETE each, so the ORM
+    cascade on the topology does not load every row.
+    """
+    LabConnection.query.filter_by(topology_id=topology.id).delete(synchronize_session=False)
+    LabDeviceInstance.query.filter_by(topology_id=topology.id).delete(synchronize_session=False)
+    delete_snapshots(topology.id)
+    delete_changes(topology.id)
+    delete_revision(topology.id)
+    delete_templates(topology.id)
+    db.session.delete(topology)
@@ -0,0 +1,294 @@
+"""Micro-benchmarks for the topology and catalog endpoints.
+
+Seeds synthetic labs and a large device catalog, times the API through the
+Flask test client and writes machine-readable results so runs from different
+commits can be compared.
+
+Run from the `backend/` directory:
+
+    # SQLite (TestingConfig)
+    python -m benchmarks.run --output bench-sqlite.json
+
+    # PostgreSQL: point the chosen config at a scratch database via DATABASE_URL
+    DATABASE_URL=postgresql://user:pw@localhost/network_lab_bench \\
+        python -m benchmarks.run --config development --output bench-pg.json
+
+    # Compare two runs (ratios > 1.0 mean the new run is slower)
+    python -m benchmarks.run --compare bench-old.json bench-new.json
+
+The benchmark creates and drops all tables of the target database, so never
+point it at a database holding real data.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+BENCH_USER = "bench_user"
+BENCH_PASSWORD = "bench_password"
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@contextmanager
+def _count_statements(engine):
+    counter = {"count": 0}
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        counter["count"] += 1
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+class Bench:
+    def __init__(self, app, db, repeats):
+        self.app = app
+        self.db = db
+        self.repeats = repeats
+        self.client = app.test_client()
+        self.results = []
+
+    def measure(self, name, size, request_fn, setup_fn=None, expected_status=200):
+        """Times `request_fn` `repeats` times; `setup_fn` runs untimed before each call."""
+        timings = []
+        statements = None
+        for _ in range(self.repeats):
+            args = setup_fn() if setup_fn else ()
+            with _count_statements(self.db.engine) as counter:
+                start = time.perf_counter()
+                response = request_fn(*args)
+                elapsed = time.perf_counter() - start
+            if response.status_code != expected_status:
+                raise RuntimeError(f"{name} (size={size}) returned {response.status_code}: {response.data[:200]!r}")
+            timings.append(elapsed * 1000)
+            statements = counter["count"]
+        return self.record(name, size, timings, statements, len(response.data))
+
+    def measure_encoding(self, name, size, encode_fn):
+        """Times a pure serialization function (no HTTP, no database)."""
+        timings = []
+        for _ in range(self.repeats):
+            start = time.perf_counter()
+            body = encode_fn()
+            timings.append((time.perf_counter() - start) * 1000)
+        return self.record(name, size, timings, 0, len(body))
+
+    def record(self, name, size, timings, statements, response_bytes):
+        timings.sort()
+        result = {
+            "name": name,
+            "size": size,
+            "repeats": self.repeats,
+            "min_ms": round(timings[0], 3),
+            "median_ms": round(statistics.median(timings), 3),
+            "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+            "statements": statements,
+            "response_bytes": response_bytes,
+        }
+        self.results.append(result)
+        print(f"{name:<28} size={size:<6} median={result['median_ms']:>10.2f} ms  "
+              f"statements={statements}  bytes={response_bytes}", flush=True)
+        return result
+
+
+def _seed_user(db):
+    from app.models import User
+    user = User.query.filter_by(username=BENCH_USER).first()
+    if user is None:
+        user = User(username=BENCH_USER, is_admin=True)
+        user.set_password(BENCH_PASSWORD)
+        db.session.add(user)
+        db.session.commit()
+    return user
+
+
+def _seed_catalog(db, catalog_size):
+    from app.models import DeviceType, DeviceConfig
+    types = [DeviceType(name=f"BenchType{i}", default_icon_path=f"icons/bench{i}.svg") for i in range(8)]
+    db.session.add_all(types)
+    db.session.flush()
+    db.session.bulk_insert_mappings(DeviceConfig, [{
+        "name": f"bench-device-{i:06d}",
+        "device_type_id": types[i % len(types)].id,
+        "hostname_ip": f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}",
+        "notes": "synthetic benchmark device",
+    } for i in range(catalog_size)])
+    db.session.commit()
+    return [row[0] for row in db.session.query(DeviceConfig.id).order_by(DeviceConfig.id).limit(1000)]
+
+
+def _graph_payload(config_ids, node_count):
+    """A grid-like lab: every node links to its right and lower neighbour."""
+    width = max(1, int(node_count ** 0.5))
+    nodes = [{
+        "id": f"n{i}",
+        "data": {"deviceConfigId": config_ids[i % len(config_ids)], "label": f"D{i}"},
+        "position": {"x": (i % width) * 120, "y": (i // width) * 120},
+    } for i in range(node_count)]
+    edges = []
+    for i in range(node_count):
+        if (i + 1) % width and i + 1 < node_count:
+            edges.append({"id": f"e{i}r", "source": f"n{i}", "target": f"n{i + 1}"})
+        if i + width < node_count:
+            edges.append({"id": f"e{i}d", "source": f"n{i}", "target": f"n{i + width}"})
+    return {"nodes": nodes, "edges": edges}
+
+
+def bench_serialization(bench, app, payloads):
+    """Flask's default `jsonify` provider vs FastJSONProvider, plus compressed sizes."""
+    from flask.json.provider import DefaultJSONProvider
+    from app.json_provider import FastJSONProvider, _compress, brotli, orjson
+
+    default_provider = DefaultJSONProvider(app)
+    fast_provider = FastJSONProvider(app)
+    print(f"fast provider backend: {'orjson' if orjson else 'stdlib json'}", flush=True)
+    for label, size, payload in payloads:
+        bench.measure_encoding(f'encode_jsonify_{label}', size,
+                               lambda: default_provider.response(payload).get_data())
+        fast_body = fast_provider.response(payload).get_data()
+        bench.measure_encoding(f'encode_fast_{label}', size,
+                               lambda: fast_provider.response(payload).get_data())
+        bench.measure_encoding(f'gzip_{label}', size, lambda: _compress(fast_body, 'gzip'))
+        if brotli is not None:
+            bench.measure_encoding(f'brotli_{label}', size, lambda: _compress(fast_body, 'br'))
+
+
+def run(args):
+    if args.config == 'testing':
+        os.environ.setdefault('FLASK_CONFIG', 'testing')
+    from app import create_app, db
+    from app.catalog_cache import bump_catalog_version
+    from app.models import LabTopology
+    from app.topology_layout import np as layout_numpy
+
+    app = create_app(config_name=args.config)
+    app.config['ADMISSION_ENABLED'] = False  # The per-user rate limits would turn repeated requests into 429s
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        user = _seed_user(db)
+        config_ids = _seed_catalog(db, args.catalog_size)
+
+        bench = Bench(app, db, args.repeats)
+        token = bench.client.post('/api/auth/login', json={
+            'username': BENCH_USER, 'password': BENCH_PASSWORD
+        }).get_json()['access_token']
+        headers = {'Authorization': f'Bearer {token}'}
+
+        def new_topology():
+            topology = LabTopology(name=f"bench-{time.perf_counter_ns()}", user_id=user.id)
+            db.session.add(topology)
+            db.session.commit()
+            return topology.id
+
+        for size in args.sizes:
+            payload = _graph_payload(config_ids, size)
+            topology_id = new_topology()
+            bench.measure('save', size, lambda: bench.client.post(
+                f'/api/lab/topologies/{topology_id}/save', json=payload, headers=headers))
+            bench.measure('get_lab_topology_detail', size, lambda: bench.client.get(
+                f'/api/lab/topologies/{topology_id}', headers=headers))
+            for algorithm in ('grid', 'layered') + (('force',) if layout_numpy is not None else ()):
+                bench.measure(f'layout_{algorithm}', size, lambda: bench.client.post(
+                    f'/api/lab/topologies/{topology_id}/layout', json={'algorithm': algorithm}, headers=headers))
+
+            def saved_topology():
+                new_id = new_topology()
+                response = bench.client.post(f'/api/lab/topologies/{new_id}/save', json=payload, headers=headers)
+                if response.status_code != 200:
+                    raise RuntimeError(f"Seeding a topology of size {size} returned {response.status_code}")
+                return (new_id,)
+            bench.measure('delete_lab_topology', size, lambda topology_to_delete: bench.client.delete(
+                f'/api/lab/topologies/{topology_to_delete}', headers=headers),
+                setup_fn=saved_topology, expected_status=204)
+
+        # The user now owns one lab per size plus the labs below.
+        for i in range(args.topology_count):
+            db.session.add(LabTopology(name=f"bench-list-{i}", user_id=user.id))
+        db.session.commit()
+        bench.measure('get_lab_topologies', args.topology_count, lambda: bench.client.get(
+            '/api/lab/topologies', headers=headers))
+
+        def cold_catalog():
+            bump_catalog_version()
+            db.session.commit()
+            return ()
+        bench.measure('get_device_configs', args.catalog_size, lambda: bench.client.get(
+            '/api/admin/device-configs', headers=headers), setup_fn=cold_catalog)
+        etag = bench.client.get('/api/admin/device-configs', headers=headers).headers.get('ETag')
+        bench.measure('get_device_configs_304', args.catalog_size, lambda: bench.client.get(
+            '/api/admin/device-configs', headers={**headers, 'If-None-Match': etag}), expected_status=304)
+
+        bench_serialization(bench, app, [
+            ('topology', args.sizes[-1], bench.client.get(f'/api/lab/topologies/{topology_id}', headers=headers).get_json()),
+            ('catalog', args.catalog_size, bench.client.get('/api/admin/device-configs', headers=headers).get_json()),
+        ])
+
+        dialect = db.engine.dialect.name
+        db.session.remove()
+        db.drop_all()
+
+    report = {
+        "commit": _git_commit(),
+        "created_at": time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        "python": platform.python_version(),
+        "database": dialect,
+        "config": args.config,
+        "results": bench.results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {len(bench.results)} results to {args.output}")
+
+
+def compare(old_path, new_path):
+    with open(old_path) as f:
+        old = {(r['name'], r['size']): r for r in json.load(f)['results']}
+    with open(new_path) as f:
+        new = json.load(f)['results']
+    print(f"{'benchmark':<28} {'size':>6} {'old ms':>10} {'new ms':>10} {'ratio':>7} {'stmts':>11}")
+    for result in new:
+        before = old.get((result['name'], result['size']))
+        if before is None:
+            continue
+        ratio = result['median_ms'] / before['median_ms'] if before['median_ms'] else float('inf')
+        print(f"{result['name']:<28} {result['size']:>6} {before['median_ms']:>10.2f} "
+              f"{result['median_ms']:>10.2f} {ratio:>7.2f} {before['statements']:>5}->{result['statements']:<5}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--config', default='testing', help="create_app config name (default: testing)")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000],
+                        help="topology node counts to benchmark")
+    parser.add_argument('--catalog-size', type=int, default=20000, help="number of DeviceConfigs to seed")
+    parser.add_argument('--topology-count', type=int, default=500, help="extra labs for the list benchmark")
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help="compare two result files and exit")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+    else:
+        run(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
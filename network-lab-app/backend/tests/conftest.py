@@ -1,5 +1,7 @@
 import pytest
 import os
+from contextlib import contextmanager
+from sqlalchemy import event
 from app import create_app, db
 from app.models import User, DeviceType # Import models that might be needed for setup
 
@@ -79,6 +81,62 @@ def db_session(app):
         db.session.rollback() # Rollback any changes made during the test
         # db.session.remove() # Ensure session is closed, good practice
 
+class QueryCounter:
+    """Collects the SQL statements executed while it is active."""
+    def __init__(self):
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def report(self):
+        """Numbered, whitespace-collapsed statements for failure messages."""
+        return '\n'.join(f"  {i}. {' '.join(statement.split())}" for i, statement in enumerate(self.statements, 1))
+
+@pytest.fixture(scope='function')
+def count_queries(app):
+    """
+    Returns a context manager that counts SQL statements sent to the test database.
+    Usage: `with count_queries() as counter: ...` then check `counter.count`.
+    """
+    @contextmanager
+    def _count_queries():
+        counter = QueryCounter()
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            counter.statements.append(statement)
+
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            yield counter
+        finally:
+            event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+    return _count_queries
+
+@pytest.fixture(scope='function')
+def query_budget(app, count_queries, monkeypatch):
+    """
+    Returns a context manager that fails the test when the block issues more than
+    `budget` SQL statements, printing every statement it ran.
+    Usage: `with query_budget(3, "GET /api/lab/topologies") as counter: ...`
+    """
+    # Always read the catalog version so counts do not depend on the TTL cache being warm
+    monkeypatch.setitem(app.config, 'CATALOG_VERSION_TTL', 0)
+
+    @contextmanager
+    def _query_budget(budget, label):
+        with count_queries() as counter:
+            yield counter
+        if counter.count > budget:
+            pytest.fail(f"{label} issued {counter.count} SQL statements, budget is {budget}:\n{counter.report()}",
+                        pytrace=False)
+
+    return _query_budget
+
 # Helper function to log in a user and get a token
 def get_auth_token(client, username, password):
     response = client.post('/api/auth/login', json={'username': username, 'password': password})
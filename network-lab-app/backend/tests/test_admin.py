@@ -172,3 +172,139 @@ def test_delete_device_config_admin(client, admin_user_token, db_session):
 # This can be added when testing lab functionalities.
 # For now, the backend route for DELETE /device-configs/<id> checks for this.
 # We can trust that check or add a more complex test later.
+
+def test_device_catalog_etag_not_modified(client, admin_user_token):
+    """Catalog listings carry a strong ETag and answer 304 until the catalog changes."""
+    headers = {'Authorization': f'Bearer {admin_user_token}'}
+    for url in ('/api/admin/device-types', '/api/admin/device-configs'):
+        first = client.get(url, headers=headers)
+        assert first.status_code == 200
+        etag = first.headers['ETag']
+        assert not etag.startswith('W/') # Strong ETag
+
+        revalidated = client.get(url, headers={**headers, 'If-None-Match': etag})
+        assert revalidated.status_code == 304
+        assert revalidated.data == b''
+
+def test_device_catalog_etag_changes_after_write(client, admin_user_token):
+    """Creating a device type invalidates the cached catalog listings."""
+    headers = {'Authorization': f'Bearer {admin_user_token}'}
+    etag = client.get('/api/admin/device-types', headers=headers).headers['ETag']
+
+    client.post('/api/admin/device-types', json={'name': 'CacheBuster'}, headers=headers)
+
+    response = client.get('/api/admin/device-types', headers={**headers, 'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert any(t['name'] == 'CacheBuster' for t in response.get_json())
+
+def test_device_catalog_gzip_negotiation(app, client, admin_user_token, db_session, monkeypatch):
+    """With JSON_COMPRESSION, clients accepting gzip get a compressed body that revalidates with the weak ETag."""
+    import gzip
+    headers = {'Authorization': f'Bearer {admin_user_token}'}
+    assert 'Content-Encoding' not in client.get('/api/admin/device-configs', headers={**headers, 'Accept-Encoding': 'gzip'}).headers
+    monkeypatch.setitem(app.config, 'JSON_COMPRESSION', True)
+    router_type = DeviceType.query.filter_by(name="Router").first()
+    db_session.add_all([
+        DeviceConfig(name=f"GzipRtr{i:03d}", device_type_id=router_type.id, hostname_ip=f"10.8.0.{i}")
+        for i in range(50)
+    ])
+    db_session.commit()
+    plain = client.get('/api/admin/device-configs', headers=headers)
+    compressed = client.get('/api/admin/device-configs', headers={**headers, 'Accept-Encoding': 'gzip'})
+
+    assert compressed.status_code == 200
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in compressed.headers['Vary']
+    assert gzip.decompress(compressed.data) == plain.data
+    assert len(compressed.data) < len(plain.data)
+    assert compressed.headers['ETag'] == f'W/{plain.headers["ETag"]}'
+
+    revalidated = client.get('/api/admin/device-configs', headers={
+        **headers, 'Accept-Encoding': 'gzip', 'If-None-Match': compressed.headers['ETag']})
+    assert revalidated.status_code == 304
+
+def test_get_device_configs_keyset_pagination(client, admin_user_token, db_session):
+    """Device configs can be paged with a cursor, filtered and reduced to selected fields."""
+    switch_type = DeviceType.query.filter_by(name="Switch").first()
+    db_session.add_all([
+        DeviceConfig(name=f"PageSw{i:02d}", device_type_id=switch_type.id, hostname_ip=f"10.9.0.{i}")
+        for i in range(5)
+    ])
+    db_session.commit()
+    headers = {'Authorization': f'Bearer {admin_user_token}'}
+    query = f'device_type_id={switch_type.id}&name_prefix=PageSw&fields=id,name&limit=2'
+
+    names = []
+    url = f'/api/admin/device-configs?{query}'
+    for _ in range(5):
+        response = client.get(url, headers=headers)
+        assert response.status_code == 200
+        page = response.get_json()
+        assert all(set(item) == {'id', 'name'} for item in page)
+        names.extend(item['name'] for item in page)
+        next_cursor = response.headers.get('X-Next-Cursor')
+        if not next_cursor:
+            break
+        url = f'/api/admin/device-configs?{query}&cursor={next_cursor}'
+
+    assert names == [f"PageSw{i:02d}" for i in range(5)]
+
+def test_get_device_configs_invalid_list_params(client, admin_user_token):
+    """Malformed pagination parameters are rejected with 400."""
+    headers = {'Authorization': f'Bearer {admin_user_token}'}
+    assert client.get('/api/admin/device-configs?limit=abc', headers=headers).status_code == 400
+    assert client.get('/api/admin/device-configs?cursor=not-a-cursor', headers=headers).status_code == 400
+    assert client.get('/api/admin/device-configs?fields=password', headers=headers).status_code == 400
+
+def test_import_device_configs_csv(client, admin_user_token):
+    """Admin can bulk import configs from CSV; bad rows are reported, good rows are created."""
+    csv_body = (
+        "name,device_type,hostname_ip,notes\n"
+        "ImportR1,Router,10.20.0.1,first\n"
+        "ImportR2,Router,10.20.0.2,\n"
+        "ImportR1,Router,10.20.0.3,duplicate name\n"
+        "ImportBad,NoSuchType,10.20.0.4,\n"
+        "ImportNoIp,Switch,,\n"
+    )
+    response = client.post('/api/admin/device-configs/import', data=csv_body, content_type='text/csv',
+                           headers={'Authorization': f'Bearer {admin_user_token}'})
+    assert response.status_code == 200
+    report = response.get_json()
+    assert report['total_rows'] == 5
+    assert report['created'] == 2
+    assert [e['line'] for e in report['errors']] == [4, 5, 6]
+    assert DeviceConfig.query.filter(DeviceConfig.name.in_(['ImportR1', 'ImportR2'])).count() == 2
+
+def test_import_device_configs_json_lines_chunks(client, admin_user_token, monkeypatch):
+    """JSON Lines imports are inserted chunk by chunk and clash-checked against existing names."""
+    import app.device_import as device_import
+    monkeypatch.setattr(device_import, 'IMPORT_CHUNK_SIZE', 3)
+    router_type = DeviceType.query.filter_by(name="Router").first()
+    lines = [f'{{"name": "JsonDev{i}", "device_type_id": {router_type.id}, "hostname_ip": "10.30.0.{i}"}}' for i in range(7)]
+    lines.append('not json')
+    headers = {'Authorization': f'Bearer {admin_user_token}'}
+
+    response = client.post('/api/admin/device-configs/import', data='\n'.join(lines),
+                           content_type='application/x-ndjson', headers=headers)
+    report = response.get_json()
+    assert report['created'] == 7
+    assert report['errors'] == [{"line": 8, "msg": "Row is not a JSON object"}]
+
+    again = client.post('/api/admin/device-configs/import', data=lines[0], content_type='application/x-ndjson', headers=headers)
+    assert again.get_json()['created'] == 0
+    assert 'already exists' in again.get_json()['errors'][0]['msg']
+
+def test_import_device_configs_requires_admin_and_format(client, regular_user_token, admin_user_token):
+    response = client.post('/api/admin/device-configs/import', data='', content_type='text/csv',
+                           headers={'Authorization': f'Bearer {regular_user_token}'})
+    assert response.status_code == 403
+    response = client.post('/api/admin/device-configs/import', data='x', content_type='text/plain',
+                           headers={'Authorization': f'Bearer {admin_user_token}'})
+    assert response.status_code == 415
+
+def test_import_device_configs_rejects_undecodable_csv(client, admin_user_token):
+    response = client.post('/api/admin/device-configs/import', data=b"name,device_type,hostname_ip\n\xff\xfe,Router,10.20.9.1\n",
+                           content_type='text/csv', headers={'Authorization': f'Bearer {admin_user_token}'})
+    assert response.status_code == 400
+    assert 'UTF-8' in response.get_json()['msg']
@@ -0,0 +1,119 @@
+import threading
+import time
+import pytest
+from app.admission import (AdmissionRejected, DatabaseAdmissionState, MemoryAdmissionState, admission_state,
+                           wait_for_slot)
+from app.models import db, LabTopology, User
+
+@pytest.fixture
+def admission(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'ADMISSION_ENABLED', True)
+    monkeypatch.setitem(app.config, 'ADMISSION_LIMITS', {'topology.save': {"rate": 0.001, "burst": 2}})
+    app.extensions.pop('admission', None)
+    yield app
+    app.extensions.pop('admission', None)
+
+def create_topology(db_session, username, name):
+    user = User.query.filter_by(username=username).first()
+    topology = LabTopology(name=name, user_id=user.id)
+    db_session.add(topology)
+    db_session.commit()
+    return topology
+
+def test_save_rate_limit_returns_429_per_user(client, db_session, regular_user_token, admin_user_token, admission):
+    topology = create_topology(db_session, "testuser", "AdmissionLab")
+    url = f'/api/lab/topologies/{topology.id}/save'
+    headers = {'Authorization': f'Bearer {regular_user_token}'}
+    for _ in range(2):
+        assert client.post(url, json={"nodes": [], "edges": []}, headers=headers).status_code == 200
+
+    response = client.post(url, json={"nodes": [], "edges": []}, headers=headers)
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+    assert response.get_json()['retry_after'] == int(response.headers['Retry-After'])
+
+    # Other users have their own buckets
+    admin_topology = create_topology(db_session, "testadmin", "AdmissionAdminLab")
+    response = client.post(f'/api/lab/topologies/{admin_topology.id}/save', json={"nodes": [], "edges": []},
+                           headers={'Authorization': f'Bearer {admin_user_token}'})
+    assert response.status_code == 200
+
+def test_concurrency_cap_returns_429(client, db_session, regular_user_token, admission):
+    topology = create_topology(db_session, "testuser", "AdmissionBusyLab")
+    user = User.query.filter_by(username="testuser").first()
+    state = admission_state(admission)
+    leases = [state.acquire(f"running:{user.id}:topology.delta", 2) for _ in range(2)]
+
+    response = client.post(f'/api/lab/topologies/{topology.id}/delta', json={"baseRevision": 0},
+                           headers={'Authorization': f'Bearer {regular_user_token}'})
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '1'
+
+    for lease in leases:
+        state.release(f"running:{user.id}:topology.delta", lease)
+    response = client.post(f'/api/lab/topologies/{topology.id}/delta', json={"baseRevision": 0},
+                           headers={'Authorization': f'Bearer {regular_user_token}'})
+    assert response.status_code != 429
+
+def test_waiting_save_is_superseded_by_newer_one():
+    state = MemoryAdmissionState()
+    in_flight = state.acquire('slot', 1)
+    outcomes = {}
+
+    def wait(name):
+        try:
+            outcomes[name] = wait_for_slot(state, 'slot', timeout=5, poll=0.01)
+        except AdmissionRejected as e:
+            outcomes[name] = 'superseded' if e.superseded else 'timeout'
+
+    older = threading.Thread(target=wait, args=('older',))
+    older.start()
+    time.sleep(0.05)
+    newer = threading.Thread(target=wait, args=('newer',))
+    newer.start()
+    time.sleep(0.05)
+    state.release('slot', in_flight)
+    older.join()
+    newer.join()
+
+    assert outcomes['older'] == 'superseded'
+    assert isinstance(outcomes['newer'], int) # Got the slot once the running save finished
+
+def test_busy_slot_is_rejected_without_waiting():
+    state = MemoryAdmissionState()
+    in_flight = state.acquire('slot', 1)
+    started = time.monotonic()
+    with pytest.raises(AdmissionRejected) as rejected:
+        wait_for_slot(state, 'slot', timeout=0)
+    assert time.monotonic() - started < 0.5
+    assert not rejected.value.superseded and rejected.value.retry_after == 1
+    state.release('slot', in_flight)
+    assert isinstance(wait_for_slot(state, 'slot', timeout=0), int)
+
+def test_idle_memory_state_is_pruned(monkeypatch):
+    monkeypatch.setattr('app.admission.LATEST_EXPIRY', 0)
+    state = MemoryAdmissionState()
+    state.take_token('bucket:idle', 1000, 1)
+    state.claim_latest('slot:idle')
+    time.sleep(0.01) # Long enough for the bucket to refill
+    state._next_prune = 0
+    state.take_token('bucket:busy', 0.001, 1)
+    assert 'bucket:idle' not in state._buckets and 'slot:idle' not in state._latest
+    assert 'bucket:busy' in state._buckets
+
+def test_database_state_is_shared_between_instances(app):
+    with app.app_context():
+        first, second = DatabaseAdmissionState(db.engine), DatabaseAdmissionState(db.engine)
+        assert first.take_token('bucket:shared', 0.001, 1) == 0
+        assert second.take_token('bucket:shared', 0.001, 1) > 0
+
+        lease = first.acquire('running:shared', 1)
+        assert lease is not None
+        assert second.acquire('running:shared', 1) is None
+        first.release('running:shared', lease)
+        assert second.acquire('running:shared', 1) is not None
+
+        sequence = first.claim_latest('slot:shared')
+        assert second.is_latest('slot:shared', sequence)
+        second.claim_latest('slot:shared')
+        assert not first.is_latest('slot:shared', sequence)
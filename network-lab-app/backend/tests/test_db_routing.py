@@ -0,0 +1,63 @@
+import pytest
+from sqlalchemy import create_engine
+from app import db
+from app.db_routing import STICKY_COOKIE, clear_stickiness, reset_replicas
+from app.models import LabTopology, User
+
+@pytest.fixture
+def replica(app, tmp_path, monkeypatch):
+    """A second SQLite database configured as the read replica."""
+    uri = f"sqlite:///{tmp_path / 'replica.db'}"
+    engine = create_engine(uri)
+    db.metadata.create_all(engine)
+    monkeypatch.setitem(app.config, 'SQLALCHEMY_REPLICA_URIS', [uri])
+    monkeypatch.setitem(app.config, 'REPLICA_STICKY_SECONDS', 60)
+    reset_replicas(app)
+    clear_stickiness()
+    yield engine
+    reset_replicas(app)
+    clear_stickiness()
+    engine.dispose()
+
+def topology_names(client, token):
+    response = client.get('/api/lab/topologies', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 200
+    return {t['name'] for t in response.get_json()}
+
+def test_gets_read_from_replica_until_the_user_writes(app, client, db_session, replica, regular_user_token, admin_user_token):
+    user = User.query.filter_by(username="testuser").first()
+    admin = User.query.filter_by(username="testadmin").first()
+    db_session.add(LabTopology(name="OnPrimary", user_id=user.id))
+    db_session.commit()
+    with replica.begin() as connection:
+        connection.execute(LabTopology.__table__.insert(), [
+            {"name": "OnReplica", "user_id": user.id},
+            {"name": "AdminOnReplica", "user_id": admin.id},
+        ])
+
+    names = topology_names(app.test_client(), regular_user_token) # Fresh client: no cookie from the login
+    assert "OnReplica" in names and "OnPrimary" not in names
+
+    created = client.post('/api/lab/topologies', json={'name': 'JustWritten'},
+                          headers={'Authorization': f'Bearer {regular_user_token}'})
+    assert created.status_code == 201
+    assert STICKY_COOKIE in created.headers.get('Set-Cookie', '')
+
+    # Read-your-writes: the writer now reads from the primary ...
+    names = topology_names(client, regular_user_token)
+    assert {"OnPrimary", "JustWritten"} <= names and "OnReplica" not in names
+    # ... even from a client that lost the cookie (e.g. another worker's process-local state still applies)
+    assert "JustWritten" in topology_names(app.test_client(), regular_user_token)
+
+    # Other users are not affected by someone else's write
+    assert "AdminOnReplica" in topology_names(app.test_client(), admin_user_token)
+
+    # Once the window is over, reads go back to the replica
+    clear_stickiness()
+    assert "OnReplica" in topology_names(app.test_client(), regular_user_token)
+
+def test_without_replicas_everything_uses_the_primary(client, db_session, regular_user_token):
+    user = User.query.filter_by(username="testuser").first()
+    db_session.add(LabTopology(name="PrimaryOnly", user_id=user.id))
+    db_session.commit()
+    assert "PrimaryOnly" in topology_names(client, regular_user_token)
@@ -0,0 +1,116 @@
+import pytest
+from app.jobs import BackgroundJob
+from app.models import LabTopology, LabDeviceInstance, User
+
+def chain_payload(device_config_id, node_count):
+    nodes = [{"id": f"n{i}", "data": {"deviceConfigId": device_config_id, "label": f"J{i}"},
+              "position": {"x": i * 10, "y": 0}} for i in range(node_count)]
+    edges = [{"id": f"e{i}", "source": f"n{i}", "target": f"n{i + 1}"} for i in range(node_count - 1)]
+    return {"nodes": nodes, "edges": edges}
+
+@pytest.fixture
+def topology(db_session):
+    user = User.query.filter_by(username="testuser").first()
+    topology = LabTopology(name="JobLab", user_id=user.id)
+    db_session.add(topology)
+    db_session.commit()
+    return topology
+
+def test_async_save_returns_202_and_job_reports_result(client, regular_user_token, topology, sample_device_config):
+    headers = {'Authorization': f'Bearer {regular_user_token}'}
+    response = client.post(f'/api/lab/topologies/{topology.id}/save', json=chain_payload(sample_device_config.id, 30),
+                           headers={**headers, 'Prefer': 'respond-async'})
+    assert response.status_code == 202
+    location = response.headers['Location']
+    assert location == f"/api/jobs/{response.get_json()['id']}"
+
+    job = client.get(location, headers=headers).get_json()
+    assert job['kind'] == 'topology.save'
+    assert job['status'] == 'succeeded'
+    assert job['progress'] == 1.0
+    assert job['result']['revision'] >= 1
+    assert LabDeviceInstance.query.filter_by(topology_id=topology.id).count() == 30
+
+    listed = client.get('/api/jobs', headers=headers).get_json()
+    assert listed[0]['id'] == job['id']
+    assert len(client.get('/api/jobs?limit=1', headers=headers).get_json()) == 1
+    for limit in ('-1', '0', 'many'):
+        assert client.get(f'/api/jobs?limit={limit}', headers=headers).status_code == 400
+
+def test_async_save_is_validated_before_it_is_queued(client, regular_user_token, topology):
+    headers = {'Authorization': f'Bearer {regular_user_token}'}
+    for body in (chain_payload(999999, 2), [1, 2], {"nodes": ["n0"]}):
+        response = client.post(f'/api/lab/topologies/{topology.id}/save?async=1', json=body, headers=headers)
+        assert response.status_code == 400
+        response = client.post(f'/api/lab/topologies/{topology.id}/save', json=body, headers=headers)
+        assert response.status_code == 400
+    assert BackgroundJob.query.filter_by(kind='topology.save', status='failed').count() == 0
+
+def test_queued_saves_are_superseded_by_a_newer_one(client, regular_user_token, topology, db_session):
+    from app.json_provider import dumps
+    user = User.query.filter_by(username="testuser").first()
+    queued = BackgroundJob(kind='topology.save', user_id=user.id, params=dumps({"topology_id": topology.id}))
+    db_session.add(queued)
+    db_session.commit()
+
+    response = client.post(f'/api/lab/topologies/{topology.id}/save?async=1', json={"nodes": [], "edges": []},
+                           headers={'Authorization': f'Bearer {regular_user_token}'})
+    assert response.status_code == 202
+    db_session.expire_all()
+    assert queued.status == 'failed' and 'Superseded' in queued.error
+    assert queued.payload is None
+
+def test_failed_job_reports_error(client, regular_user_token):
+    headers = {'Authorization': f'Bearer {regular_user_token}'}
+    response = client.post('/api/lab/topologies/import?async=1', data=b'not an archive', headers=headers)
+    assert response.status_code == 202
+    job = client.get(response.headers['Location'], headers=headers).get_json()
+    assert job['status'] == 'failed'
+    assert 'archive' in job['error']
+
+def test_jobs_of_stopped_processes_are_failed(app, db_session):
+    from datetime import datetime, timedelta
+    from app.jobs import jobs
+    user = User.query.filter_by(username="testuser").first()
+    abandoned = BackgroundJob(kind='topology.save', user_id=user.id, status='running',
+                              heartbeat_at=datetime.utcnow() - timedelta(hours=1))
+    alive = BackgroundJob(kind='topology.save', user_id=user.id, status='queued', heartbeat_at=datetime.utcnow())
+    db_session.add_all([abandoned, alive])
+    db_session.commit()
+
+    assert jobs.fail_stale(app) >= 1
+    db_session.expire_all()
+    assert abandoned.status == 'failed' and 'restart' in abandoned.error
+    assert alive.status == 'queued'
+    alive.status = 'failed'  # Keep it out of later runs
+    db_session.commit()
+
+def test_async_export_result_download(client, regular_user_token, topology, sample_device_config):
+    headers = {'Authorization': f'Bearer {regular_user_token}'}
+    client.post(f'/api/lab/topologies/{topology.id}/save', json=chain_payload(sample_device_config.id, 5), headers=headers)
+    response = client.get(f'/api/lab/topologies/{topology.id}/export?async=1', headers=headers)
+    assert response.status_code == 202
+
+    job = client.get(response.headers['Location'], headers=headers).get_json()
+    assert job['status'] == 'succeeded' and job['has_download']
+    archive = client.get(f"{response.headers['Location']}/result", headers=headers)
+    assert archive.status_code == 200
+    assert archive.data.startswith(b'NLAB')
+
+def test_async_delete_and_job_visibility(client, regular_user_token, admin_user_token, topology, db_session):
+    headers = {'Authorization': f'Bearer {regular_user_token}'}
+    topo_id = topology.id
+    response = client.delete(f'/api/lab/topologies/{topo_id}', headers={**headers, 'Prefer': 'respond-async'})
+    assert response.status_code == 202
+    job_id = response.get_json()['id']
+    assert BackgroundJob.query.get(job_id).status == 'succeeded'
+    assert LabTopology.query.get(topo_id) is None
+
+    # Admins may inspect any job; other users get a 404
+    assert client.get(f'/api/jobs/{job_id}', headers={'Authorization': f'Bearer {admin_user_token}'}).status_code == 200
+    other = User(username="job_outsider", is_admin=False)
+    other.set_password("password")
+    db_session.add(other)
+    db_session.commit()
+    token = client.post('/api/auth/login', json={'username': 'job_outsider', 'password': 'password'}).get_json()['access_token']
+    assert client.get(f'/api/jobs/{job_id}', headers={'Authorization': f'Bearer {token}'}).status_code == 404
@@ -1,5 +1,6 @@
 import pytest
 from app.models import LabTopology, LabDeviceInstance, LabConnection, DeviceConfig, DeviceType, User
+from app.topology_writer import TopologyWriteError, save_topology_full
 
 # Helper function to create a basic device config for tests
 def ensure_device_config(db_session, user_id):
@@ -222,3 +223,576 @@ def test_unauthorized_access_to_others_topology(client, regular_user_token, admi
     response_admin_get = client.get(f'/api/lab/topologies/{admin_topo.id}', headers={'Authorization': f'Bearer {admin_user_token}'})
     assert response_admin_get.status_code == 200
     assert response_admin_get.get_json()['name'] == "AdminOnlyLab"
+
+def test_save_lab_topology_delta(client, regular_user_token, db_session, sample_device_config):
+    """Test that a delta save only touches the edited rows and keeps instance ids stable."""
+    user = User.query.filter_by(username="testuser").first()
+    topology = LabTopology(name="LabForDelta", user_id=user.id)
+    db_session.add(topology)
+    db_session.commit()
+    headers = {'Authorization': f'Bearer {regular_user_token}'}
+
+    full_payload = {
+        "nodes": [
+            {"id": "n1", "data": {"deviceConfigId": sample_device_config.id, "label": "R1"}, "position": {"x": 0, "y": 0}},
+            {"id": "n2", "data": {"deviceConfigId": sample_device_config.id, "label": "R2"}, "position": {"x": 10, "y": 10}}
+        ],
+        "edges": [{"id": "e1", "source": "n1", "target": "n2"}]
+    }
+    saved = client.post(f'/api/lab/topologies/{topology.id}/save', json=full_payload, headers=headers).get_json()
+    r1_id = next(n['id'] for n in saved['nodes'] if n['data']['label'] == "R1")
+    r2_id = next(n['id'] for n in saved['nodes'] if n['data']['label'] == "R2")
+
+    delta = {
+        "baseRevision": saved['revision'],
+        "nodes": {
+            "added": [{"id": "tmp_3", "data": {"deviceConfigId": sample_device_config.id, "label": "R3"}, "position": {"x": 5, "y": 5}}],
+            "moved": [{"id": r1_id, "position": {"x": 300, "y": 400}}],
+            "renamed": [{"id": r1_id, "data": {"label": "R1-core"}}],
+            "removed": [r2_id]
+        },
+        "edges": {"added": [{"id": "tmp_e", "source": r1_id, "target": "tmp_3"}]}
+    }
+    response = client.post(f'/api/lab/topologies/{topology.id}/delta', json=delta, headers=headers)
+    assert response.status_code == 200
+    result = response.get_json()
+    assert result['revision'] == saved['revision'] + 1
+    assert "tmp_3" in result['nodeIds']
+    assert "tmp_e" in result['edgeIds']
+
+    r1 = LabDeviceInstance.query.get(int(r1_id))
+    assert r1 is not None # Id survived the save
+    assert (r1.canvas_x, r1.canvas_y, r1.instance_name) == (300, 400, "R1-core")
+    assert LabDeviceInstance.query.get(int(r2_id)) is None
+    connections = LabConnection.query.filter_by(topology_id=topology.id).all()
+    assert len(connections) == 1 # Edge to R2 was removed along with the node
+    assert connections[0].target_instance_id == int(result['nodeIds']['tmp_3'])
+
+    # Renames use the React Flow node shape, like added nodes
+    response = client.post(f'/api/lab/topologies/{topology.id}/delta', json={
+        "baseRevision": result['revision'], "nodes": {"renamed": [{"id": r1_id, "label": "R1-edge"}]}}, headers=headers)
+    assert response.status_code == 400
+
+def test_save_lab_topology_delta_stale_revision(client, regular_user_token, db_session, sample_device_config):
+    """Test that a delta based on an outdated revision is rejected without writing anything."""
+    user = User.query.filter_by(username="testuser").first()
+    topology = LabTopology(name="LabForStaleDelta", user_id=user.id)
+    db_session.add(topology)
+    db_session.commit()
+    headers = {'Authorization': f'Bearer {regular_user_token}'}
+
+    client.post(f'/api/lab/topologies/{topology.id}/save', json={"nodes": [], "edges": []}, headers=headers)
+    delta = {
+        "baseRevision": 0,
+        "nodes": {"added": [{"id": "tmp_1", "data": {"deviceConfigId": sample_device_config.id}, "position": {"x": 0, "y": 0}}]}
+    }
+    response = client.post(f'/api/lab/topologies/{topology.id}/delta', json=delta, headers=headers)
+    assert response.status_code == 409
+    assert response.get_json()['revision'] == 1
+    assert LabDeviceInstance.query.filter_by(topology_id=topology.id).count() == 0
+
+def detail_shape(detail):
+    """Nodes and edges of a topology detail with ids replaced by node positions in the list."""
+    index = {n['id']: i for i, n in enumerate(detail['nodes'])}
+    nodes = [(n['data']['deviceConfigId'], n['data']['label'], n['position']) for n in detail['nodes']]
+    edges = sorted((index[e['source']], index[e['target']]) for e in detail['edges'])
+    return nodes, edges
+
+def build_chain_payload(device_config_id, node_count):
+    """React Flow style save payload with `node_count` nodes connected in a chain."""
+    nodes = [
+        {"id": f"n{i}", "data": {"deviceConfigId": device_config_id, "label": f"D{i}"}, "position": {"x": i * 10, "y": 0}}
+        for i in range(node_count)
+    ]
+    edges = [{"id": f"e{i}", "source": f"n{i}", "target": f"n{i + 1}"} for i in range(node_count - 1)]
+    return {"nodes": nodes, "edges": edges}
+
+def test_save_topology_full_query_count_is_constant(db_session, sample_device_config, count_queries):
+    """Test that a full save issues the same number of statements for small and large graphs."""
+    user = User.query.filter_by(username="testuser").first()
+    counts = []
+    for node_count in (5, 50, 300):
+        topology = LabTopology(name=f"BulkSave{node_count}", user_id=user.id)
+        db_session.add(topology)
+        db_session.commit()
+
+        payload = build_chain_payload(sample_device_config.id, node_count)
+        with count_queries() as counter:
+            id_map = save_topology_full(topology, payload)
+        db_session.commit()
+
+        assert len(id_map) == node_count
+        assert LabConnection.query.filter_by(topology_id=topology.id).count() == node_count - 1
+        counts.append(counter.count)
+
+    assert counts[0] == counts[1] == counts[2], f"Query count grew with node count: {counts}"
+
+def test_save_topology_full_rejects_unknown_config(db_session, sample_device_config):
+    """Test that all device configs are validated before anything is written."""
+    user = User.query.filter_by(username="testuser").first()
+    topology = LabTopology(name="BulkSaveInvalid", user_id=user.id)
+    db_session.add(topology)
+    db_session.commit()
+
+    payload = build_chain_payload(sample_device_config.id, 3)
+    payload["nodes"][2]["data"]["deviceConfigId"] = 999999
+    with pytest.raises(TopologyWriteError, match="999999"):
+        save_topology_full(topology, payload)
+    db_session.rollback()
+
+def test_get_lab_topology_detail_query_count_is_constant(client, regular_user_token, db_session, sample_device_config, count_queries):
+    """Test that loading a topology does not issue a query per device (no N+1)."""
+    user = User.query.filter_by(username="testuser").first()
+    headers = {'Authorization': f'Bearer {regular_user_token}'}
+    counts = []
+    for node_count in (3, 60):
+        topology = LabTopology(name=f"EagerLoad{node_count}", user_id=user.id)
+        db_session.add(topology)
+        db_session.commit()
+        save_topology_full(topology, build_chain_payload(sample_device_config.id, node_count))
+        db_session.commit()
+
+        with count_queries() as counter:
+            response = client.get(f'/api/lab/topologies/{topology.id}', headers=headers)
+        assert response.status_code == 200
+        json_data = response.get_json()
+        assert len(json_data['nodes']) == node_count
+        assert len(json_data['edges']) == node_count - 1
+        assert json_data['nodes'][0]['data']['iconPath'] == "icons/router.svg" # Falls back to the type icon
+        counts.append(counter.count)
+
+    assert counts[0] == counts[1], f"Query count grew with node count: {counts}"
+
+def test_get_lab_topology_detail_streaming(client, regular_user_token, db_session, sample_device_config, monkeypatch):
+    """The streaming mode returns the same payload as the regular detail response."""
+    import app.topology_reader as topology_reader
+    monkeypatch.setattr(topology_reader, 'STREAM_CHUNK_SIZE', 7) # Force several chunks
+
+    user = User.query.filter_by(username="testuser").first()
+    topology = LabTopology(name="StreamedLab", user_id=user.id)
+    db_session.add(topology)
+    db_session.commit()
+    save_topology_full(topology, build_chain_payload(sample_device_config.id, 20))
+    db_session.commit()
+    headers = {'Authorization': f'Bearer {regular_user_token}'}
+
+    regular = client.get(f'/api/lab/topologies/{topology.id}', headers=headers).get_json()
+    streamed = client.get(f'/api/lab/topologies/{topology.id}?stream=1', headers=headers)
+    assert streamed.status_code == 200
+    assert streamed.get_json() == regular
+
+def test_topology_versions_fetch_and_restore(client, regular_user_token, db_session, sample_device_config):
+    """Every save is recorded as a version that can be fetched and restored later."""
+    from app.topology_snapshots import LabTopologySnapshot
+    user = User.query.filter_by(username="testuser").first()
+    topology = LabTopology(name="VersionedLab", user_id=user.id)
+    db_session.add(topology)
+    db_session.commit()
+    headers = {'Authorization': f'Bearer {regular_user_token}'}
+    save_url = f'/api/lab/topologies/{topology.id}/save'
+
+    first = client.post(save_url, json=build_chain_payload(sample_device_config.id, 40), headers=headers).get_json()
+    node_id = first['nodes'][0]['id']
+    client.post(f'/api/lab/topologies/{topology.id}/delta', json={
+        "baseRevision": first['revision'],
+        "nodes": {"moved": [{"id": node_id, "position": {"x": 999, "y": 999}}]}
+    }, headers=headers)
+
+    versions = client.get(f'/api/lab/topologies/{topology.id}/versions', headers=headers).get_json()
+    assert [v['revision'] for v in versions] == [first['revision'] + 1, first['revision']]
+    assert not LabTopologySnapshot.query.filter_by(topology_id=topology.id, revision=first['revision'] + 1).first().is_keyframe
+
+    old = client.get(f'/api/lab/topologies/{topology.id}/versions/{first["revision"]}', headers=headers).get_json()
+    assert old['nodes'] == first['nodes']
+    assert old['edges'] == first['edges']
+
+    restored = client.post(f'/api/lab/topologies/{topology.id}/versions/{first["revision"]}/restore', headers=headers)
+    assert restored.status_code == 200
+    restored_json = restored.get_json()
+    assert restored_json['revision'] == first['revision'] + 2
+    assert sorted(n['position']['x'] for n in restored_json['nodes']) == sorted(n['position']['x'] for n in first['nodes'])
+
+    missing = client.get(f'/api/lab/topologies/{topology.id}/versions/9999', headers=headers)
+    assert missing.status_code == 404
+
+def test_delta_snapshots_match_the_written_graph(client, regular_user_token, db_session, sample_device_config):
+    """Snapshots of deltas are built from the touched rows and rebuild exactly the saved graph."""
+    from app.topology_snapshots import LabTopologySnapshot, capture_state, materialize
+    user = User.query.filter_by(username="testuser").first()
+    topology = LabTopology(name="EditSnapshotLab", user_id=user.id)
+    db_session.add(topology)
+    db_session.commit()
+    headers = {'Authorization': f'Bearer {regular_user_token}'}
+    saved = client.post(f'/api/lab/topologies/{topology.id}/save', json=build_chain_payload(sample_device_config.id, 5),
+                        headers=headers).get_json()
+    n0, n1, _, n3, _ = (n['id'] for n in saved['nodes'])
+
+    response = client.post(f'/api/lab/topologies/{topology.id}/delta', json={
+        "baseRevision": saved['revision'],
+        "nodes": {
+            "added": [{"id": "tmp", "data": {"deviceConfigId": sample_device_config.id, "label": "New"},
+                       "position": {"x": 7, "y": 8}}],
+            "moved": [{"id": n0, "position": {"x": 70, "y": 80}}],
+            "renamed": [{"id": n1, "data": {"label": "Renamed"}}],
+            "removed": [n3],
+        },
+        "edges": {"added": [{"id": "tmp_e", "source": n0, "target": "tmp"}]},
+    }, headers=headers)
+    revision = response.get_json()['revision']
+
+    snapshot = LabTopologySnapshot.query.filter_by(topology_id=topology.id, revision=revision).first()
+    assert not snapshot.is_keyframe
+    assert materialize(topology.id, revision) == capture_state(topology.id)
+
+def test_live_moves_are_coalesced_and_persisted_in_batches(client, regular_user_token, db_session, sample_device_config):
+    """Rapid drags of a node become one broadcast and one batched write with the final position."""
+    from app.collaboration import hub
+    from app.topology_revisions import current_revision
+    user = User.query.filter_by(username="testuser").first()
+    topology = LabTopology(name="LiveLab", user_id=user.id)
+    db_session.add(topology)
+    db_session.commit()
+    headers = {'Authorization': f'Bearer {regular_user_token}'}
+    saved = client.post(f'/api/lab/topologies/{topology.id}/save', json=build_chain_payload(sample_device_config.id, 2), headers=headers).get_json()
+    node_id = saved['nodes'][0]['id']
+
+    base_revision = current_revision(topology.id)
+    subscriber = hub.subscribe(topology.id)
+    try:
+        for x in (10, 20, 30):
+            response = client.post(f'/api/lab/topologies/{topology.id}/live', json={
+                "nodes": {"moved": [{"id": node_id, "position": {"x": x, "y": 5}}]}
+            }, headers=headers)
+            assert response.status_code == 202
+        assert LabDeviceInstance.query.get(int(node_id)).canvas_x == 0 # Nothing written yet
+
+        hub.tick(force_persist=True)
+        moves_event = subscriber.get_nowait()
+        assert moves_event.startswith('event: moves\n')
+        assert '"position":{"x":30,"y":5}' in moves_event
+        assert subscriber.get_nowait().startswith('event: revision\n')
+        assert subscriber.empty()
+
+        db_session.expire_all()
+        assert LabDeviceInstance.query.get(int(node_id)).canvas_x == 30
+
+        # The batched moves do not make a /delta client's base revision stale...
+        response = client.post(f'/api/lab/topologies/{topology.id}/delta', json={
+            "baseRevision": base_revision, "nodes": {"renamed": [{"id": node_id, "data": {"label": "Delta"}}]}
+        }, headers=headers)
+        assert response.status_code == 200
+        assert subscriber.get_nowait().startswith('event: delta\n')
+
+        response = client.post(f'/api/lab/topologies/{topology.id}/live', json={
+            "nodes": {"renamed": [{"id": node_id, "data": {"label": "Renamed"}}]}
+        }, headers=headers)
+        assert response.status_code == 200
+        assert subscriber.get_nowait().startswith('event: delta\n')
+
+        # ...but a structural write does
+        response = client.post(f'/api/lab/topologies/{topology.id}/delta', json={
+            "baseRevision": base_revision, "nodes": {"renamed": [{"id": node_id, "data": {"label": "Stale"}}]}
+        }, headers=headers)
+        assert response.status_code == 409
+    finally:
+        hub.unsubscribe(topology.id, subscriber)
+
+def test_live_structural_edit_writes_pending_moves_in_its_revision(client, regular_user_token, db_session, sample_device_config):
+    """Moves still buffered when a structural live edit arrives land in that edit's revision and snapshot."""
+    from app.collaboration import hub
+    from app.topology_revisions import current_revision
+    user = User.query.filter_by(username="testuser").first()
+    topology = LabTopology(name="LiveMergeLab", user_id=user.id)
+    db_session.add(topology)
+    db_session.commit()
+    headers = {'Authorization': f'Bearer {regular_user_token}'}
+    saved = client.post(f'/api/lab/topologies/{topology.id}/save', json=build_chain_payload(sample_device_config.id, 2), headers=headers).get_json()
+    first, second = (node['id'] for node in saved['nodes'])
+    base_revision = current_revision(topology.id)
+
+    response = client.post(f'/api/lab/topologies/{topology.id}/live', json={
+        "nodes": {"moved": [{"id": first, "position": {"x": 40, "y": 7}}]}
+    }, headers=headers)
+    assert response.status_code == 202
+    response = client.post(f'/api/lab/topologies/{topology.id}/live', json={
+        "nodes": {"renamed": [{"id": second, "data": {"label": "Merged"}}]}
+    }, headers=headers)
+    assert response.status_code == 200
+    assert response.get_json()['revision'] == base_revision + 1
+    assert hub.take_unpersisted_moves(topology.id) == {}
+
+    db_session.expire_all()
+    assert LabDeviceInstance.query.get(int(first)).canvas_x == 40
+    version = client.get(f'/api/lab/topologies/{topology.id}/versions/{base_revision + 1}', headers=headers).get_json()
+    assert {node['id']: node['position']['x'] for node in version['nodes']}[first] == 40
+    changes = client.get(f'/api/lab/topologies/{topology.id}/changes?since={base_revision}', headers=headers).get_json()
+    assert changes['reload'] is False
+
+def test_failed_move_flush_keeps_the_batch(app, monkeypatch):
+    from app import collaboration
+    from app.collaboration import hub
+
+    def failing(topology_id, moves):
+        raise RuntimeError("database is down")
+
+    monkeypatch.setattr(collaboration, 'persist_moves', failing)
+    hub.queue_moves(app, 987654, {1: {"x": 1, "y": 2}})
+    with app.app_context():
+        hub.tick(force_persist=True)
+    assert hub.take_unpersisted_moves(987654) == {1: {"x": 1, "y": 2}}
+    hub.tick()  # Drops the now idle channel
+
+def test_lagging_subscriber_is_told_to_reload(monkeypatch):
+    from app import collaboration
+    from app.collaboration import event_stream, hub
+    monkeypatch.setattr(collaboration, 'SUBSCRIBER_QUEUE_SIZE', 2)
+    subscriber = hub.subscribe(987655)
+    for i in range(3):
+        hub.publish(987655, 'delta', {"revision": i})
+
+    stream = event_stream(987655, subscriber)
+    assert next(stream).startswith('event: hello\n')
+    assert next(stream).startswith('event: reload\n')
+    assert list(stream) == []
+
+def test_get_lab_topology_analysis(client, regular_user_token, db_session, sample_device_config):
+    """Analysis reports components, cut vertices, cycles, degrees and shortest paths."""
+    user = User.query.filter_by(username="testuser").first()
+    topology = LabTopology(name="AnalysisLab", user_id=user.id)
+    db_session.add(topology)
+    db_session.commit()
+    headers = {'Authorization': f'Bearer {regular_user_token}'}
+
+    # a - b - c plus triangle c - d - e, and an isolated f
+    payload = build_chain_payload(sample_device_config.id, 6)
+    payload["edges"] = [
+        {"id": "ab", "source": "n0", "target": "n1"}, {"id": "bc", "source": "n1", "target": "n2"},
+        {"id": "cd", "source": "n2", "target": "n3"}, {"id": "de", "source": "n3", "target": "n4"},
+        {"id": "ec", "source": "n4", "target": "n2"},
+    ]
+    saved = client.post(f'/api/lab/topologies/{topology.id}/save', json=payload, headers=headers).get_json()
+    ids = {n['data']['label']: n['id'] for n in saved['nodes']} # D0..D5 -> backend id
+
+    response = client.get(f'/api/lab/topologies/{topology.id}/analysis?source={ids["D0"]}&target={ids["D4"]}', headers=headers)
+    assert response.status_code == 200
+    analysis = response.get_json()
+    assert analysis['components']['sizes'] == [5, 1]
+    assert sorted(analysis['articulation_points']) == sorted([ids["D1"], ids["D2"]])
+    assert analysis['cycles']['independent_cycles'] == 1
+    assert sorted(analysis['cycles']['example']) == sorted([ids["D2"], ids["D3"], ids["D4"]])
+    assert analysis['degree'][ids["D2"]] == 3
+    assert analysis['shortest_path']['path'] == [ids["D0"], ids["D1"], ids["D2"], ids["D4"]]
+
+    bad = client.get(f'/api/lab/topologies/{topology.id}/analysis?metrics=pagerank', headers=headers)
+    assert bad.status_code == 400
+
+def test_export_and_import_topology_archive(client, regular_user_token, db_session, sample_device_config):
+    """A lab exported as a binary archive imports into an identical new topology."""
+    import struct
+    import zlib
+    user = User.query.filter_by(username="testuser").first()
+    topology = LabTopology(name="ArchiveLab", description="to move", user_id=user.id)
+    db_session.add(topology)
+    db_session.commit()
+    headers = {'Authorization': f'Bearer {regular_user_token}'}
+    payload = build_chain_payload(sample_device_config.id, 200)
+    saved = client.post(f'/api/lab/topologies/{topology.id}/save', json=payload, headers=headers).get_json()
+
+    exported = client.get(f'/api/lab/topologies/{topology.id}/export', headers=headers)
+    assert exported.status_code == 200
+    assert exported.mimetype == 'application/vnd.network-lab.topology'
+    assert len(exported.data) < len(client.get(f'/api/lab/topologies/{topology.id}', headers=headers).data) / 5
+
+    imported = client.post('/api/lab/topologies/import?name=ArchiveLabCopy', data=exported.data,
+                           headers=dict(headers, **{'Content-Type': 'application/vnd.network-lab.topology'}))
+    assert imported.status_code == 201
+    assert imported.get_json()['name'] == 'ArchiveLabCopy'
+    copy = client.get(f'/api/lab/topologies/{imported.get_json()["id"]}', headers=headers).get_json()
+    assert detail_shape(copy) == detail_shape(saved)
+
+    corrupt = client.post('/api/lab/topologies/import', data=exported.data[:-10], headers=headers)
+    assert corrupt.status_code == 400
+    meta = b'{"name": "BadNames", "names": ["not", "a", "map"]}'
+    bad_names = b'NLAB\x01\x00' + zlib.compress(struct.pack('<III', 0, 0, len(meta)) + meta)
+    assert client.post('/api/lab/topologies/import', data=bad_names, headers=headers).status_code == 400
+    for meta in (b'{"name": 5}', b'{"name": "BadDescription", "description": ["x"]}'):
+        bad_meta = b'NLAB\x01\x00' + zlib.compress(struct.pack('<III', 0, 0, len(meta)) + meta)
+        assert client.post('/api/lab/topologies/import', data=bad_meta, headers=headers).status_code == 400
+    assert LabTopology.query.filter_by(user_id=user.id, name='ArchiveLab').count() == 1
+
+def test_clone_topology_copies_graph_in_database(client, regular_user_token, db_session, sample_device_config):
+    user = User.query.filter_by(username="testuser").first()
+    topology = LabTopology(name="CloneSource", user_id=user.id)
+    db_session.add(topology)
+    db_session.commit()
+    headers = {'Authorization': f'Bearer {regular_user_token}'}
+    saved = client.post(f'/api/lab/topologies/{topology.id}/save', json=build_chain_payload(sample_device_config.id, 40),
+                        headers=headers).get_json()
+
+    response = client.post(f'/api/lab/topologies/{topology.id}/clone', json={'count': 3, 'name': 'Pod {n}'}, headers=headers)
+    assert response.status_code == 201
+    copies = response.get_json()
+    assert [c['name'] for c in copies] == ['Pod 1', 'Pod 2', 'Pod 3']
+    for copy in copies:
+        detail = client.get(f'/api/lab/topologies/{copy["id"]}', headers=headers).get_json()
+        assert detail_shape(detail) == detail_shape(saved)
+        assert not set(n['id'] for n in detail['nodes']) & set(n['id'] for n in saved['nodes'])
+        version = client.get(f'/api/lab/topologies/{copy["id"]}/versions/1', headers=headers)
+        assert version.status_code == 200
+        assert detail_shape(version.get_json()) == detail_shape(saved)
+
+    assert client.post(f'/api/lab/topologies/{topology.id}/clone', json={'count': 0}, headers=headers).status_code == 400
+    for bad_name in (5, ['Pod'], '  '):
+        response = client.post(f'/api/lab/topologies/{topology.id}/clone', json={'name': bad_name}, headers=headers)
+        assert response.status_code == 400
+
+def test_publish_and_instantiate_template_for_users(client, regular_user_token, admin_user_token, db_session, sample_device_config):
+    admin = User.query.filter_by(username="testadmin").first()
+    user = User.query.filter_by(username="testuser").first()
+    topology = LabTopology(name="CourseLab", user_id=admin.id)
+    db_session.add(topology)
+    db_session.commit()
+    admin_headers = {'Authorization': f'Bearer {admin_user_token}'}
+    user_headers = {'Authorization': f'Bearer {regular_user_token}'}
+    saved = client.post(f'/api/lab/topologies/{topology.id}/save', json=build_chain_payload(sample_device_config.id, 10),
+                        headers=admin_headers).get_json()
+
+    published = client.post(f'/api/lab/topologies/{topology.id}/template', json={'name': 'Course Lab 1'}, headers=admin_headers)
+    assert published.status_code == 201
+    template_id = published.get_json()['id']
+    assert any(t['id'] == template_id for t in client.get('/api/lab/templates', headers=user_headers).get_json())
+
+    # Any user may instantiate for themselves, but only administrators may create copies for others
+    own = client.post(f'/api/lab/templates/{template_id}/instantiate', json={}, headers=user_headers)
+    assert own.status_code == 201 and own.get_json()[0]['name'] == 'Course Lab 1'
+    forbidden = client.post(f'/api/lab/templates/{template_id}/instantiate', json={'user_ids': [admin.id]}, headers=user_headers)
+    assert forbidden.status_code == 403
+
+    students = client.post(f'/api/lab/templates/{template_id}/instantiate', json={'user_ids': [user.id, admin.id]},
+                           headers=admin_headers)
+    assert students.status_code == 201
+    student_copy = students.get_json()[0] # One copy per user, in the order given
+    detail = client.get(f'/api/lab/topologies/{student_copy["id"]}', headers=user_headers).get_json()
+    assert detail_shape(detail) == detail_shape(saved)
+    versions = client.get(f'/api/lab/topologies/{student_copy["id"]}/versions', headers=user_headers).get_json()
+    assert [(v['revision'], v['is_keyframe']) for v in versions] == [(1, True)]
+    for bad_ids in ([[user.id]], ['1'], user.id):
+        response = client.post(f'/api/lab/templates/{template_id}/instantiate', json={'user_ids': bad_ids}, headers=admin_headers)
+        assert response.status_code == 400
+    response = client.post(f'/api/lab/templates/{template_id}/instantiate', json={'user_ids': [user.id], 'name': 5},
+                           headers=admin_headers)
+    assert response.status_code == 400
+
+    # Deleting the source topology unpublishes the template; copies are kept
+    assert client.delete(f'/api/lab/topologies/{topology.id}', headers=admin_headers).status_code == 204
+    assert not any(t['id'] == template_id for t in client.get('/api/lab/templates', headers=user_headers).get_json())
+    assert client.get(f'/api/lab/topologies/{student_copy["id"]}', headers=user_headers).status_code == 200
+
+def test_layout_topology_saves_positions(client, regular_user_token, db_session, sample_device_config):
+    user = User.query.filter_by(username="testuser").first()
+    topology = LabTopology(name="LayoutLab", user_id=user.id)
+    db_session.add(topology)
+    db_session.commit()
+    headers = {'Authorization': f'Bearer {regular_user_token}'}
+    payload = build_chain_payload(sample_device_config.id, 30)
+    for node in payload['nodes']:
+        node['position'] = {"x": 0, "y": 0} # As after a bulk import
+    client.post(f'/api/lab/topologies/{topology.id}/save', json=payload, headers=headers)
+
+    preview = client.post(f'/api/lab/topologies/{topology.id}/layout', json={'algorithm': 'grid', 'apply': False},
+                          headers=headers).get_json()
+    assert preview['revision'] == 1
+    assert len({(p['x'], p['y']) for p in preview['positions'].values()}) == 30
+
+    response = client.post(f'/api/lab/topologies/{topology.id}/layout', json={'algorithm': 'layered', 'spacing': 100},
+                           headers=headers)
+    assert response.status_code == 200
+    result = response.get_json()
+    assert result['revision'] == 2
+    detail = client.get(f'/api/lab/topologies/{topology.id}', headers=headers).get_json()
+    assert {n['id']: n['position'] for n in detail['nodes']} == result['positions']
+    assert len({(p['x'], p['y']) for p in result['positions'].values()}) == 30
+
+    bad = client.post(f'/api/lab/topologies/{topology.id}/layout', json={'algorithm': 'circular'}, headers=headers)
+    assert bad.status_code == 400
+
+def test_force_layout_spreads_nodes(client, regular_user_token, db_session, sample_device_config):
+    pytest.importorskip("numpy")
+    user = User.query.filter_by(username="testuser").first()
+    topology = LabTopology(name="ForceLayoutLab", user_id=user.id)
+    db_session.add(topology)
+    db_session.commit()
+    headers = {'Authorization': f'Bearer {regular_user_token}'}
+    client.post(f'/api/lab/topologies/{topology.id}/save', json=build_chain_payload(sample_device_config.id, 50), headers=headers)
+
+    result = client.post(f'/api/lab/topologies/{topology.id}/layout', json={'algorithm': 'force'}, headers=headers).get_json()
+    points = list(result['positions'].values())
+    closest = min(abs(a['x'] - b['x']) + abs(a['y'] - b['y']) for i, a in enumerate(points) for b in points[i + 1:])
+    assert closest >= 20
+
+def test_topology_viewport_returns_nodes_in_bbox_with_stubs(client, regular_user_token, db_session, sample_device_config):
+    user = User.query.filter_by(username="testuser").first()
+    topology = LabTopology(name="ViewportLab", user_id=user.id)
+    db_session.add(topology)
+    db_session.commit()
+    headers = {'Authorization': f'Bearer {regular_user_token}'}
+    saved = client.post(f'/api/lab/topologies/{topology.id}/save', json=build_chain_payload(sample_device_config.id, 300),
+                        headers=headers).get_json()
+    ids = [n['id'] for n in saved['nodes']] # Chain along y=0, x = 10 * position in the chain
+
+    response = client.get(f'/api/lab/topologies/{topology.id}?bbox=0,-5,95,5', headers=headers)
+    assert response.status_code == 200
+    viewport = response.get_json()
+    assert [n['id'] for n in viewport['nodes']] == ids[:10]
+    assert len(viewport['edges']) == 10 # 9 inside the box and the one leaving it
+    assert [s['id'] for s in viewport['stubs']] == [ids[10]]
+    assert viewport['stubs'][0]['position'] == {"x": 100, "y": 0}
+    assert viewport['total_nodes'] == 300 and not viewport['truncated']
+    assert viewport['bounds'] == [0, 0, 2990, 0]
+
+    # A box in the middle of the chain has a stub on each side
+    middle = client.get(f'/api/lab/topologies/{topology.id}?bbox=1500,-5,1519,5', headers=headers).get_json()
+    assert [n['id'] for n in middle['nodes']] == ids[150:152]
+    assert [s['id'] for s in middle['stubs']] == [ids[149], ids[152]]
+
+    assert client.get(f'/api/lab/topologies/{topology.id}?bbox=10,0,5', headers=headers).status_code == 400
+
+def test_topology_changes_since_revision(client, regular_user_token, db_session, sample_device_config):
+    from app.topology_changes import compact_changes
+    user = User.query.filter_by(username="testuser").first()
+    topology = LabTopology(name="ChangeFeedLab", user_id=user.id)
+    db_session.add(topology)
+    db_session.commit()
+    headers = {'Authorization': f'Bearer {regular_user_token}'}
+    saved = client.post(f'/api/lab/topologies/{topology.id}/save', json=build_chain_payload(sample_device_config.id, 3),
+                        headers=headers).get_json()
+    n0, n1, n2 = (n['id'] for n in saved['nodes'])
+    edge_n1_n2 = next(e['id'] for e in saved['edges'] if e['source'] == n1)
+
+    client.post(f'/api/lab/topologies/{topology.id}/delta', json={
+        "baseRevision": saved['revision'], "nodes": {"moved": [{"id": n0, "position": {"x": 50, "y": 60}}]}}, headers=headers)
+    client.post(f'/api/lab/topologies/{topology.id}/delta', json={
+        "baseRevision": saved['revision'] + 1, "nodes": {"removed": [n2]}}, headers=headers)
+
+    def changes(since):
+        response = client.get(f'/api/lab/topologies/{topology.id}/changes?since={since}', headers=headers)
+        assert response.status_code == 200
+        return response.get_json()
+
+    feed = changes(saved['revision'])
+    assert feed['revision'] == saved['revision'] + 2 and not feed['reload']
+    assert [(n['id'], n['position']) for n in feed['nodes']['upserted']] == [(n0, {"x": 50, "y": 60})]
+    assert feed['nodes']['removed'] == [n2]
+    assert feed['edges'] == {"upserted": [], "removed": [edge_n1_n2]}
+
+    current = changes(feed['revision'])
+    assert current['nodes'] == {"upserted": [], "removed": []} and not current['reload']
+
+    # The first save had no snapshot to diff against, so older clients must reload
+    assert changes(0)['reload'] is True
+
+    compact_changes(topology.id, saved['revision'] + 1)
+    db_session.commit()
+    assert changes(saved['revision'])['reload'] is True
+    assert changes(feed['revision'] + 5)['reload'] is True
+    assert client.get(f'/api/lab/topologies/{topology.id}/changes', headers=headers).status_code == 400
@@ -0,0 +1,39 @@
+import pytest
+from app.instrumentation import metrics
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    metrics.reset()
+    yield
+
+def test_metrics_endpoint_exposes_prometheus_text(client, regular_user_token):
+    """Requests to lab routes show up as latency, statement and size histograms."""
+    headers = {'Authorization': f'Bearer {regular_user_token}'}
+    client.get('/api/lab/topologies', headers=headers)
+    client.get('/api/lab/topologies', headers=headers)
+
+    response = client.get('/api/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    text = response.get_data(as_text=True)
+    labels = 'endpoint="lab_bp.get_lab_topologies",method="GET"'
+    assert f'http_requests_total{{{labels},status="200"}} 2' in text
+    assert f'http_request_duration_seconds_count{{{labels}}} 2' in text
+    assert f'http_request_db_statements_bucket{{{labels},le="+Inf"}} 2' in text
+    assert f'http_response_size_bytes_count{{{labels}}} 2' in text
+
+def test_metrics_count_sql_statements(client, regular_user_token):
+    """The statement histogram reflects the queries a route actually issued."""
+    client.get('/api/lab/topologies', headers={'Authorization': f'Bearer {regular_user_token}'})
+    histogram = metrics._histograms['http_request_db_statements'][('lab_bp.get_lab_topologies', 'GET')]
+    assert histogram.count == 1
+    assert histogram.total >= 1
+
+def test_metrics_token(app, client):
+    """A configured METRICS_TOKEN is required to scrape."""
+    app.config['METRICS_TOKEN'] = 'scrape-secret'
+    try:
+        assert client.get('/api/metrics').status_code == 401
+        assert client.get('/api/metrics', headers={'Authorization': 'Bearer scrape-secret'}).status_code == 200
+    finally:
+        app.config.pop('METRICS_TOKEN')
@@ -0,0 +1,83 @@
+"""Per-endpoint SQL statement budgets.
+
+Every endpoint below is called against a small and a large data set. The test
+fails when a request goes over its budget (listing the statements it ran) or
+when the statement count grows with the data, which is how N+1 regressions
+such as lazy relationship loads in a loop show up.
+"""
+import itertools
+import pytest
+from app.models import LabTopology, DeviceConfig, DeviceType, User
+from app.topology_revisions import bump_revision
+from app.topology_snapshots import record_snapshot
+from app.topology_writer import save_topology_full
+
+SMALL, LARGE = 3, 120
+
+_unique = itertools.count()
+
+def seed_lab(db_session, size):
+    """A lab of `size` chained nodes, each on its own DeviceConfig, plus one unused config."""
+    batch = next(_unique)
+    user = User.query.filter_by(username="testuser").first()
+    router = DeviceType.query.filter_by(name="Router").first()
+    configs = [DeviceConfig(name=f"Budget{batch}-{i}", device_type_id=router.id, hostname_ip=f"10.7.{batch % 250}.{i}")
+               for i in range(size + 1)]
+    db_session.add_all(configs)
+    topology = LabTopology(name=f"BudgetLab{batch}", user_id=user.id)
+    db_session.add(topology)
+    db_session.commit()
+
+    nodes = [{"id": f"n{i}", "data": {"deviceConfigId": config.id}, "position": {"x": i, "y": 0}}
+             for i, config in enumerate(configs[:size])]
+    edges = [{"id": f"e{i}", "source": f"n{i}", "target": f"n{i + 1}"} for i in range(size - 1)]
+    save_topology_full(topology, {"nodes": nodes, "edges": edges})
+    record_snapshot(topology.id, bump_revision(topology.id))
+    db_session.commit()
+    return {
+        "topology_id": topology.id,
+        "config_id": configs[0].id,
+        "unused_config_id": configs[-1].id,
+        "payload": {"nodes": nodes, "edges": edges},
+    }
+
+# (label, method, url(lab), body(lab) or None, use admin token, budget)
+ENDPOINT_BUDGETS = [
+    ("list topologies", 'GET', lambda lab: '/api/lab/topologies', None, False, 2),
+    ("topology detail", 'GET', lambda lab: f'/api/lab/topologies/{lab["topology_id"]}', None, False, 4),
+    ("topology viewport", 'GET', lambda lab: f'/api/lab/topologies/{lab["topology_id"]}?bbox=0,-10,60,10', None, False, 5),
+    ("topology changes", 'GET', lambda lab: f'/api/lab/topologies/{lab["topology_id"]}/changes?since=0', None, False, 4),
+    ("topology versions", 'GET', lambda lab: f'/api/lab/topologies/{lab["topology_id"]}/versions', None, False, 2),
+    ("topology analysis", 'GET', lambda lab: f'/api/lab/topologies/{lab["topology_id"]}/analysis', None, False, 5),
+    ("topology export", 'GET', lambda lab: f'/api/lab/topologies/{lab["topology_id"]}/export', None, False, 3),
+    ("full save", 'POST', lambda lab: f'/api/lab/topologies/{lab["topology_id"]}/save',
+     lambda lab: lab["payload"], False, 25),
+    ("layered layout", 'POST', lambda lab: f'/api/lab/topologies/{lab["topology_id"]}/layout',
+     lambda lab: {"algorithm": "layered"}, False, 15),
+    ("clone topology x20", 'POST', lambda lab: f'/api/lab/topologies/{lab["topology_id"]}/clone',
+     lambda lab: {"count": 20}, False, 10),
+    ("delete topology", 'DELETE', lambda lab: f'/api/lab/topologies/{lab["topology_id"]}', None, False, 11),
+    ("search", 'GET', lambda lab: '/api/search?q=budget', None, False, 4),
+    ("device types", 'GET', lambda lab: '/api/admin/device-types', None, False, 2),
+    ("device configs", 'GET', lambda lab: '/api/admin/device-configs', None, False, 2),
+    ("device configs page", 'GET', lambda lab: '/api/admin/device-configs?limit=50&name_prefix=Budget', None, False, 2),
+    ("device config detail", 'GET', lambda lab: f'/api/admin/device-configs/{lab["config_id"]}', None, False, 2),
+    ("delete device config", 'DELETE', lambda lab: f'/api/admin/device-configs/{lab["unused_config_id"]}', None, True, 6),
+]
+
+@pytest.mark.parametrize("label,method,url,body,as_admin,budget", ENDPOINT_BUDGETS, ids=[e[0] for e in ENDPOINT_BUDGETS])
+def test_endpoint_query_budget(client, db_session, regular_user_token, admin_user_token, query_budget,
+                               label, method, url, body, as_admin, budget):
+    headers = {'Authorization': f'Bearer {admin_user_token if as_admin else regular_user_token}'}
+    counts = {}
+    for size in (SMALL, LARGE):
+        lab = seed_lab(db_session, size)
+        request_label = f"{method} {label} ({size} nodes)"
+        with query_budget(budget, request_label) as counter:
+            response = client.open(url(lab), method=method, headers=headers, json=body(lab) if body else None)
+        assert response.status_code < 400, f"{request_label} returned {response.status_code}"
+        counts[size] = counter
+
+    if counts[LARGE].count > counts[SMALL].count:
+        pytest.fail(f"{method} {label} grows with data size: {counts[SMALL].count} statements for {SMALL} nodes, "
+                    f"{counts[LARGE].count} for {LARGE}:\n{counts[LARGE].report()}", pytrace=False)
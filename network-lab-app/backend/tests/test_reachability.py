@@ -0,0 +1,75 @@
+import asyncio
+import socket
+import time
+import pytest
+from app.models import DeviceConfig, DeviceType
+from app.reachability import clear_cache, parse_target, probe_many
+
+@pytest.fixture
+def listener():
+    """A local TCP listener standing in for a device's SSH port."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('127.0.0.1', 0))
+    sock.listen(128)
+    yield sock.getsockname()[1]
+    sock.close()
+
+@pytest.fixture
+def closed_port():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    clear_cache()
+    yield
+    clear_cache()
+
+def test_parse_target():
+    assert parse_target("10.0.0.1", 22) == ("10.0.0.1", 22)
+    assert parse_target("admin@router1:2222", 22) == ("router1", 2222)
+    assert parse_target("[2001:db8::1]:830", 22) == ("2001:db8::1", 830)
+    assert parse_target("2001:db8::1", 22) == ("2001:db8::1", 22)
+
+def test_probe_many_runs_concurrently(listener, closed_port):
+    """Many probes complete in about the time of one, not one after another."""
+    targets = [('127.0.0.1', listener)] * 1 + [('127.0.0.1', closed_port)]
+    # 10.255.255.1 is non-routable and times out; 50 of them must not take 50 timeouts
+    targets += [('10.255.255.1', 22 + i) for i in range(50)]
+    started = time.perf_counter()
+    results = asyncio.run(probe_many(set(targets), timeout=0.5, concurrency=64))
+    elapsed = time.perf_counter() - started
+
+    assert results[('127.0.0.1', listener)]['reachable'] is True
+    assert results[('127.0.0.1', closed_port)]['reachable'] is False
+    assert elapsed < 3 # Sequential probing would take at least 25 s
+
+def test_device_configs_reachability_endpoint(client, admin_user_token, db_session, listener, closed_port):
+    router_type = DeviceType.query.filter_by(name="Router").first()
+    up = DeviceConfig(name="ProbeUp", device_type_id=router_type.id, hostname_ip=f"127.0.0.1:{listener}")
+    down = DeviceConfig(name="ProbeDown", device_type_id=router_type.id, hostname_ip=f"127.0.0.1:{closed_port}")
+    db_session.add_all([up, down])
+    db_session.commit()
+
+    response = client.get('/api/admin/device-configs/reachability', headers={'Authorization': f'Bearer {admin_user_token}'})
+    assert response.status_code == 200
+    status = {r['device_config_id']: r for r in response.get_json()}
+    assert status[up.id]['reachable'] is True
+    assert status[down.id]['reachable'] is False
+    assert status[up.id]['port'] == listener
+
+def test_probe_many_reports_invalid_targets(listener):
+    """A bad port or host name fails its own probe instead of the whole batch."""
+    targets = {('127.0.0.1', listener), ('127.0.0.1', 99999), ('a' * 64 + '.example', 22)}
+    results = asyncio.run(probe_many(targets, timeout=0.5, concurrency=8))
+    assert results[('127.0.0.1', listener)]['reachable'] is True
+    assert results[('127.0.0.1', 99999)] == {"reachable": False, "error": "invalid target"}
+    assert results[('a' * 64 + '.example', 22)]['reachable'] is False
+
+def test_device_configs_reachability_requires_admin(client, regular_user_token):
+    response = client.get('/api/admin/device-configs/reachability?refresh=1',
+                          headers={'Authorization': f'Bearer {regular_user_token}'})
+    assert response.status_code == 403
@@ -0,0 +1,97 @@
+import pytest
+from app.models import DeviceConfig, DeviceType, LabTopology, User
+from app.search import reset_index
+
+@pytest.fixture
+def search_configs(db_session):
+    router_type = DeviceType.query.filter_by(name="Router").first()
+    configs = [("SrchCore01", "10.77.0.1", None), ("SrchCore02", "10.77.0.2", None),
+               ("EdgeSrchFw", "10.78.1.1", "perimeter firewall"), ("SrchBorder", "border.srch.example.net", None)]
+    for name, hostname_ip, notes in configs:
+        if DeviceConfig.query.filter_by(name=name).first() is None:
+            db_session.add(DeviceConfig(name=name, device_type_id=router_type.id, hostname_ip=hostname_ip, notes=notes))
+    db_session.commit()
+    reset_index()
+    yield
+    reset_index()
+
+def search(client, token, query):
+    return client.get(f'/api/search?{query}', headers={'Authorization': f'Bearer {token}'})
+
+def test_search_ranks_prefix_before_substring(client, regular_user_token, search_configs):
+    response = search(client, regular_user_token, 'q=srch&types=device_configs')
+    assert response.status_code == 200
+    names = [r['name'] for r in response.get_json()]
+    # Name prefixes first (by name), then the word and substring matches
+    assert names == ["SrchBorder", "SrchCore01", "SrchCore02", "EdgeSrchFw"]
+    assert response.headers['X-Total-Count'] == '4'
+
+    exact = search(client, regular_user_token, 'q=srchcore01').get_json()
+    assert exact[0]['name'] == "SrchCore01"
+    assert exact[0]['score'] == 100
+    assert exact[0]['device_type_name'] == "Router"
+
+def test_search_matches_ip_cidr_and_notes(client, regular_user_token, search_configs):
+    names = [r['name'] for r in search(client, regular_user_token, 'q=10.77.0.0/24').get_json()]
+    assert names == ["SrchCore01", "SrchCore02"]
+
+    exact_ip = search(client, regular_user_token, 'q=10.78.1.1').get_json()
+    assert exact_ip[0]['name'] == "EdgeSrchFw"
+    assert exact_ip[0]['matched'] == ['hostname_ip']
+
+    # Every term has to match
+    names = [r['name'] for r in search(client, regular_user_token, 'q=srch+perimeter').get_json()]
+    assert names == ["EdgeSrchFw"]
+
+def test_search_paginates_with_cursor(client, regular_user_token, search_configs):
+    names = []
+    url_query = 'q=srch&types=device_configs&limit=3'
+    response = search(client, regular_user_token, url_query)
+    names += [r['name'] for r in response.get_json()]
+    cursor = response.headers['X-Next-Cursor']
+    response = search(client, regular_user_token, f'{url_query}&cursor={cursor}')
+    names += [r['name'] for r in response.get_json()]
+    assert 'X-Next-Cursor' not in response.headers
+    assert names == ["SrchBorder", "SrchCore01", "SrchCore02", "EdgeSrchFw"]
+
+def test_search_sees_catalog_writes(client, regular_user_token, search_configs, db_session):
+    assert search(client, regular_user_token, 'q=lateaddedsw').get_json() == []
+    switch_type = DeviceType.query.filter_by(name="Switch").first()
+    db_session.add(DeviceConfig(name="LateAddedSw", device_type_id=switch_type.id, hostname_ip="10.79.0.1"))
+    db_session.commit()
+    assert [r['name'] for r in search(client, regular_user_token, 'q=lateaddedsw').get_json()] == ["LateAddedSw"]
+
+def test_search_topologies_are_per_user(client, regular_user_token, admin_user_token, db_session):
+    user = User.query.filter_by(username="testuser").first()
+    db_session.add_all([
+        LabTopology(name="Srch Campus Lab", description="two spines", user_id=user.id),
+        LabTopology(name="Other", description="campus 100%_done", user_id=user.id),
+    ])
+    db_session.commit()
+
+    results = search(client, regular_user_token, 'q=campus&types=topologies').get_json()
+    assert [(r['type'], r['name']) for r in results] == [("topology", "Srch Campus Lab"), ("topology", "Other")]
+    assert results[1]['matched'] == ['description']
+    # LIKE wildcards in the query are literal
+    assert [r['name'] for r in search(client, regular_user_token, 'q=100%25_&types=topologies').get_json()] == ["Other"]
+    assert search(client, admin_user_token, 'q=campus&types=topologies').get_json() == []
+
+def test_search_keeps_the_best_topologies_when_truncated(client, regular_user_token, db_session, monkeypatch):
+    import app.search as search_module
+    user = User.query.filter_by(username="testuser").first()
+    db_session.add_all([LabTopology(name=f"Lab {i}", description="cutoverlab notes", user_id=user.id) for i in range(3)])
+    db_session.add(LabTopology(name="Cutoverlab Main", user_id=user.id))
+    db_session.commit()
+    monkeypatch.setattr(search_module, 'TOPOLOGY_CANDIDATE_LIMIT', 2)
+
+    response = search(client, regular_user_token, 'q=cutoverlab&types=topologies')
+    assert [r['name'] for r in response.get_json()][0] == "Cutoverlab Main"
+    assert response.headers['X-Search-Truncated'] == 'true'
+    assert 'X-Search-Truncated' not in search(client, regular_user_token, 'q=cutoverlab+main&types=topologies').headers
+
+def test_search_rejects_bad_parameters(client, regular_user_token):
+    assert search(client, regular_user_token, 'q=').status_code == 400
+    assert search(client, regular_user_token, 'q=x&types=users').status_code == 400
+    assert search(client, regular_user_token, 'q=x&limit=zero').status_code == 400
+    assert search(client, regular_user_token, 'q=x&cursor=bogus').status_code == 400
+    assert client.get('/api/search?q=x').status_code == 401
@@ -0,0 +1,168 @@
+import json
+import queue
+import socket
+import threading
+import time
+import pytest
+
+paramiko = pytest.importorskip('paramiko')
+
+from app.ssh_broker import BrokerConnectError, KnownHostsPolicy, TransportPool, relay
+
+class EchoServer(paramiko.ServerInterface):
+    def check_auth_password(self, username, password):
+        ok = (username, password) == ('lab', 'secret')
+        return paramiko.AUTH_SUCCESSFUL if ok else paramiko.AUTH_FAILED
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED if kind == 'session' else paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_pty_request(self, channel, term, width, height, pixelwidth, pixelheight, modes):
+        return True
+
+    def check_channel_shell_request(self, channel):
+        threading.Thread(target=self._echo, args=(channel,), daemon=True).start()
+        return True
+
+    def _echo(self, channel):
+        while True:
+            data = channel.recv(1024)
+            if not data:
+                return
+            channel.sendall(data.upper())
+
+@pytest.fixture(scope='module')
+def host_key():
+    return paramiko.RSAKey.generate(1024)
+
+@pytest.fixture
+def ssh_server(host_key):
+    """A local SSH server whose shell echoes input upper-cased; counts handshakes."""
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(16)
+    handshakes = []
+    transports = []
+
+    def serve():
+        while True:
+            try:
+                client, _ = listener.accept()
+            except OSError:
+                return
+            transport = paramiko.Transport(client)
+            transport.add_server_key(host_key)
+            transport.start_server(server=EchoServer())
+            transports.append(transport)
+            handshakes.append(1)
+
+    threading.Thread(target=serve, daemon=True).start()
+    yield listener.getsockname()[1], handshakes
+    listener.close()
+    for transport in transports:
+        transport.close()
+
+def known_hosts_file(path, port, key):
+    known = paramiko.HostKeys()
+    known.add(f"[127.0.0.1]:{port}", key.get_name(), key)
+    known.save(str(path))
+    return str(path)
+
+@pytest.fixture
+def broker(ssh_server, host_key, tmp_path):
+    policy = KnownHostsPolicy(known_hosts_file(tmp_path / 'known_hosts', ssh_server[0], host_key))
+    pool = TransportPool(connect_timeout=5, host_key_policy=policy)
+    yield pool
+    pool.close_all()
+
+def read_until(channel, expected):
+    received = b''
+    while expected not in received:
+        chunk = channel.recv(1024)
+        assert chunk, "channel closed early"
+        received += chunk
+    return received
+
+def test_reopening_a_terminal_reuses_the_transport(ssh_server, broker):
+    port, handshakes = ssh_server
+    first, release_first = broker.open_shell(1, '127.0.0.1', port, 'lab', password='secret')
+    first.sendall(b'show version\n')
+    assert b'SHOW VERSION' in read_until(first, b'SHOW VERSION')
+    release_first()
+
+    second, release_second = broker.open_shell(1, '127.0.0.1', port, 'lab', password='secret')
+    second.sendall(b'ping\n')
+    assert b'PING' in read_until(second, b'PING')
+    release_second()
+
+    assert len(handshakes) == 1
+    assert len(broker) == 1
+
+def test_transports_are_not_shared_across_credentials(ssh_server, broker):
+    port, handshakes = ssh_server
+    _, release = broker.open_shell(1, '127.0.0.1', port, 'lab', password='secret')
+    release()
+    with pytest.raises(BrokerConnectError):
+        broker.open_shell(1, '127.0.0.1', port, 'lab', password='wrong')
+    # Another user with the right password still gets a transport of their own
+    _, release = broker.open_shell(2, '127.0.0.1', port, 'lab', password='secret')
+    release()
+    assert len(broker) == 2
+
+def test_unknown_host_keys_are_refused(ssh_server, tmp_path):
+    port, _ = ssh_server
+    other_key = paramiko.RSAKey.generate(1024)
+    for path in (tmp_path / 'missing', known_hosts_file(tmp_path / 'other', port, other_key)):
+        pool = TransportPool(connect_timeout=5, host_key_policy=KnownHostsPolicy(str(path)))
+        with pytest.raises(BrokerConnectError, match='Host key'):
+            pool.open_shell(1, '127.0.0.1', port, 'lab', password='secret')
+        assert len(pool) == 0
+
+def test_idle_transports_are_evicted(ssh_server, broker):
+    port, _ = ssh_server
+    _, release = broker.open_shell(1, '127.0.0.1', port, 'lab', password='secret')
+    broker.idle_timeout = 0
+    assert broker.evict_idle() == 0 # A channel is still open
+    release()
+    assert broker.evict_idle() == 1
+    assert len(broker) == 0
+
+class FakeSocket:
+    """Minimal stand-in for a flask-sock WebSocket."""
+    def __init__(self, frames):
+        self.incoming = queue.Queue()
+        for frame in frames:
+            self.incoming.put(frame)
+        self.sent = []
+
+    def receive(self, timeout=None):
+        try:
+            frame = self.incoming.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        if frame is StopIteration:
+            raise ConnectionError("client closed")
+        return frame
+
+    def send(self, data):
+        self.sent.append(data)
+
+def test_relay_forwards_input_and_output(ssh_server, broker):
+    port, _ = ssh_server
+    channel, release = broker.open_shell(1, '127.0.0.1', port, 'lab', password='secret')
+    ws = FakeSocket([json.dumps({"type": "resize", "cols": 120, "rows": 40}),
+                     json.dumps({"type": "input", "data": "conf t\n"})])
+    worker = threading.Thread(target=lambda: pytest.raises(ConnectionError, relay, ws, channel, 0.05))
+    worker.start()
+    for _ in range(100):
+        if 'CONF T' in ''.join(ws.sent):
+            break
+        time.sleep(0.05)
+    ws.incoming.put(StopIteration)
+    worker.join(timeout=5)
+    release()
+    assert 'CONF T\n' in ''.join(ws.sent)
+    assert channel.closed
@@ -108,13 +108,117 @@ export interface SaveTopologyPayload {
 }
 
 
+// Labs with at least this many nodes are saved by a background job (Prefer: respond-async).
+const ASYNC_SAVE_NODES = 5000;
+
+// Saves are rate limited per user: 429 carries Retry-After (see retryAfterSeconds), also while another save
+// of the same lab is running. Servers that let saves wait answer a superseded one with 409 {superseded: true};
+// ignore it.
 export const saveLabTopology = async (topologyId: number, payload: SaveTopologyPayload, token: string): Promise<LabTopologyData> => {
   // The backend will need to translate FrontendNodeForSave into its LabDeviceInstance structure
   // and FrontendEdgeForSave into its LabConnection structure, handling ID mapping.
-  const response = await axios.post<LabTopologyData>(`${API_LAB_BASE_URL}/topologies/${topologyId}/save`, payload, {
+  const headers: Record<string, string> = { Authorization: `Bearer ${token}` };
+  if (payload.nodes.length >= ASYNC_SAVE_NODES) {
+    headers.Prefer = 'respond-async';
+  }
+  const response = await axios.post<LabTopologyData | BackgroundJob>(`${API_LAB_BASE_URL}/topologies/${topologyId}/save`, payload, {
+    headers,
+  });
+  if (response.status === 202) {
+    // Very large labs are saved by a background job; reload once it has finished.
+    await waitForJob((response.data as BackgroundJob).id, token);
+    return getLabTopologyDetail(topologyId, token);
+  }
+  return response.data as LabTopologyData; // Backend should return the full, updated topology
+};
+
+// Seconds to wait before retrying a request rejected by admission control (429), or null for other errors.
+export const retryAfterSeconds = (error: unknown): number | null => {
+  if (!axios.isAxiosError(error) || error.response?.status !== 429) return null;
+  return Number(error.response.headers['retry-after']) || 1;
+};
+
+// --- Background jobs (202 Accepted responses) ---
+
+export interface BackgroundJob {
+    id: number;
+    kind: string;
+    status: 'queued' | 'running' | 'succeeded' | 'failed';
+    progress: number;
+    message: string | null;
+    result: Record<string, unknown> | null;
+    has_download: boolean;
+    error: string | null;
+}
+
+export const getJob = async (jobId: number, token: string): Promise<BackgroundJob> => {
+  const response = await axios.get<BackgroundJob>(`/api/jobs/${jobId}`, {
+    headers: { Authorization: `Bearer ${token}` },
+  });
+  return response.data;
+};
+
+// Polls until the job has finished; rejects with the job's error if it failed.
+export const waitForJob = async (
+  jobId: number,
+  token: string,
+  onProgress?: (job: BackgroundJob) => void,
+  intervalMs = 1000,
+): Promise<BackgroundJob> => {
+  for (;;) {
+    const job = await getJob(jobId, token);
+    onProgress?.(job);
+    if (job.status === 'succeeded') return job;
+    if (job.status === 'failed') throw new Error(job.error || 'Background job failed');
+    await new Promise((resolve) => setTimeout(resolve, intervalMs));
+  }
+};
+
+// Incremental save: only the nodes/edges that changed since `baseRevision`.
+// Added nodes/edges may use temporary client ids; the response maps them to backend ids.
+export interface TopologyDeltaPayload {
+    baseRevision: number;
+    nodes?: {
+        added?: { id: string; data: { deviceConfigId: number; label?: string }; position: { x: number; y: number } }[];
+        moved?: { id: string; position: { x: number; y: number } }[];
+        renamed?: { id: string; data: { label: string } }[];
+        removed?: string[];
+    };
+    edges?: {
+        added?: FrontendEdgeForSave[];
+        removed?: string[];
+    };
+}
+
+export interface TopologyDeltaResult {
+    revision: number;
+    nodeIds: Record<string, string>; // temporary client id -> backend node id
+    edgeIds: Record<string, string>;
+}
+
+export const saveLabTopologyDelta = async (topologyId: number, payload: TopologyDeltaPayload, token: string): Promise<TopologyDeltaResult> => {
+  // Responds with 409 and the current revision if the lab changed since baseRevision; reload and retry.
+  const response = await axios.post<TopologyDeltaResult>(`${API_LAB_BASE_URL}/topologies/${topologyId}/delta`, payload, {
+    headers: { Authorization: `Bearer ${token}` },
+  });
+  return response.data;
+};
+
+// Compact binary archive for moving labs between environments (much smaller than the detail JSON).
+export const exportLabTopology = async (topologyId: number, token: string): Promise<Blob> => {
+  const response = await axios.get<Blob>(`${API_LAB_BASE_URL}/topologies/${topologyId}/export`, {
     headers: { Authorization: `Bearer ${token}` },
+    responseType: 'blob',
+  });
+  return response.data;
+};
+
+export const importLabTopology = async (archive: Blob, token: string, name?: string): Promise<LabTopologySummary> => {
+  const response = await axios.post<LabTopologySummary>(`${API_LAB_BASE_URL}/topologies/import`, archive, {
+    headers: { Authorization: `Bearer ${token}`, 'Content-Type': 'application/vnd.network-lab.topology' },
+    params: name ? { name } : undefined,
   });
-  return response.data; // Backend should return the full, updated topology
+  return response.data;
 };
 
 export const deleteLabTopology = async (topologyId: number, token: string): Promise<void> => {
@@ -122,3 +226,158 @@ export const deleteLabTopology = async (topologyId: number, token: string): Prom
         headers: { Authorization: `Bearer ${token}` },
     });
 };
+
+export interface TopologyChanges {
+    since: number;
+    revision: number;
+    reload: boolean; // The change log no longer covers `since`: fetch the full detail instead
+    nodes?: { upserted: any[]; removed: string[] };
+    edges?: { upserted: any[]; removed: string[] }; // React Flow edge ids
+}
+
+// Cheap polling: only what changed after `since` (the revision the client last loaded).
+export const getLabTopologyChanges = async (topologyId: number, since: number, token: string): Promise<TopologyChanges> => {
+  const response = await axios.get<TopologyChanges>(`${API_LAB_BASE_URL}/topologies/${topologyId}/changes`, {
+    headers: { Authorization: `Bearer ${token}` },
+    params: { since },
+  });
+  return response.data;
+};
+
+export interface LabTopologyViewport {
+    id: number;
+    name: string;
+    revision: number;
+    bbox: [number, number, number, number];
+    bounds: [number, number, number, number] | null; // Extent of the whole lab, for pan limits
+    total_nodes: number;
+    truncated: boolean; // More nodes are in the box than one response carries; zoom in
+    nodes: any[]; // React Flow nodes, as in the full detail
+    edges: any[]; // Every edge touching one of `nodes`
+    stubs: { id: string; position: { x: number; y: number } }[]; // Off-screen ends of those edges
+}
+
+// Lazily loads a huge canvas tile by tile: only what lies inside [minX, minY, maxX, maxY].
+export const getLabTopologyViewport = async (
+  topologyId: number,
+  bbox: [number, number, number, number],
+  token: string,
+): Promise<LabTopologyViewport> => {
+  const response = await axios.get<LabTopologyViewport>(`${API_LAB_BASE_URL}/topologies/${topologyId}`, {
+    headers: { Authorization: `Bearer ${token}` },
+    params: { bbox: bbox.join(',') },
+  });
+  return response.data;
+};
+
+export interface LayoutResult {
+    algorithm: 'force' | 'layered' | 'grid';
+    revision: number;
+    positions: Record<string, { x: number; y: number }>; // React Flow node id -> position
+}
+
+// Lays the lab out on the server (use this instead of client-side layout for big labs).
+// Positions are saved as a new revision unless `apply` is false.
+export const layoutLabTopology = async (
+  topologyId: number,
+  token: string,
+  options: { algorithm?: LayoutResult['algorithm']; spacing?: number; iterations?: number; apply?: boolean } = {},
+): Promise<LayoutResult> => {
+  const response = await axios.post<LayoutResult>(`${API_LAB_BASE_URL}/topologies/${topologyId}/layout`, options, {
+    headers: { Authorization: `Bearer ${token}` },
+  });
+  return response.data;
+};
+
+// Server-side copies: the graph is duplicated inside the database. '{n}' in `name` becomes the copy number.
+export const cloneLabTopology = async (topologyId: number, token: string, options: { name?: string; count?: number } = {}): Promise<LabTopologySummary[]> => {
+  const response = await axios.post<LabTopologySummary[]>(`${API_LAB_BASE_URL}/topologies/${topologyId}/clone`, options, {
+    headers: { Authorization: `Bearer ${token}` },
+  });
+  return response.data;
+};
+
+export interface LabTemplate {
+    id: number;
+    topology_id: number;
+    name: string;
+    description?: string | null;
+    created_by_id: number;
+    created_at: string;
+}
+
+export const getLabTemplates = async (token: string): Promise<LabTemplate[]> => {
+  const response = await axios.get<LabTemplate[]>(`${API_LAB_BASE_URL}/templates`, {
+    headers: { Authorization: `Bearer ${token}` },
+  });
+  return response.data;
+};
+
+export const publishLabTemplate = async (topologyId: number, token: string, payload: { name?: string; description?: string } = {}): Promise<LabTemplate> => {
+  const response = await axios.post<LabTemplate>(`${API_LAB_BASE_URL}/topologies/${topologyId}/template`, payload, {
+    headers: { Authorization: `Bearer ${token}` },
+  });
+  return response.data;
+};
+
+// `userIds` creates one copy per user (publisher/admin only); otherwise `count` copies owned by the caller.
+export const instantiateLabTemplate = async (
+  templateId: number,
+  token: string,
+  options: { name?: string; count?: number; userIds?: number[] } = {},
+): Promise<LabTopologySummary[]> => {
+  const { userIds, ...rest } = options;
+  const response = await axios.post<LabTopologySummary[]>(`${API_LAB_BASE_URL}/templates/${templateId}/instantiate`,
+    userIds ? { ...rest, user_ids: userIds } : rest, {
+    headers: { Authorization: `Bearer ${token}` },
+  });
+  return response.data;
+};
+
+export interface SearchResult {
+    type: 'device_config' | 'topology';
+    id: number;
+    name: string;
+    score: number;
+    matched: string[]; // Fields the terms were found in, e.g. ['name', 'hostname_ip']
+    hostname_ip?: string; // device_config results
+    device_type_name?: string;
+    description?: string | null; // topology results
+    updated_at?: string;
+}
+
+export interface SearchPage {
+    results: SearchResult[];
+    total: number;
+    nextCursor: string | null;
+}
+
+// Ranked server-side search; `query` may be a name/hostname prefix or substring, an IP or a CIDR.
+export const searchAll = async (
+  query: string,
+  token: string,
+  options: { types?: ('device_configs' | 'topologies')[]; limit?: number; cursor?: string } = {},
+): Promise<SearchPage> => {
+  const response = await axios.get<SearchResult[]>('/api/search', {
+    headers: { Authorization: `Bearer ${token}` },
+    params: { q: query, types: options.types?.join(','), limit: options.limit, cursor: options.cursor },
+  });
+  return {
+    results: response.data,
+    total: Number(response.headers['x-total-count'] ?? response.data.length),
+    nextCursor: response.headers['x-next-cursor'] ?? null,
+  };
+};
+
+// Browser terminal relayed by the backend SSH broker. The first frame must carry the device
+// credentials; after the server answers {"type": "ready"}, frames are terminal output.
+export const openDeviceTerminal = (
+    instanceId: string,
+    token: string,
+    credentials: { username?: string; password?: string; cols?: number; rows?: number },
+): WebSocket => {
+    const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+    const socket = new WebSocket(`${protocol}//${window.location.host}/api/terminal/instances/${instanceId}?jwt=${encodeURIComponent(token)}`);
+    socket.addEventListener('open', () => socket.send(JSON.stringify({ type: 'auth', ...credentials })));
+    return socket;
+};